@@ -1,24 +1,23 @@
 import streamlit as st
 import pandas as pd
 import json
+import importlib.util
 import io
 import os
 from typing import Dict, Any, List
 import time
 
-# Import for Azure OpenAI
-try:
-    from langchain_openai import AzureChatOpenAI
-    AZURE_AVAILABLE = True
-except ImportError:
-    AZURE_AVAILABLE = False
+from transformation import serialization
+from transformation.output import OutputBuilder, csv_tempfile
+from transformation.progress import ProgressTracker
+from transformation.rules import target_schema
+from transformation.sampling import stratified_sample
+from transformation.streamlit_cache import compile_rules_cached, load_uploaded_csv
 
-# Import for regular OpenAI
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+# Model client libraries are only checked for here and imported when a
+# transformer is created, so reruns that never call the model don't load them
+AZURE_AVAILABLE = importlib.util.find_spec("langchain_openai") is not None
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
 
 # Configure page
 st.set_page_config(
@@ -39,6 +38,7 @@ class AITransformer:
             os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = kwargs.get("deployment_name", "")
             
             # Initialize Azure OpenAI model
+            from langchain_openai import AzureChatOpenAI
             self.model = AzureChatOpenAI(
                 openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
                 azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
@@ -46,6 +46,7 @@ class AITransformer:
             )
             
         elif config_type == "openai" and OPENAI_AVAILABLE:
+            from openai import OpenAI
             self.client = OpenAI(api_key=kwargs.get("api_key", ""))
         else:
             raise ValueError(f"Configuration type '{config_type}' not supported or libraries not installed")
@@ -65,10 +66,10 @@ class AITransformer:
             - X (Custom): Apply custom logic as described
 
             TRANSFORMATION RULES:
-            {json.dumps(rules, indent=2)}
+            {serialization.dumps(rules)}
 
             INPUT ROW:
-            {json.dumps(row_data, indent=2)}
+            {serialization.dumps(row_data)}
 
             INSTRUCTIONS:
             1. Apply each rule to create the target columns
@@ -107,7 +108,7 @@ class AITransformer:
                 elif "```" in result_text:
                     result_text = result_text.split("```")[1].split("```")[0]
                 
-                result = json.loads(result_text)
+                result = serialization.loads(result_text)
                 return result
             except json.JSONDecodeError:
                 st.error(f"Failed to parse AI response as JSON: {result_text}")
@@ -117,6 +118,11 @@ class AITransformer:
             st.error(f"AI transformation failed: {str(e)}")
             return {}
 
+@st.cache_resource(show_spinner="Connecting to the model...")
+def get_transformer(config_type: str, **kwargs) -> AITransformer:
+    """Model client shared across reruns and sessions, rebuilt only when the configuration changes."""
+    return AITransformer(config_type, **kwargs)
+
 def create_rule_configuration():
     """Create the rule configuration UI"""
     st.subheader("🔧 Configure Transformation Rules")
@@ -305,15 +311,18 @@ def main():
     uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
     
     if uploaded_file is not None:
-        # Read and display the CSV
-        df = pd.read_csv(uploaded_file)
+        # Parsed once per upload; reruns reuse the stored frame
+        df = load_uploaded_csv(uploaded_file)
         
         st.subheader("📊 Input Data Preview")
-        st.dataframe(df.head(10))
+        # Rows chosen to show every value of the low-cardinality columns, not just the first few
+        st.dataframe(stratified_sample(df, max_rows=10))
         st.info(f"Dataset contains {len(df)} rows and {len(df.columns)} columns")
         
         # Rule configuration
         rules = create_rule_configuration()
+        # Only rules whose definition changed since the last rerun are recompiled
+        plan = compile_rules_cached(rules)
         
         # Show configured rules
         if rules:
@@ -329,7 +338,7 @@ def main():
             # Initialize AI transformer
             try:
                 if ai_config["type"] == "azure":
-                    transformer = AITransformer(
+                    transformer = get_transformer(
                         config_type="azure",
                         api_key=ai_config["api_key"],
                         endpoint=ai_config["endpoint"],
@@ -337,7 +346,7 @@ def main():
                         deployment_name=ai_config["deployment_name"]
                     )
                 else:
-                    transformer = AITransformer(
+                    transformer = get_transformer(
                         config_type="openai",
                         api_key=ai_config["api_key"]
                     )
@@ -348,67 +357,42 @@ def main():
             # Progress tracking
             progress_bar = st.progress(0)
             status_text = st.empty()
+
+            # Redraw at most twice a second instead of on every row
+            progress = ProgressTracker(total=len(df), min_interval=0.5)
+            def render_progress(snapshot):
+                status_text.text(f"Transforming row {snapshot['rows_done']} of {snapshot['total']}")
+                progress_bar.progress(snapshot["progress"] or 0.0)
+            progress.add_listener(render_progress)
             
-            # Start with the original dataframe and add transformed columns
-            # output_df = df.copy()
-            output_df = pd.DataFrame(columns=list(rules.keys()))
             total_rows = len(df)
-            
 
-            # Store transformed rows
-            transformed_rows = []
+            # Target columns are fixed by the rules, so results go straight into
+            # preallocated columns and anything the model omits stays null
+            output = OutputBuilder(target_schema(plan), total_rows)
 
             # Transform each row
             for idx, (_, row) in enumerate(df.iterrows()):
-                status_text.text(f"Transforming row {idx + 1} of {total_rows}")
-                progress_bar.progress((idx + 1) / total_rows)
-
                 row_dict = row.to_dict()
                 row_dict = {k: (v if pd.notna(v) else None) for k, v in row_dict.items()}
 
+                progress.call_started()
                 transformed_row = transformer.transform_row(row_dict, rules)
-                transformed_rows.append(transformed_row)
+                progress.call_finished()
+                output.set_row(idx, transformed_row)
+                progress.row_done()
 
                 time.sleep(0.1)
 
-                # Create a new DataFrame with only transformed columns
-                output_df = pd.DataFrame(transformed_rows)
-
-
-            # # Transform each row
-            # for idx, (_, row) in enumerate(df.iterrows()):
-            #     status_text.text(f"Transforming row {idx + 1} of {total_rows}")
-            #     progress_bar.progress((idx + 1) / total_rows)
-                
-            #     # Convert row to dict and handle NaN values
-            #     row_dict = row.to_dict()
-            #     row_dict = {k: (v if pd.notna(v) else None) for k, v in row_dict.items()}
-                
-            #     # Transform the row
-            #     transformed_row = transformer.transform_row(row_dict, rules)
-                
-            #     # Add transformed columns to the output dataframe
-            #     # for col_name, col_value in transformed_row.items():
-            #     #     output_df.at[idx, col_name] = col_value
-
-            #     output_df.loc[idx] = [transformed_row.get(col,None) for col in output_df.columns]
-                
-            #     # Small delay to avoid rate limits
-            #     time.sleep(0.1)
-            
-            # Reorder columns to maintain original order first, then add new columns
-            original_columns = list(df.columns)
-            new_columns = [col for col in output_df.columns if col not in original_columns]
-            final_column_order = original_columns + new_columns
-            output_df = output_df[final_column_order]
+            progress.finish()
+            output_df = output.to_frame()
             
             st.subheader("✅ Transformation Complete!")
             st.dataframe(output_df)
             
-            # Download button
-            csv_buffer = io.StringIO()
-            output_df.to_csv(csv_buffer, index=False)
-            csv_data = csv_buffer.getvalue()
+            # Download button; the CSV is written block by block to a temp file
+            # rather than built up as one string in memory
+            csv_data = csv_tempfile(output_df)
             
             st.download_button(
                 label="📥 Download Transformed CSV",
@@ -418,7 +402,7 @@ def main():
             )
             
             # Show summary
-            st.info(f"Successfully transformed {len(output_df)} rows. Original columns: {len(original_columns)}, New columns: {len(new_columns)}, Total columns: {len(output_df.columns)}")
+            st.info(f"Successfully transformed {len(output_df)} rows with {len(output_df.columns)} target columns")
 
 if __name__ == "__main__":
     main()
@@ -1,24 +1,22 @@
 import streamlit as st
 import pandas as pd
 import json
+import importlib.util
 import io
 import os
 from typing import Dict, Any, List
 import time
 
-# Import for Azure OpenAI
-try:
-    from langchain_openai import AzureChatOpenAI
-    AZURE_AVAILABLE = True
-except ImportError:
-    AZURE_AVAILABLE = False
+from transformation import serialization
+from transformation.output import OutputBuilder, csv_tempfile
+from transformation.progress import ProgressTracker
+from transformation.rules import target_schema
+from transformation.streamlit_cache import compile_rules_cached, load_uploaded_csv
 
-# Import for regular OpenAI
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+# Model client libraries are only checked for here and imported when a
+# transformer is created, so reruns that never call the model don't load them
+AZURE_AVAILABLE = importlib.util.find_spec("langchain_openai") is not None
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
 
 # Configure page
 st.set_page_config(
@@ -39,6 +37,7 @@ class AITransformer:
             os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = kwargs.get("deployment_name", "")
             
             # Initialize Azure OpenAI model
+            from langchain_openai import AzureChatOpenAI
             self.model = AzureChatOpenAI(
                 openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
                 azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
@@ -46,6 +45,7 @@ class AITransformer:
             )
             
         elif config_type == "openai" and OPENAI_AVAILABLE:
+            from openai import OpenAI
             self.client = OpenAI(api_key=kwargs.get("api_key", ""))
         else:
             raise ValueError(f"Configuration type '{config_type}' not supported or libraries not installed")
@@ -65,10 +65,10 @@ class AITransformer:
             - X (Custom): Apply custom logic as described
 
             TRANSFORMATION RULES:
-            {json.dumps(rules, indent=2)}
+            {serialization.dumps(rules)}
 
             INPUT ROW:
-            {json.dumps(row_data, indent=2)}
+            {serialization.dumps(row_data)}
 
             INSTRUCTIONS:
             1. Apply each rule to create the target columns
@@ -107,7 +107,7 @@ class AITransformer:
                 elif "```" in result_text:
                     result_text = result_text.split("```")[1].split("```")[0]
                 
-                result = json.loads(result_text)
+                result = serialization.loads(result_text)
                 return result
             except json.JSONDecodeError:
                 st.error(f"Failed to parse AI response as JSON: {result_text}")
@@ -117,6 +117,11 @@ class AITransformer:
             st.error(f"AI transformation failed: {str(e)}")
             return {}
 
+@st.cache_resource(show_spinner="Connecting to the model...")
+def get_transformer(config_type: str, **kwargs) -> AITransformer:
+    """Model client shared across reruns and sessions, rebuilt only when the configuration changes."""
+    return AITransformer(config_type, **kwargs)
+
 def create_rule_configuration():
     """Create the rule configuration UI"""
     st.subheader("🔧 Configure Transformation Rules")
@@ -305,8 +310,8 @@ def main():
     uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
     
     if uploaded_file is not None:
-        # Read and display the CSV
-        df = pd.read_csv(uploaded_file)
+        # Parsed once per upload; reruns reuse the stored frame
+        df = load_uploaded_csv(uploaded_file)
         
         st.subheader("Source Columns Preview")
         # st.dataframe(df.head(10))
@@ -316,6 +321,8 @@ def main():
         
         # Rule configuration
         rules = create_rule_configuration()
+        # Only rules whose definition changed since the last rerun are recompiled
+        plan = compile_rules_cached(rules)
         
         # Show configured rules
         if rules:
@@ -331,7 +338,7 @@ def main():
             # Initialize AI transformer
             try:
                 if ai_config["type"] == "azure":
-                    transformer = AITransformer(
+                    transformer = get_transformer(
                         config_type="azure",
                         api_key=ai_config["api_key"],
                         endpoint=ai_config["endpoint"],
@@ -339,7 +346,7 @@ def main():
                         deployment_name=ai_config["deployment_name"]
                     )
                 else:
-                    transformer = AITransformer(
+                    transformer = get_transformer(
                         config_type="openai",
                         api_key=ai_config["api_key"]
                     )
@@ -350,37 +357,46 @@ def main():
             # Progress tracking
             progress_bar = st.progress(0)
             status_text = st.empty()
+
+            # Redraw at most twice a second instead of on every row
+            progress = ProgressTracker(total=len(df), min_interval=0.5)
+            def render_progress(snapshot):
+                status_text.text(f"Transforming row {snapshot['rows_done']} of {snapshot['total']}")
+                progress_bar.progress(snapshot["progress"] or 0.0)
+            progress.add_listener(render_progress)
             
-            transformed_rows = []
             total_rows = len(df)
+            output = OutputBuilder(target_schema(plan), total_rows)
             
             # Transform each row
             for idx, (_, row) in enumerate(df.iterrows()):
-                status_text.text(f"Transforming row {idx + 1} of {total_rows}")
-                progress_bar.progress((idx + 1) / total_rows)
                 
                 # Convert row to dict and handle NaN values
                 row_dict = row.to_dict()
                 row_dict = {k: (v if pd.notna(v) else None) for k, v in row_dict.items()}
                 
                 # Transform the row
+                progress.call_started()
                 transformed_row = transformer.transform_row(row_dict, rules)
-                transformed_rows.append(transformed_row)
+                progress.call_finished()
+                output.set_row(idx, transformed_row)
+                progress.row_done()
                 
                 # Small delay to avoid rate limits
                 time.sleep(0.1)
             
+            progress.finish()
+
             # Create output dataframe
-            if transformed_rows and any(transformed_rows):
-                output_df = pd.DataFrame(transformed_rows)
+            if output.filled_count:
+                output_df = output.to_frame()
                 
                 st.subheader("✅ Transformation Complete!")
                 st.dataframe(output_df)
                 
-                # Download button
-                csv_buffer = io.StringIO()
-                output_df.to_csv(csv_buffer, index=False)
-                csv_data = csv_buffer.getvalue()
+                # Download button; the CSV is written block by block to a temp file
+                # rather than built up as one string in memory
+                csv_data = csv_tempfile(output_df)
                 
                 st.download_button(
                     label="📥 Download Transformed CSV",
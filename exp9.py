@@ -1,24 +1,30 @@
 import streamlit as st
 import pandas as pd
 import json
+import importlib.util
 import io
 import os
 from typing import Dict, Any, List
 import time
 
-# Import for Azure OpenAI
-try:
-    from langchain_openai import AzureChatOpenAI
-    AZURE_AVAILABLE = True
-except ImportError:
-    AZURE_AVAILABLE = False
-
-# Import for regular OpenAI
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+from transformation import serialization
+from transformation.estimate import DEFAULT_SECONDS_PER_CALL, estimate_run, observed_seconds_per_call
+from transformation.column_cache import select_rules
+from transformation.executor import referenced_columns
+from transformation.native import apply_rules, is_native
+from transformation.output import OutputBuilder, csv_tempfile
+from transformation.preview import batch_prompt, parse_batch_response, preview_rules
+from transformation.programs import is_candidate, synthesize_program
+from transformation.progress import ProgressTracker
+from transformation.rules import compile_rules, target_schema
+from transformation.strings import OPERATIONS, catalog
+from transformation.streamlit_cache import (column_cache, compile_rules_cached, load_uploaded_csv, preview_cache,
+                                            program_cache, uploaded_dataset_key)
+
+# Model client libraries are only checked for here and imported when a
+# transformer is created, so reruns that never call the model don't load them
+AZURE_AVAILABLE = importlib.util.find_spec("langchain_openai") is not None
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
 
 # ===== CONFIGURATION SECTION =====
 # Set your API configuration here
@@ -52,6 +58,7 @@ class AITransformer:
             os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = kwargs.get("deployment_name", "")
 
             # Initialize Azure OpenAI model
+            from langchain_openai import AzureChatOpenAI
             self.model = AzureChatOpenAI(
                 openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
                 azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
@@ -59,10 +66,32 @@ class AITransformer:
             )
 
         elif config_type == "openai" and OPENAI_AVAILABLE:
+            from openai import OpenAI
             self.client = OpenAI(api_key=kwargs.get("api_key", ""))
         else:
             raise ValueError(f"Configuration type '{config_type}' not supported or libraries not installed")
 
+    def complete(self, prompt: str, max_tokens: int = 1000) -> str:
+        """Send a prompt to the configured model and return the reply text"""
+        if self.config_type == "azure":
+            # Use Azure OpenAI via LangChain
+            response = self.model.invoke(prompt)
+            return response.content.strip()
+
+        # Use regular OpenAI
+        response = self.client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=max_tokens
+        )
+        return response.choices[0].message.content.strip()
+
+    def transform_rows(self, rows: List[dict], rules: dict) -> List[dict]:
+        """Transform several rows in one model call (used by the live preview)"""
+        result_text = self.complete(batch_prompt(rows, rules), max_tokens=4000)
+        return parse_batch_response(result_text, len(rows))
+
     def transform_row(self, row_data: dict, rules: dict) -> dict:
         """Transform a single row using AI based on the rules"""
 
@@ -78,10 +107,10 @@ class AITransformer:
             - X (Custom): Apply custom logic as described
 
             TRANSFORMATION RULES:
-            {json.dumps(rules, indent=2)}
+            {serialization.dumps(rules)}
 
             INPUT ROW:
-            {json.dumps(row_data, indent=2)}
+            {serialization.dumps(row_data)}
 
             INSTRUCTIONS:
             1. Apply each rule to create the target columns
@@ -97,20 +126,7 @@ class AITransformer:
             """
 
         try:
-            if self.config_type == "azure":
-                # Use Azure OpenAI via LangChain
-                response = self.model.invoke(prompt)
-                result_text = response.content.strip()
-
-            elif self.config_type == "openai":
-                # Use regular OpenAI
-                response = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0,
-                    max_tokens=1000
-                )
-                result_text = response.choices[0].message.content.strip()
+            result_text = self.complete(prompt)
 
             # Try to extract JSON from the response
             try:
@@ -120,7 +136,7 @@ class AITransformer:
                 elif "```" in result_text:
                     result_text = result_text.split("```")[1].split("```")[0]
 
-                result = json.loads(result_text)
+                result = serialization.loads(result_text)
                 return result
             except json.JSONDecodeError:
                 st.error(f"Failed to parse AI response as JSON: {result_text}")
@@ -168,6 +184,48 @@ AI_CONFIG = {
         st.error(f"Unsupported AI configuration type: {config_type}")
         st.stop()
 
+@st.cache_resource(show_spinner="Connecting to the model...")
+def get_transformer(config_type: str, **kwargs) -> AITransformer:
+    """Model client shared across reruns and sessions, rebuilt only when the configuration changes."""
+    return AITransformer(config_type, **kwargs)
+
+def transformer_config() -> dict:
+    """Keyword arguments for AITransformer from AI_CONFIG"""
+    if AI_CONFIG["type"] == "azure":
+        return {
+            "config_type": "azure",
+            "api_key": AI_CONFIG["api_key"],
+            "endpoint": AI_CONFIG["endpoint"],
+            "api_version": AI_CONFIG["api_version"],
+            "deployment_name": AI_CONFIG["deployment_name"]
+        }
+    return {"config_type": "openai", "api_key": AI_CONFIG["api_key"]}
+
+def render_rule_preview(df: pd.DataFrame, rules: dict, plan: list):
+    """Show the rules applied to a small sample of the upload, refreshed on every edit"""
+    st.subheader("🔍 Live Preview")
+    include_ai = st.checkbox(
+        "Include AI rules (one batched model call; repeated previews come from the cache)",
+        key="preview_ai"
+    )
+
+    model_batch = None
+    if include_ai:
+        try:
+            model_batch = get_transformer(**transformer_config()).transform_rows
+        except Exception as e:
+            st.warning(f"AI rules can't be previewed: {str(e)}")
+
+    # Native rules are computed on the spot; AI rules are only called for values not seen before
+    with st.spinner("Updating preview..."):
+        sample, output = preview_rules(df, rules, model_batch=model_batch, cache=preview_cache())
+
+    source_columns = referenced_columns(sample, plan)
+    st.dataframe(pd.concat([sample[source_columns], output.add_prefix("→ ")], axis=1))
+    pending = [col for col in output.columns if output[col].isna().all()]
+    if pending:
+        st.caption(f"Not previewed yet: {', '.join(pending)}")
+
 def create_rule_configuration():
     """Create the rule configuration UI"""
     st.subheader("🔧 Configure Transformation Rules")
@@ -191,7 +249,8 @@ def create_rule_configuration():
             with col1:
                 rule_type = st.selectbox(
                     "Rule Type",
-                    ["T (Translate)", "D (Default)", "C (Concatenate)", "R (Rename)", "X (Custom)"],
+                    ["T (Translate)", "D (Default)", "C (Concatenate)", "R (Rename)", "S (String operation)",
+                     "W (Conditional)", "X (Custom)"],
                     key=f"rule_type_{i}"
                 )
 
@@ -269,6 +328,53 @@ def create_rule_configuration():
                             "target_column": target_column
                         }
 
+                elif rule_code == "S":
+                    columns_text = st.text_input(
+                        "Source Column(s) (comma-separated for concat)",
+                        key=f"source_{i}"
+                    )
+                    operation_name = st.selectbox(
+                        "Operation",
+                        list(OPERATIONS),
+                        format_func=lambda name: next(op["signature"] for op in catalog() if op["name"] == name),
+                        help="\n".join(f"{op['signature']}: {op['description']}" for op in catalog()),
+                        key=f"operation_{i}"
+                    )
+                    arguments = st.text_input(
+                        "Arguments",
+                        placeholder='e.g. 10, "0"',
+                        key=f"arguments_{i}"
+                    )
+
+                    if target_column and columns_text:
+                        rules[target_column] = {
+                            "type": "S",
+                            "rule_payload": {
+                                "columns": [col.strip() for col in columns_text.split(',')],
+                                "operation": f"{operation_name}({arguments})"
+                            },
+                            "target_column": target_column
+                        }
+
+                elif rule_code == "W":
+                    condition = st.text_input(
+                        "Condition",
+                        placeholder='e.g. when PersonInd == "Y" then O(FirstName) else D("Corporate")',
+                        help="Branches: O(Column), D(\"value\"), S(Column, \"operation\"), "
+                             "F(Column, \"source format\", \"target format\"), J(Column, Column, \"separator\"), "
+                             "X(\"instruction\") or another when ... then ... else ...",
+                        key=f"condition_{i}"
+                    )
+
+                    if target_column and condition:
+                        rules[target_column] = {
+                            "type": "W",
+                            "rule_payload": {
+                                "condition": condition
+                            },
+                            "target_column": target_column
+                        }
+
                 elif rule_code == "X":
                     custom_instruction = st.text_area(
                         "Custom Transformation Instruction",
@@ -313,8 +419,8 @@ def main():
     uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
 
     if uploaded_file is not None:
-        # Read and display the CSV
-        df = pd.read_csv(uploaded_file)
+        # Parsed once per upload; reruns reuse the stored frame
+        df = load_uploaded_csv(uploaded_file)
 
         st.subheader("Source Columns Preview")
         st.dataframe(pd.DataFrame([df.columns], index=["Columns"]))
@@ -322,11 +428,28 @@ def main():
 
         # Rule configuration
         rules = create_rule_configuration()
+        # Only rules whose definition changed since the last rerun are recompiled
+        plan = compile_rules_cached(rules)
 
         # Show configured rules
         if rules:
             st.subheader("📋 Configured Rules")
             st.json(rules)
+            render_rule_preview(df, rules, plan)
+
+        # Dry run: sizes the job from the rules and the data, without calling the model
+        if rules and st.button("🧮 Estimate Cost & Time"):
+            # The loop below makes one call per row and waits 0.1s after each; the
+            # time observed in an earlier run already includes that pause
+            seconds_per_call = st.session_state.get("seconds_per_call", DEFAULT_SECONDS_PER_CALL + 0.1)
+            estimate = estimate_run(df, rules, seconds_per_call=seconds_per_call, per_row=True)
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Model calls", f"{estimate['model_calls']:,}")
+            col2.metric("Tokens (in / out)", f"{estimate['input_tokens']:,} / {estimate['output_tokens']:,}")
+            col3.metric("Estimated cost", f"${estimate['estimated_cost']:,.2f}")
+            col4.metric("Estimated time", f"{estimate['estimated_seconds'] / 60:,.1f} min")
+            source = "observed" if "seconds_per_call" in st.session_state else "assumed"
+            st.caption(f"Based on {seconds_per_call:.1f}s per call ({source})")
 
         # Transform button
         if st.button("🚀 Transform Data", type="primary"):
@@ -336,19 +459,7 @@ def main():
 
             # Initialize AI transformer
             try:
-                if AI_CONFIG["type"] == "azure":
-                    transformer = AITransformer(
-                        config_type="azure",
-                        api_key=AI_CONFIG["api_key"],
-                        endpoint=AI_CONFIG["endpoint"],
-                        api_version=AI_CONFIG["api_version"],
-                        deployment_name=AI_CONFIG["deployment_name"]
-                    )
-                else:
-                    transformer = AITransformer(
-                        config_type="openai",
-                        api_key=AI_CONFIG["api_key"]
-                    )
+                transformer = get_transformer(**transformer_config())
             except Exception as e:
                 st.error(f"Failed to initialize AI transformer: {str(e)}")
                 return
@@ -357,36 +468,89 @@ def main():
             progress_bar = st.progress(0)
             status_text = st.empty()
 
-            transformed_rows = []
+            # Redraw at most twice a second instead of on every row
+            progress = ProgressTracker(total=len(df), min_interval=0.5)
+            def render_progress(snapshot):
+                status_text.text(f"Transforming row {snapshot['rows_done']} of {snapshot['total']}")
+                progress_bar.progress(snapshot["progress"] or 0.0)
+            progress.add_listener(render_progress)
+
             total_rows = len(df)
+            output = OutputBuilder(target_schema(plan), total_rows)
+
+            # Columns whose rules are unchanged since an earlier run on this upload
+            # come from the cache; only the other rules are sent to the model
+            dataset_key = uploaded_dataset_key(uploaded_file)
+            cached, pending = column_cache().lookup(dataset_key, rules)
+            for target, values in cached.items():
+                output.set_column(target, values)
+            progress.record_cache(hit=True, count=len(cached))
+            progress.record_cache(hit=False, count=len(pending))
+            pending_rules = select_rules(rules, pending)
+            if cached:
+                st.info(f"Reusing {len(cached)} unchanged column(s); recomputing {len(pending)}")
+
+            # Native rules (e.g. S string operations) and custom rules the model can
+            # express as a program, asked for once, run over the whole column
+            # instead of row by row
+            native_plan = []
+            for rule in compile_rules(pending_rules):
+                if is_native(rule):
+                    native_plan.append(rule)
+                elif is_candidate(rule):
+                    program = synthesize_program(df, rule, transformer.complete, transformer.transform_rows,
+                                                 program_cache())
+                    if program is not None:
+                        native_plan.append(program)
+            if native_plan:
+                native_df = apply_rules(df, native_plan)
+                for target in native_df.columns:
+                    output.set_column(target, native_df[target])
+                pending_rules = select_rules(pending_rules, set(pending) - set(native_df.columns))
+                st.info(f"Applied {len(native_plan)} rule(s) without the model")
 
             # Transform each row
-            for idx, (_, row) in enumerate(df.iterrows()):
-                status_text.text(f"Transforming row {idx + 1} of {total_rows}")
-                progress_bar.progress((idx + 1) / total_rows)
-
+            failed_rows = 0
+            for idx, (_, row) in enumerate(df.iterrows() if pending_rules else []):
                 # Convert row to dict and handle NaN values
                 row_dict = row.to_dict()
                 row_dict = {k: (v if pd.notna(v) else None) for k, v in row_dict.items()}
 
                 # Transform the row
-                transformed_row = transformer.transform_row(row_dict, rules)
-                transformed_rows.append(transformed_row)
+                progress.call_started()
+                transformed_row = transformer.transform_row(row_dict, pending_rules)
+                progress.call_finished()
+                if not transformed_row:
+                    failed_rows += 1
+                    output.mark_failed(idx)
+                output.set_row(idx, transformed_row)
+                progress.row_done()
 
                 # Small delay to avoid rate limits
                 time.sleep(0.1)
 
-            # Create output dataframe
-            if transformed_rows and any(transformed_rows):
-                output_df = pd.DataFrame(transformed_rows)
+            if not pending_rules:
+                progress.row_done(total_rows)
+            if pending and not failed_rows:
+                # Only complete columns are cached, so failed rows are retried next time
+                output_columns = output.to_frame()
+                column_cache().put(dataset_key, rules, {target: output_columns[target] for target in pending})
+            progress.finish()
+            # Later estimates use the latency actually seen in this run
+            if observed_seconds_per_call(progress):
+                st.session_state.seconds_per_call = observed_seconds_per_call(progress)
+
+            # Create output dataframe; cached and native columns alone don't count
+            # as a result when every row sent to the model failed
+            if output.succeeded.any():
+                output_df = output.to_frame()
 
                 st.subheader("✅ Transformation Complete!")
                 st.dataframe(output_df)
 
-                # Download button
-                csv_buffer = io.StringIO()
-                output_df.to_csv(csv_buffer, index=False)
-                csv_data = csv_buffer.getvalue()
+                # Download button; the CSV is written block by block to a temp file
+                # rather than built up as one string in memory
+                csv_data = csv_tempfile(output_df)
 
                 st.download_button(
                     label="📥 Download Transformed CSV",
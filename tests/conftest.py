@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+from transformation.engine import DataTransformationEngine
+from transformation.programs import ProgramCache
+
+
+class FakeEngine(DataTransformationEngine):
+    """Engine whose model answers from ``answer`` and never synthesizes programs."""
+
+    def __init__(self, answer):
+        super().__init__(max_workers=1, program_cache=ProgramCache())
+        self.answer = answer
+        self.calls = []
+
+    def transform_row_with_ai(self, input_row, mapping_instructions, progress=None):
+        return self.transform_rows_with_ai([input_row], mapping_instructions, progress)[0]
+
+    def transform_rows_with_ai(self, input_rows, mapping_instructions, progress=None):
+        self.calls.extend(input_rows)
+        return [self.answer(row, mapping_instructions) for row in input_rows]
+
+    def _compile_programs(self, input_df, ai_instructions, progress):
+        return [], ai_instructions
+
+
+@pytest.fixture
+def fake_engine():
+    """``FakeEngine`` class; call it with ``answer(row, instructions) -> dict``."""
+    return FakeEngine
+
+
+@pytest.fixture
+def native_workbook(tmp_path):
+    """Rules workbook with O, D and T rules only, so runs need no model."""
+    path = str(tmp_path / "rules.xlsx")
+    mapping = {
+        "Parameter#1": ["Source: Name", "Retail", "Source: Country"],
+        "Transformation Type": ["O", "D", "T"],
+        "STG_Column_Name": ["CLIENT_NAME", "SEGMENT", "COUNTRY"],
+        "Parameter#2": [None, None, None],
+    }
+    transform = {"MapName": ["country", "country"], "Map Criteria#1": ["fr", "de"],
+                 "Transformed Value": ["France", "Germany"]}
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame(mapping).to_excel(writer, sheet_name="Mapping", index=False)
+        pd.DataFrame(transform).to_excel(writer, sheet_name="Transform", index=False)
+    return path
@@ -0,0 +1,28 @@
+import json
+import os
+
+import pandas as pd
+
+from transformation import cli
+
+
+def test_native_runs_transform_every_input_and_write_a_manifest(tmp_path, native_workbook):
+    (tmp_path / "in").mkdir()
+    for day in ("01", "02"):
+        (tmp_path / "in" / f"NF_CLIENT_{day}.csv").write_text("Name|Country\nAda|fr\nBob|de\n")
+    manifest_path = str(tmp_path / "manifest.json")
+
+    code = cli.main([str(tmp_path / "in" / "*.csv"), str(tmp_path / "missing.csv"), "-w", native_workbook,
+                     "-o", str(tmp_path / "out"), "-f", "jsonl", "--engine", "native", "--workers", "1",
+                     "--manifest", manifest_path])
+
+    manifest = json.load(open(manifest_path))
+    assert code == 1
+    assert (manifest["totals"]["files"], manifest["totals"]["failed_files"], manifest["totals"]["rows"]) == (3, 1, 4)
+    output = manifest["files"][0]["output"]
+    assert os.path.basename(output) == "NF_CLIENT_01__rules.jsonl"
+    assert pd.read_json(output, lines=True).to_dict("records") == [
+        {"CLIENT_NAME": "Ada", "SEGMENT": "Retail", "COUNTRY": "France"},
+        {"CLIENT_NAME": "Bob", "SEGMENT": "Retail", "COUNTRY": "Germany"},
+    ]
+    assert manifest["files"][-1]["status"] == "failed"
@@ -0,0 +1,28 @@
+from transformation.column_cache import ColumnCache, select_rules
+
+RULES = {
+    "NAME": {"type": "O", "rule_payload": {"source_column": "name"}},
+    "CODE": {"type": "D", "rule_payload": {"default_value": "X"}},
+}
+
+
+def test_only_edited_rules_need_recomputing():
+    cache = ColumnCache()
+    cached, pending = cache.lookup("data", RULES)
+    assert cached == {} and pending == ["NAME", "CODE"]
+    cache.put("data", RULES, {"NAME": ["a", "b"], "CODE": ["X", "X"]})
+
+    edited = {**RULES, "CODE": {"type": "D", "rule_payload": {"default_value": "Y"}}}
+    cached, pending = cache.lookup("data", edited)
+    assert list(cached) == ["NAME"] and pending == ["CODE"]
+    assert select_rules(edited, pending) == {"CODE": edited["CODE"]}
+    assert cache.lookup("other data", RULES)[1] == ["NAME", "CODE"]
+
+
+def test_least_recently_used_columns_are_dropped_first():
+    cache = ColumnCache(max_bytes=100)
+    cache.put("data", RULES, {"NAME": ["a"] * 10})
+    cache.lookup("data", RULES)
+    cache.put("data", RULES, {"CODE": ["X"] * 10})
+    cached, pending = cache.lookup("data", RULES)
+    assert list(cached) == ["CODE"] and pending == ["NAME"]
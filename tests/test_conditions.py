@@ -0,0 +1,31 @@
+import pandas as pd
+import pytest
+
+from transformation import compile_rules
+from transformation.conditions import parse_conditional
+from transformation.native import apply_rules, is_native
+
+
+def test_conditionals_are_parsed_into_branches():
+    parsed = parse_conditional('when PersonInd = "Y" then O(FirstName) else D("Corporate")')
+    assert parsed["when"] == {"column": "PersonInd", "op": "==", "value": "Y"}
+    assert parsed["then"]["type"] == "O" and parsed["else"]["type"] == "D"
+    assert parse_conditional("when Name is empty then D()")["else"] is None
+    with pytest.raises(ValueError):
+        parse_conditional("PersonInd == Y")
+
+
+def test_w_rules_pick_a_branch_per_row():
+    plan = compile_rules([{
+        "type": "W", "target_column": "NAME",
+        "condition": 'when kind in ("Corporate", "Trust") then S(name, "upper") '
+                     'else when kind is empty then D("UNKNOWN") else O(name)'}])
+    assert is_native(plan[0])
+    df = pd.DataFrame({"kind": ["Corporate", "Person", None, "Trust"], "name": ["acme", "ada", "bob", "fund"]})
+    assert apply_rules(df, plan)["NAME"].tolist() == ["ACME", "ada", "UNKNOWN", "FUND"]
+
+
+def test_w_rules_with_a_model_branch_go_to_the_model():
+    plan = compile_rules([{"type": "W", "target_column": "NAME",
+                           "condition": 'when kind == "Person" then O(name) else X("Guess the legal form")'}])
+    assert not is_native(plan[0])
@@ -0,0 +1,64 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from transformation import engine as engine_module
+from transformation.dag import rule_dependencies, run_dataflow, topological_waves
+from transformation.rules import compile_rules
+
+
+RULES = [
+    {"type": "X", "source_column": "code", "target_column": "XID", "instruction": "Describe the code"},
+    {"type": "J", "columns": ["XID", "name"], "target_column": "LABEL", "separator": "-"},
+    {"type": "O", "source_column": "name", "target_column": "CLIENT_NAME"},
+    {"type": "J", "columns": ["LABEL", "CLIENT_NAME"], "target_column": "FULL", "separator": "/"},
+]
+
+
+def test_rules_reading_other_rules_outputs_run_in_later_waves():
+    plan = compile_rules(RULES)
+    dependencies = rule_dependencies(plan, ["code", "name"])
+    assert dependencies == [set(), {0}, set(), {1, 2}]
+    assert topological_waves(dependencies, plan) == [[0, 2], [1], [3]]
+
+
+def test_cycles_are_reported_by_target():
+    plan = compile_rules([
+        {"type": "O", "source_column": "B", "target_column": "A"},
+        {"type": "O", "source_column": "A", "target_column": "B"},
+    ])
+    with pytest.raises(ValueError, match=r"\['A', 'B'\]"):
+        topological_waves(rule_dependencies(plan, []), plan)
+
+
+def test_tasks_start_once_their_dependencies_are_done():
+    order, lock = [], threading.Lock()
+
+    def task(name):
+        def run():
+            with lock:
+                order.append(name)
+        return run
+
+    run_dataflow({name: task(name) for name in "abcd"}, {"a": set(), "b": {"a"}, "c": {"a"}, "d": {"b", "c"}})
+    assert order[0] == "a" and order[-1] == "d"
+
+
+def test_graph_runs_native_groups_in_process(fake_engine, monkeypatch, tmp_path):
+    class NoPool:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("a process pool was started from a dataflow thread")
+
+    monkeypatch.setattr(engine_module, "PartitionedExecutor", NoPool)
+    engine = fake_engine(lambda row, instructions: {"XID": row["code"].upper()})
+    input_df = pd.DataFrame({"code": ["p", "q"], "name": ["a", "b"]})
+    output = pd.read_csv(engine.transform_frame(input_df, RULES, str(tmp_path)))
+    assert output["FULL"].tolist() == ["P-a/a", "Q-b/b"]
+
+
+def test_a_row_fails_when_any_model_group_fails_for_it(fake_engine, tmp_path):
+    engine = fake_engine(lambda row, instructions: {} if row["code"] == "q" else {"XID": row["code"].upper()})
+    input_df = pd.DataFrame({"code": ["p", "q"], "name": ["a", "b"]})
+    output = pd.read_csv(engine.transform_frame(input_df, RULES, str(tmp_path)))
+    assert output["FULL"].tolist() == ["P-a/a"]
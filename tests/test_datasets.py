@@ -0,0 +1,44 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from transformation.datasets import DatasetStore
+
+DATA = b"code,name\n1,a\n2,b\n"
+
+
+def test_uploads_are_parsed_once_and_reloaded_from_disk(tmp_path):
+    store = DatasetStore(root=str(tmp_path))
+    key = store.put_bytes(DATA, session_id="s1")
+    assert store.put_bytes(DATA, session_id="s2") == key
+    assert store.for_session("s2")["name"].tolist() == ["a", "b"]
+
+    reloaded = DatasetStore(root=str(tmp_path))
+    assert reloaded.get(key)["code"].tolist() == [1, 2]
+    assert store.put_bytes(DATA, delimiter=";") != key
+
+
+def test_concurrent_uploads_of_one_file_parse_it_once(tmp_path, monkeypatch):
+    parses = []
+    read_csv = pd.read_csv
+
+    def slow_read_csv(*args, **kwargs):
+        parses.append(threading.get_ident())
+        time.sleep(0.05)
+        return read_csv(*args, **kwargs)
+
+    monkeypatch.setattr(pd, "read_csv", slow_read_csv)
+    store = DatasetStore(root=str(tmp_path))
+    start = threading.Barrier(8)
+
+    def upload(_):
+        start.wait()
+        return store.put_bytes(DATA)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        keys = set(pool.map(upload, range(8)))
+    assert len(keys) == 1 and len(parses) == 1
+    assert [name.split(".")[0] for name in os.listdir(tmp_path)] == [keys.pop()]
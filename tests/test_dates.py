@@ -0,0 +1,31 @@
+import pandas as pd
+
+from transformation import compile_rules
+from transformation.dates import detect_format, fallback_instruction, reformat_dates, unparsed_dates
+from transformation.native import apply_rules
+
+
+def test_dates_are_rearranged_and_unparsed_values_left_for_the_model():
+    values = pd.Series(["01-Jan-2024", "15-mar-2023", None, "31-Feb-2024", "soon"])
+    result = reformat_dates(values, "YYYY/DD/MMM", "DD-MMM-YYYY")
+    # The month keeps its case; 31 February is not a date
+    assert result.tolist() == ["2024/01/Jan", "2023/15/mar", "", None, None]
+    assert unparsed_dates(values, result).tolist() == [False, False, False, True, True]
+
+
+def test_the_source_format_is_detected_from_the_column():
+    values = pd.Series(["31/01/1990", "01/12/1985", "", "15/06/2001"])
+    assert detect_format(values, "born") == "DD/MM/YYYY"
+    assert reformat_dates(values, "YYYY-MM-DD", column="born").tolist() == [
+        "1990-01-31", "1985-12-01", "", "2001-06-15"]
+
+
+def test_f_rules_run_natively_and_fall_back_to_an_x_rule():
+    plan = compile_rules([{"type": "F", "source_column": "born", "target_column": "BORN",
+                           "source_format": "DD/MM/YYYY", "target_format": "YYYYMMDD"}])
+    output = apply_rules(pd.DataFrame({"born": ["31/01/1990", "yesterday"]}), plan)
+    assert output["BORN"].tolist() == ["19900131", None]
+
+    fallback = fallback_instruction(plan[0])
+    assert (fallback["type"], fallback["source_column"], fallback["target_column"]) == ("X", "born", "BORN")
+    assert "DD/MM/YYYY to YYYYMMDD" in fallback["instruction"]
@@ -0,0 +1,71 @@
+import json
+
+import pandas as pd
+
+from transformation import ids
+from transformation.delta import DeltaIndex
+
+
+RULES = [
+    {"type": "O", "source_column": "name", "target_column": "NAME"},
+    {"type": "X", "source_column": "code", "target_column": "XID", "instruction": "Describe the code"},
+]
+
+
+def _input():
+    return pd.DataFrame({"clientid": [1, 2, 3, 4], "name": ["a", "b", "c", "d"],
+                         "code": ["p", "q", "r", "s"]})
+
+
+def test_rows_failed_by_the_model_are_retried_on_the_next_run(tmp_path, fake_engine):
+    delta = DeltaIndex(str(tmp_path / "delta"), "NF_CLIENT")
+
+    def failing(row, instructions):
+        return {} if row["code"] in ("q", "r") else {"XID": row["code"].upper()}
+
+    first = fake_engine(failing)
+    path = first.transform_frame(_input(), RULES, str(tmp_path / "out1"), delta=delta)
+    assert pd.read_csv(path)["XID"].tolist() == ["P", "S"]
+
+    second = fake_engine(lambda row, instructions: {"XID": row["code"].upper()})
+    path = second.transform_frame(_input(), RULES, str(tmp_path / "out2"), delta=delta)
+    output = pd.read_csv(path)
+
+    # Only the rows that failed before go to the model again
+    assert sorted(row["code"] for row in second.calls) == ["q", "r"]
+    assert sorted(output["XID"]) == ["P", "Q", "R", "S"]
+    assert output["XID"].notna().all()
+
+
+def test_the_index_is_stored_as_plain_json(tmp_path, fake_engine):
+    delta = DeltaIndex(str(tmp_path / "delta"), "NF_CLIENT")
+    engine = fake_engine(lambda row, instructions: {"XID": row["code"].upper()})
+    engine.transform_frame(_input(), RULES, str(tmp_path / "out1"), delta=delta)
+
+    with open(delta.path) as f:
+        stored = json.load(f)
+    assert stored["rows"]["XID"] == ["P", "Q", "R", "S"]
+
+    # Unchanged rows come from the stored index on the next run
+    again = fake_engine(lambda row, instructions: {"XID": "unused"})
+    path = again.transform_frame(_input(), RULES, str(tmp_path / "out2"), delta=delta)
+    assert again.calls == []
+    assert pd.read_csv(path)["XID"].tolist() == ["P", "Q", "R", "S"]
+
+
+def test_changed_rows_keep_the_ids_issued_for_their_key(tmp_path, monkeypatch, fake_engine):
+    monkeypatch.setattr(ids, "allocator", ids.IdAllocator())
+    rules = RULES[:1] + [{"type": "A", "source_column": "clientid", "target_column": "REL_ID",
+                          "id_pattern": "C{seq:9}"}]
+    delta = DeltaIndex(str(tmp_path / "delta"), "NF_CLIENT")
+    engine = fake_engine(lambda row, instructions: {})
+    first = pd.read_csv(engine.transform_frame(_input(), rules, str(tmp_path / "out1"), delta=delta))
+    assert first["REL_ID"].tolist() == ["C000000001", "C000000002", "C000000003", "C000000004"]
+
+    # Only the name of client 2 changes, and client 5 is new
+    changed = pd.concat([_input(), pd.DataFrame({"clientid": [5], "name": ["e"], "code": ["t"]})],
+                        ignore_index=True)
+    changed.loc[1, "name"] = "renamed"
+    second = pd.read_csv(engine.transform_frame(changed, rules, str(tmp_path / "out2"), delta=delta))
+    assert second["NAME"].tolist() == ["a", "renamed", "c", "d", "e"]
+    assert second["REL_ID"].tolist() == ["C000000001", "C000000002", "C000000003", "C000000004", "C000000005"]
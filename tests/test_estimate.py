@@ -0,0 +1,79 @@
+import math
+import re
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from transformation.engine import DataTransformationEngine
+from transformation.estimate import estimate_run
+from transformation.profiling import PER_VALUE, group_model_calls
+from transformation.programs import SYNTHESIS_CALLS, ProgramCache
+from transformation.rules import compile_rules
+
+
+class CountingModel:
+    """Stands in for the chat model: answers every prompt and counts the calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        batch = re.search(r"exactly (\d+) objects", prompt)
+        if batch:
+            return SimpleNamespace(content=str([{"OUT": "x"}] * int(batch.group(1))).replace("'", '"'))
+        # Not a program either, so X rules stay with the model
+        return SimpleNamespace(content='{"OUT": "x"}')
+
+
+INPUT = pd.DataFrame({
+    "country": ["fr", "de", "fr", "de", "fr", "it"] * 5,
+    "name": [f"client {i}" for i in range(30)],
+    "born": ["1990-01-31", "31/01/1990", "not a date", "", "1985-12-01", "sometime"] * 5,
+})
+
+FLAT = [
+    {"type": "X", "source_column": "country", "target_column": "COUNTRY", "instruction": "Full country name"},
+    {"type": "X", "source_column": "name", "target_column": "GREETING", "instruction": "Greet the client"},
+    {"type": "F", "source_column": "born", "target_column": "BORN", "target_format": "YYYY/MM/DD"},
+    {"type": "O", "source_column": "name", "target_column": "NAME"},
+]
+
+GRAPH = FLAT + [
+    {"type": "J", "columns": ["COUNTRY", "NAME"], "target_column": "LABEL", "separator": " "},
+    {"type": "X", "source_column": "LABEL", "target_column": "SLOGAN", "instruction": "Write a slogan"},
+]
+
+
+def test_estimate_counts_the_calls_the_engine_groups():
+    groups = group_model_calls(compile_rules(FLAT[:2]), INPUT)
+    assert groups[0]["strategy"] == PER_VALUE and groups[0]["calls"] == 3
+    estimate = estimate_run(INPUT, FLAT)
+    # Both X rules are offered for synthesis first, and dates that don't parse go to the model as well
+    assert estimate["program_calls"] == 2 * SYNTHESIS_CALLS
+    assert estimate["model_calls"] == (3 + math.ceil(30 / groups[1]["batch_size"])
+                                       + estimate["program_calls"] + estimate["fallback_calls"])
+    assert estimate["native_rules"] == 2
+    assert estimate["input_tokens"] > 0 and estimate["estimated_seconds"] > 0
+
+
+def test_the_per_row_loop_costs_a_call_per_row():
+    estimate = estimate_run(INPUT, FLAT, per_row=True, concurrency=4, seconds_per_call=1.0)
+    assert estimate["model_calls"] == 30
+    assert estimate["estimated_seconds"] == 8
+
+
+@pytest.mark.parametrize("rules", [FLAT, GRAPH], ids=["flat", "graph"])
+def test_estimate_counts_the_calls_the_engine_makes(rules, tmp_path):
+    engine = DataTransformationEngine(max_workers=1, program_cache=ProgramCache())
+    engine._model = CountingModel()
+
+    # First run synthesizes programs, the second finds the instructions in the cache
+    for run in range(2):
+        estimate = estimate_run(INPUT, rules, program_cache=engine.program_cache)
+        before = engine._model.calls
+        engine.transform_frame(INPUT, rules, str(tmp_path), f"run{run}.csv")
+        assert estimate["model_calls"] == engine._model.calls - before
+        assert estimate["program_calls"] == (4 if run == 0 else 0)
+        assert estimate["fallback_calls"] > 0
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from transformation.executor import PartitionedExecutor, partition_bounds
+from transformation.native import apply_rules
+from transformation.rules import compile_rules
+
+
+RULES = [
+    {"type": "O", "source_column": "amount", "target_column": "AMOUNT"},
+    {"type": "J", "columns": ["amount", "code"], "target_column": "KEY", "separator": "-"},
+    {"type": "F", "source_column": "born", "target_column": "BORN", "target_format": "YYYY/MM/DD"},
+    {"type": "S", "columns": ["amount"], "target_column": "AMOUNT_PADDED", "operation": "pad_left(8, \"0\")"},
+]
+
+
+def _frame(n_rows=4000):
+    # Whole numbers everywhere but in the last rows, and month-first dates
+    # whose day only passes 12 in the first half, so the second half alone
+    # would read as day-first
+    amounts = np.arange(n_rows, dtype=float)
+    amounts[-1] = 3.5
+    amounts[::7] = np.nan
+    days = [f"{(i * 5 % 12) + 1:02d}/{(i % (28 if i < n_rows // 2 else 12)) + 1:02d}/2024" for i in range(n_rows)]
+    return pd.DataFrame({"amount": amounts, "code": [f"c{i % 10}" for i in range(n_rows)], "born": days})
+
+
+def test_partitions_cover_the_input_in_order():
+    assert partition_bounds(10, 3) == [(0, 4), (4, 8), (8, 10)]
+    assert partition_bounds(2, 8) == [(0, 1), (1, 2)]
+
+
+def test_partitioned_runs_match_the_in_process_run():
+    df = _frame()
+    plan = compile_rules(RULES)
+    expected = apply_rules(df, plan)
+    assert expected["AMOUNT"].iloc[1] == "1.0"
+
+    for shared_memory in (True, False):
+        executor = PartitionedExecutor(plan, max_workers=2, min_parallel_rows=0, shared_memory=shared_memory)
+        pd.testing.assert_frame_equal(executor.run(df), expected)
@@ -0,0 +1,96 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from transformation import ids
+
+
+RULE = {"type": "A", "target_column": "REL_ID", "source_columns": [],
+        "params": {"id_pattern": "R{random:4}-{seq}"}}
+
+
+def _generate(n_rows):
+    rule = ids.allocate_ids([RULE], n_rows)[0]
+    return ids.generate_ids({}, rule, pd.RangeIndex(n_rows)).tolist()
+
+
+def test_ids_continue_across_runs_with_a_state_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "ids.json")
+    monkeypatch.setattr(ids, "allocator", ids.IdAllocator(path))
+    first = _generate(5)
+    # A later run starts from the persisted high-water mark
+    monkeypatch.setattr(ids, "allocator", ids.IdAllocator(path))
+    second = _generate(5)
+    assert len(set(first + second)) == 10
+    assert second[0].endswith("-6")
+
+
+def test_runs_without_a_state_file_get_different_random_tokens(monkeypatch):
+    monkeypatch.setattr(ids, "allocator", ids.IdAllocator())
+    first = _generate(5)
+    monkeypatch.setattr(ids, "allocator", ids.IdAllocator())
+    second = _generate(5)
+    assert [value.split("-")[0] for value in first] != [value.split("-")[0] for value in second]
+
+
+def test_random_tokens_widen_instead_of_repeating_past_their_capacity():
+    counters = np.arange(36 ** 2 + 100, dtype=np.int64)
+    tokens = ids._random_tokens(counters, 2, "seed")
+    assert len(set(tokens)) == len(counters)
+    assert {len(token) for token in tokens[:36 ** 2]} == {2}
+    assert {len(token) for token in tokens[36 ** 2:]} == {3}
+
+
+def test_mapping_sheet_a_rules_are_native_only_with_a_pattern():
+    from transformation.engine import DataTransformationEngine
+    from transformation.native import is_native
+    from transformation.rules import compile_rules
+
+    mapping = pd.DataFrame({
+        "Parameter#1": ["NF_CLIENT:ClientId", "NF_CLIENT:ClientId"],
+        "Transformation Type": ["A", "A"],
+        "STG_Column_Name": ["REL_ID", "ALT_ID"],
+        "Parameter#2": ["{ClientId[:4]}{random:4}", None],
+    })
+    instructions = DataTransformationEngine(max_workers=1)._build_mapping_instructions(mapping, {})
+    assert instructions[0]["id_pattern"] == "{ClientId[:4]}{random:4}"
+    # Without a pattern the model generates the ID, as before ID patterns existed
+    assert "id_pattern" not in instructions[1]
+    assert [is_native(rule) for rule in compile_rules(instructions)] == [True, False]
+
+
+def test_patterns_whose_counter_could_run_into_a_column_are_rejected():
+    # "12" + "31" and "123" + "1" would both give "1231"
+    with pytest.raises(ValueError, match="same ID"):
+        ids.parse_pattern("{A}{seq}")
+    ids.parse_pattern("{A}-{seq}")
+    ids.parse_pattern("{A[:3]}{seq}")
+
+
+def test_short_values_are_padded_to_their_slice(monkeypatch):
+    monkeypatch.setattr(ids, "allocator", ids.IdAllocator())
+    rule = ids.allocate_ids([{**RULE, "params": {"id_pattern": "{A[-3:]}{seq}"}}], 2)[0]
+    values = pd.Series(["12", "123"])
+    assert ids.generate_ids({"A": values}, rule, values.index).tolist() == ["0121", "1232"]
+
+
+def test_ids_stay_unique_when_values_vary_in_length_and_tokens_widen(monkeypatch):
+    monkeypatch.setattr(ids, "allocator", ids.IdAllocator())
+    values = pd.Series([str(i)[: i % 4] for i in range(2000)])
+    rule = ids.allocate_ids([{**RULE, "params": {"id_pattern": "{A[:3]}{random:1}"}}], len(values))[0]
+    generated = ids.generate_ids({"A": values}, rule, values.index)
+    assert generated.is_unique
+
+
+def _allocate_blocks(path, n_blocks):
+    allocator = ids.IdAllocator(path)
+    return [allocator.allocate("REL_ID", 10) for _ in range(n_blocks)]
+
+
+def test_processes_sharing_a_state_file_get_distinct_blocks(tmp_path):
+    path = str(tmp_path / "ids.json")
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        starts = [start for block in pool.map(_allocate_blocks, [path] * 4, [50] * 4) for start in block]
+    assert sorted(starts) == list(range(0, 2000, 10))
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_after(statement, modules):
+    """Which of ``modules`` a fresh interpreter has imported after running ``statement``."""
+    script = f"import sys\n{statement}\nprint(sorted(set({modules!r}) & set(sys.modules)))\n"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, cwd=ROOT)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_importing_the_package_loads_nothing_heavy():
+    assert loaded_after("import transformation", ["pandas", "numpy", "flask", "streamlit"]) == "[]"
+
+
+def test_native_execution_does_not_load_web_frameworks_or_a_model_client():
+    assert loaded_after("import transformation.executor, transformation.datasets",
+                        ["flask", "streamlit", "langchain_openai"]) == "[]"
+
+
+def test_the_batch_script_builds_its_model_client_on_first_use():
+    assert loaded_after("import tr", ["langchain_openai", "openai"]) == "[]"
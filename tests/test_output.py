@@ -0,0 +1,57 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from transformation.output import CsvChunkWriter, OutputBuilder, follow_file, iter_csv
+
+
+RULES = {
+    "NAME": {"type": "O", "rule_payload": {"source_column": "name"}},
+    "CODE": {"type": "D", "rule_payload": {"default_value": "X"}},
+}
+
+
+def test_rows_land_in_the_schema_columns_in_order():
+    output = OutputBuilder.from_rules(RULES, 3)
+    assert output.schema == ["NAME", "CODE"]
+    output.set_row(2, {"CODE": "c", "NAME": "n", "EXTRA": 1})
+    output.set_column("CODE", ["a", "b"])
+    frame = output.to_frame()
+    assert list(frame.columns) == ["NAME", "CODE"]
+    assert frame["NAME"].isna().tolist() == [True, True, False]
+    assert frame["CODE"].tolist() == ["a", "b", "c"]
+    assert output.to_frame(include_unfilled=False)["NAME"].tolist() == ["n"]
+
+
+def test_failed_rows_stay_failed_when_native_columns_are_written():
+    output = OutputBuilder(["A"], 3)
+    output.set_row(0, {"A": 1})
+    output.mark_failed(1)
+    output.set_column("A", [1, 2, 3])
+    assert output.filled_count == 1
+    assert output.succeeded.tolist() == [True, False, True]
+    output.mark_failed(np.array([False, False, True]))
+    assert output.succeeded.tolist() == [True, False, False]
+
+
+def test_csv_chunks_add_up_to_the_whole_file():
+    output_df = pd.DataFrame({"A": range(5), "B": list("abcde")})
+    assert "".join(iter_csv(output_df, chunk_rows=2)) == output_df.to_csv(index=False)
+    assert "".join(iter_csv(output_df.iloc[:0], chunk_rows=2)) == "A,B\n"
+
+
+def test_a_growing_file_streams_until_its_writer_finishes(tmp_path):
+    path = str(tmp_path / "out.csv")
+    writer = CsvChunkWriter(path, ["A", "B"])
+    finished = threading.Event()
+    chunks = follow_file(path, finished.is_set, poll_interval=0.01)
+    assert next(chunks) == b"A,B\n"
+
+    writer.write(pd.DataFrame({"B": ["x"], "A": [1]}))
+    assert next(chunks) == b"1,x\n"
+    writer.write(pd.DataFrame({"A": [2], "B": ["y"]}))
+    writer.close()
+    finished.set()
+    assert b"".join(chunks) == b"2,y\n"
+    assert writer.rows_written == 2
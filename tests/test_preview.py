@@ -0,0 +1,33 @@
+import pandas as pd
+
+from transformation.preview import PreviewCache, preview_rules
+
+INPUT = pd.DataFrame({"country": ["fr", "de", "fr", "it"] * 10, "name": [f"n{i}" for i in range(40)]})
+
+RULES = [
+    {"type": "O", "source_column": "name", "target_column": "NAME"},
+    {"type": "X", "source_column": "country", "target_column": "COUNTRY", "instruction": "Full country name"},
+]
+
+
+def test_native_rules_preview_without_the_model():
+    sample, output = preview_rules(INPUT, RULES[:1], n_rows=5)
+    assert len(sample) <= 5 + 10
+    assert output["NAME"].tolist() == sample["name"].tolist()
+
+
+def test_model_answers_are_cached_per_rule_and_value():
+    batches = []
+
+    def model_batch(rows, rules):
+        batches.append(rows)
+        return [{"COUNTRY": row["country"].upper()} for row in rows]
+
+    cache = PreviewCache()
+    sample, output = preview_rules(INPUT, RULES, model_batch=model_batch, cache=cache)
+    assert len(batches) == 1 and set(batches[0][0]) == {"country"}
+    assert output["COUNTRY"].tolist() == sample["country"].str.upper().tolist()
+
+    _, again = preview_rules(INPUT, RULES, model_batch=model_batch, cache=cache)
+    assert len(batches) == 1
+    assert again["COUNTRY"].tolist() == output["COUNTRY"].tolist()
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from transformation.profiling import BATCH, NATIVE, PER_VALUE, group_model_calls, plan_strategies, profile_columns
+from transformation.rules import compile_rules
+
+INPUT = pd.DataFrame({
+    "country": ["fr", "de", None, "fr"] * 25,
+    "name": [f"client {i}" for i in range(100)],
+})
+
+RULES = [
+    {"type": "X", "source_column": "country", "target_column": "COUNTRY", "instruction": "Full name"},
+    {"type": "X", "source_column": "Country", "target_column": "REGION", "instruction": "Region"},
+    {"type": "X", "source_column": "name", "target_column": "GREETING", "instruction": "Greet"},
+    {"type": "A", "source_column": "country", "target_column": "ID", "instruction": "Unique ID"},
+    {"type": "O", "source_column": "name", "target_column": "NAME"},
+]
+
+
+def test_profiles_count_distinct_values_nulls_and_lengths():
+    profiles = profile_columns(INPUT)
+    assert profiles["country"]["distinct"] == 2
+    assert profiles["country"]["null_fraction"] == 0.25
+    assert 8 < profiles["name"]["avg_length"] < 10
+
+
+def test_repeating_values_are_sent_once_and_unique_ones_in_batches():
+    strategies = plan_strategies(compile_rules(RULES), INPUT)
+    assert [entry["strategy"] for entry in strategies] == [PER_VALUE, PER_VALUE, BATCH, BATCH, NATIVE]
+    assert strategies[0]["calls"] == 3
+    assert strategies[2]["calls"] == -(-100 // strategies[2]["batch_size"])
+
+
+def test_model_calls_are_grouped_as_the_engine_sends_them():
+    model_rules = [rule for rule in compile_rules(RULES) if rule["type"] != "O"]
+    groups = group_model_calls(model_rules, INPUT)
+    assert [(group["strategy"], group["rules"]) for group in groups] == [(PER_VALUE, [0, 1]), (BATCH, [2, 3])]
+    assert groups[0]["calls"] == 3
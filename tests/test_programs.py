@@ -0,0 +1,61 @@
+import json
+
+import pandas as pd
+import pytest
+
+from transformation import compile_rules
+from transformation.native import apply_rules
+from transformation.programs import ProgramCache, run_program, synthesize_program, validate_program
+
+MASK = {"fn": "mask_after", "args": [{"col": "email"}, "@", "***"]}
+RULE = compile_rules([{"type": "X", "source_column": "email", "target_column": "MASKED",
+                       "instruction": "Mask the email after the @ with ***"}])[0]
+INPUT = pd.DataFrame({"email": [f"user{i}@example.com" for i in range(30)] + [""]})
+
+
+def masked(rows, rules):
+    return [{"MASKED": row["email"].split("@")[0] + "@***" if row["email"] else ""} for row in rows]
+
+
+def test_programs_only_use_the_expression_language():
+    validate_program(MASK, ["Email"])
+    for program in ({"col": "password"}, {"fn": "eval", "args": ["1"]},
+                    {"fn": "left", "args": [{"col": "email"}, "3"]}, ["not", "an", "expression"]):
+        with pytest.raises(ValueError):
+            validate_program(program, ["email"])
+    nested = {"col": "email"}
+    for _ in range(10):
+        nested = {"fn": "upper", "args": [nested]}
+    with pytest.raises(ValueError):
+        validate_program(nested, ["email"])
+
+
+def test_programs_run_on_whole_columns():
+    index = pd.RangeIndex(2)
+    columns = {"first": pd.Series(["Ada", None]), "last": pd.Series(["Lovelace", "Byron"])}
+    program = {"fn": "concat", "args": [{"fn": "if_empty", "args": [{"col": "first"}, "?"]}, " ", {"col": "last"}]}
+    assert run_program(program, columns, index).tolist() == ["Ada Lovelace", "? Byron"]
+
+
+def test_a_checked_program_replaces_the_rule_and_is_cached(tmp_path):
+    prompts = []
+
+    def complete(prompt):
+        prompts.append(prompt)
+        return json.dumps({"program": MASK})
+
+    cache = ProgramCache(str(tmp_path / "programs.json"))
+    rule = synthesize_program(INPUT, RULE, complete, masked, cache=cache)
+    assert rule["type"] == "P"
+    assert apply_rules(INPUT, [rule])["MASKED"].tolist()[:2] == ["user0@***", "user1@***"]
+
+    # Found again in the persisted cache, without asking the model
+    again = synthesize_program(INPUT, RULE, complete, masked, cache=ProgramCache(cache.path))
+    assert again == rule and len(prompts) == 1
+
+
+def test_programs_that_disagree_with_the_model_are_rejected():
+    cache = ProgramCache()
+    wrong = {"fn": "upper", "args": [{"col": "email"}]}
+    assert synthesize_program(INPUT, RULE, lambda prompt: json.dumps({"program": wrong}), masked, cache=cache) is None
+    assert cache.get(ProgramCache.key(RULE)) == (True, None)
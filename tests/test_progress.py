@@ -0,0 +1,53 @@
+import threading
+
+from transformation import serialization
+from transformation.progress import ProgressTracker, sse_events
+
+
+def test_snapshot_counts_rows_calls_and_cache_lookups():
+    tracker = ProgressTracker(total=4)
+    tracker.row_done(3)
+    tracker.row_failed()
+    tracker.call_started()
+    tracker.call_started()
+    tracker.call_finished()
+    tracker.record_cache(hit=True, count=3)
+    tracker.record_cache(hit=False)
+    tracker.record_tokens(100, 20)
+    snapshot = tracker.snapshot()
+    assert (snapshot["rows_done"], snapshot["rows_failed"], snapshot["progress"]) == (3, 1, 0.75)
+    assert (snapshot["calls_in_flight"], snapshot["calls_done"]) == (1, 1)
+    assert (snapshot["cache_hit_rate"], snapshot["input_tokens"], snapshot["output_tokens"]) == (0.75, 100, 20)
+    assert snapshot["eta_seconds"] is not None and not snapshot["finished"]
+
+
+def test_listeners_are_throttled_but_always_see_the_end():
+    tracker = ProgressTracker(total=100, min_interval=60)
+    seen = []
+    tracker.add_listener(seen.append)
+    for _ in range(100):
+        tracker.row_done()
+    tracker.finish()
+    assert len(seen) == 2
+    assert seen[-1]["finished"] and seen[-1]["rows_done"] == 100
+
+
+def test_the_event_stream_ends_with_a_done_event():
+    tracker = ProgressTracker(total=2)
+    events = sse_events(tracker, min_interval=0, heartbeat=5)
+    tracker.row_done()
+    first = next(events)
+    assert first.startswith("event: progress\n")
+    assert serialization.loads(first.split("data: ", 1)[1])["rows_done"] == 1
+
+    threading.Timer(0.05, lambda: (tracker.row_done(), tracker.finish())).start()
+    rest = list(events)
+    assert rest[-1].startswith("event: done\n")
+    assert serialization.loads(rest[-1].split("data: ", 1)[1])["rows_done"] == 2
+
+
+def test_idle_streams_send_keep_alive_comments():
+    tracker = ProgressTracker()
+    events = sse_events(tracker, min_interval=0, heartbeat=0.01)
+    assert next(events).startswith("event: progress")
+    assert next(events) == ": keep-alive\n\n"
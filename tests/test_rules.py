@@ -0,0 +1,16 @@
+import subprocess
+import sys
+
+
+def test_compiling_rules_does_not_import_pandas():
+    script = (
+        "import sys\n"
+        "from transformation import compile_rules\n"
+        "compile_rules([\n"
+        "    {'type': 'W', 'target_column': 'T', 'condition': 'when A == \"Y\" then O(B) else D(\"x\")'},\n"
+        "    {'type': 'A', 'source_column': 'B', 'target_column': 'R', 'id_pattern': '{B[:4]}{random:4}'},\n"
+        "])\n"
+        "print(sorted({'numpy', 'pandas'} & set(sys.modules)))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,24 @@
+import pandas as pd
+
+from transformation.sampling import stratified_sample
+
+INPUT = pd.DataFrame({
+    "status": ["active"] * 95 + ["closed"] * 4 + [None],
+    "type": ["A", "B"] * 49 + ["RARE", "A"],
+    "name": [f"client {i}" for i in range(100)],
+})
+
+
+def test_every_value_of_the_low_cardinality_columns_is_covered():
+    sample = stratified_sample(INPUT, tail_rows=0)
+    assert set(sample["status"].fillna("null")) == {"active", "closed", "null"}
+    assert set(sample["type"]) == {"A", "B", "RARE"}
+    assert len(sample) <= 4
+    assert list(sample.index) == sorted(sample.index)
+
+
+def test_the_random_tail_is_repeatable_and_bounded():
+    first = stratified_sample(INPUT, max_rows=6, tail_rows=3)
+    assert first.index.equals(stratified_sample(INPUT, max_rows=6, tail_rows=3).index)
+    assert len(first) == 6
+    assert stratified_sample(INPUT, ["name"], tail_rows=5).shape[0] == 5
@@ -0,0 +1,36 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from transformation import serialization
+
+BACKENDS = [name for name in serialization.BACKENDS if name == "json" or serialization.ORJSON_AVAILABLE]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    previous = serialization.backend()
+    serialization.use_backend(request.param)
+    yield request.param
+    serialization.use_backend(previous)
+
+
+def test_encoding_is_compact_sorted_and_plain(backend):
+    text = serialization.dumps({"b": np.int64(2), "a": [math.nan, pd.NA, np.float32(0.1)], "c": "é"})
+    assert text == '{"a":[null,null,0.1],"b":2,"c":"é"}'
+    assert serialization.loads(text) == {"a": [None, None, 0.1], "b": 2, "c": "é"}
+
+
+def test_mixed_key_types_are_written_as_strings(backend):
+    assert serialization.loads(serialization.dumps({1: "one", "2": "two"})) == {"1": "one", "2": "two"}
+
+
+def test_fingerprints_do_not_depend_on_the_backend(backend):
+    payload = {"rule": {"type": "T", "mapping": {1: "a", "b": 2}}, "values": [1e16, None]}
+    fingerprints = set()
+    for name in BACKENDS:
+        serialization.use_backend(name)
+        fingerprints.add(serialization.fingerprint(payload))
+    assert len(fingerprints) == 1
@@ -0,0 +1,36 @@
+import pytest
+
+streamlit_cache = pytest.importorskip("transformation.streamlit_cache")
+
+
+class Upload:
+    def __init__(self, data, file_id):
+        self.data, self.file_id, self.name = data, file_id, f"{file_id}.csv"
+        self.reads = 0
+
+    def getvalue(self):
+        self.reads += 1
+        return self.data
+
+
+def test_an_upload_is_read_once_across_reruns():
+    upload = Upload(b"code,name\n1,a\n", "upload-1")
+    first = streamlit_cache.load_uploaded_csv(upload)
+    second = streamlit_cache.load_uploaded_csv(upload)
+    assert first is second and upload.reads == 1
+    assert first["name"].tolist() == ["a"]
+
+
+def test_rules_are_compiled_once_per_definition(monkeypatch):
+    compiled = []
+    compile_rule = streamlit_cache.compile_rule
+    monkeypatch.setattr(streamlit_cache, "compile_rule", lambda rule: compiled.append(rule) or compile_rule(rule))
+    streamlit_cache._compile_rule.clear()
+
+    rules = [{"type": "O", "source_column": "name", "target_column": "NAME"},
+             {"type": "D", "default_value": "X", "target_column": "CODE"}]
+    first = streamlit_cache.compile_rules_cached(rules)
+    rules[1] = {"type": "D", "default_value": "Y", "target_column": "CODE"}
+    second = streamlit_cache.compile_rules_cached(rules)
+    assert first[0] == second[0] and second[1]["params"]["default_value"] == "Y"
+    assert len(compiled) == 3
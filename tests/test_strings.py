@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+from transformation import compile_rules
+from transformation.native import apply_rules
+from transformation.strings import apply_operation, parse_operation
+
+
+def test_operations_are_parsed_as_literals():
+    assert parse_operation('pad_left(6, "0")') == ("pad_left", (6, "0"))
+    assert parse_operation("upper") == ("upper", ())
+    for text in ("pad_left('6')", "shout()", "left(__import__('os'))", 'regex_extract("(")'):
+        with pytest.raises(ValueError):
+            parse_operation(text)
+
+
+def test_operations_run_on_whole_columns():
+    text = pd.Series(["42", "", "ada@example.com"])
+    assert apply_operation([text], "pad_left", (4, "0")).tolist() == ["0042", "", "ada@example.com"]
+    assert apply_operation([text], "mask_after", ("@", "***")).tolist() == ["42", "", "ada@***"]
+    joined = apply_operation([pd.Series(["a", "", "c"]), pd.Series(["b", "x", ""])], "concat", ("-",))
+    assert joined.tolist() == ["a-b", "x", "c"]
+
+
+def test_s_rules_run_natively():
+    plan = compile_rules([{"type": "S", "source_column": "email", "target_column": "DOMAIN",
+                           "operation": 'after("@")'}])
+    output = apply_rules(pd.DataFrame({"email": ["ada@example.com", None]}), plan)
+    assert output["DOMAIN"].tolist() == ["example.com", ""]
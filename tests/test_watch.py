@@ -0,0 +1,56 @@
+import glob
+import shutil
+
+import pandas as pd
+import pytest
+
+from transformation import ids, watch
+from transformation.watch import IngestionService
+
+
+@pytest.fixture
+def make_service(tmp_path, monkeypatch, native_workbook):
+    # The service points the process-wide ID allocator at its state directory
+    monkeypatch.setattr(ids, "allocator", ids.allocator)
+    (tmp_path / "in").mkdir()
+    services = []
+
+    def make():
+        service = IngestionService(str(tmp_path / "in"), [native_workbook], output_dir=str(tmp_path / "out"),
+                                   workers=1, use_model=False, poll_seconds=0)
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.close()
+
+
+def test_settled_files_are_transformed_once(make_service, tmp_path):
+    service = make_service()
+    (tmp_path / "in" / "NF_CLIENT_01012025.csv").write_text("Name|Country\nAda|fr\n")
+    (tmp_path / "in" / "other.csv").write_text("Name|Country\nBob|de\n")
+
+    # Files are only read once their size and modification time have settled
+    assert service.poll() == 0
+    assert service.poll() == 1
+    service.close()
+    output = pd.read_csv(tmp_path / "out" / "NF_CLIENT_01012025__rules.csv")
+    assert output["COUNTRY"].tolist() == ["France"]
+    assert len(glob.glob(str(tmp_path / "out" / "manifests" / "*.json"))) == 1
+
+    # Neither a re-delivered copy under another name nor a restart runs it again
+    shutil.copy(tmp_path / "in" / "NF_CLIENT_01012025.csv", tmp_path / "in" / "NF_CLIENT_02012025.csv")
+    restarted = make_service()
+    assert restarted.poll() == 0 and restarted.poll() == 0
+
+
+def test_settled_files_are_hashed_once(make_service, tmp_path, monkeypatch):
+    hashed = []
+    file_key = watch.file_key
+    monkeypatch.setattr(watch, "file_key", lambda path: hashed.append(path) or file_key(path))
+    service = make_service()
+    (tmp_path / "in" / "NF_CLIENT_01012025.csv").write_text("Name|Country\nAda|fr\n")
+    for _ in range(4):
+        service.poll()
+    assert len(hashed) == 1
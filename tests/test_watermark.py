@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from transformation.watermark import WatermarkStore
+
+
+def _input():
+    return pd.DataFrame({"clientid": [1, 2, 3, 4, 5],
+                         "effectivedate": ["01/02/2025", "15/02/2025", "01/03/2025", "", "31/03/2025"]})
+
+
+def test_rows_at_or_before_the_watermark_are_dropped(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.json"))
+    watermark = store.watermark("NF_CLIENT", "rules.xlsx")
+    rows, dates = watermark.filter(_input())
+    assert len(rows) == 5
+
+    assert watermark.advance(pd.Timestamp("2025-02-15"))
+    rows, dates = store.watermark("NF_CLIENT", "rules.xlsx").filter(_input())
+    # Rows without a date are kept, since they can't be placed
+    assert rows["clientid"].tolist() == [3, 4, 5]
+    assert dates.isna().tolist() == [False, True, False]
+    assert store.watermark("NF_CLIENT", "other.xlsx").filter(_input())[0].shape[0] == 5
+
+
+def test_failed_rows_hold_the_watermark_back(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.json"))
+    watermark = store.watermark("NF_CLIENT", "rules.xlsx")
+    rows, dates = watermark.filter(_input())
+
+    succeeded = np.array([True, True, False, True, True])
+    assert watermark.loaded_until(dates, succeeded) == pd.Timestamp("2025-02-15")
+    assert watermark.loaded_until(dates, np.ones(5, dtype=bool)) == pd.Timestamp("2025-03-31")
+    assert watermark.loaded_until(None, succeeded) is None
+
+    # The watermark never moves backwards
+    assert watermark.advance(pd.Timestamp("2025-03-31"))
+    assert not watermark.advance(pd.Timestamp("2025-02-15"))
+    assert WatermarkStore(store.path).get("NF_CLIENT", "rules.xlsx") == pd.Timestamp("2025-03-31")
@@ -0,0 +1,114 @@
+import threading
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+from transformation.jobs import JobManager
+from transformation.output import CsvChunkWriter
+from transformation.web import jobs_blueprint
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1)
+    yield manager
+    manager.shutdown()
+
+
+@pytest.fixture
+def client(manager):
+    app = Flask(__name__)
+    app.register_blueprint(jobs_blueprint(manager))
+    return app.test_client()
+
+
+def test_a_job_reports_its_progress_and_result(manager, client, tmp_path):
+    halfway, release = threading.Event(), threading.Event()
+
+    def work(rows, job):
+        job.advance(rows // 2)
+        halfway.set()
+        release.wait(5)
+        job.advance(rows - rows // 2)
+        path = tmp_path / "out.csv"
+        path.write_text("A\n1\n")
+        return str(path)
+
+    job = manager.submit(work, 4, name="transform", total=4)
+    assert halfway.wait(5)
+    status = client.get(f"/jobs/{job.id}").get_json()
+    assert (status["status"], status["progress"]) == ("running", 0.5)
+    assert client.get(f"/jobs/{job.id}/result").status_code == 409
+
+    release.set()
+    manager.shutdown()
+    assert client.get(f"/jobs/{job.id}").get_json()["status"] == "succeeded"
+    assert client.get(f"/jobs/{job.id}/result").data == b"A\n1\n"
+    assert [entry["job_id"] for entry in client.get("/jobs").get_json()] == [job.id]
+
+
+def test_failed_and_unknown_jobs(manager, client):
+    def work(job):
+        raise RuntimeError("model unavailable")
+
+    job = manager.submit(work)
+    manager.shutdown()
+    assert client.get(f"/jobs/{job.id}").get_json()["error"] == "model unavailable"
+    assert client.get("/jobs/nope").status_code == 404
+
+
+def test_job_events_stream_until_the_job_finishes(manager, client):
+    def work(job):
+        job.advance(2)
+
+    job = manager.submit(work, total=2)
+    response = client.get(f"/jobs/{job.id}/events")
+    assert response.mimetype == "text/event-stream"
+    events = response.get_data(as_text=True).strip().split("\n\n")
+    assert events[-1].startswith("event: done")
+    assert '"rows_done":2' in events[-1]
+
+
+def test_results_download_while_the_job_still_writes_them(manager, client, tmp_path):
+    started, release = threading.Event(), threading.Event()
+
+    def work(job):
+        job.output_path = str(tmp_path / "out.csv")
+        with CsvChunkWriter(job.output_path, ["A"]) as writer:
+            writer.write(pd.DataFrame({"A": [1]}))
+            started.set()
+            release.wait(5)
+            writer.write(pd.DataFrame({"A": [2]}))
+        return job.output_path
+
+    job = manager.submit(work)
+    assert started.wait(5)
+    response = client.get(f"/jobs/{job.id}/result")
+    assert response.mimetype == "text/csv"
+    release.set()
+    assert response.get_data() == b"A\n1\n2\n"
+
+
+@pytest.fixture
+def work3(monkeypatch, tmp_path):
+    work3 = pytest.importorskip("work3")
+    monkeypatch.setattr(work3, "current_df", lambda: pd.DataFrame({"code": ["a", "b"]}))
+    monkeypatch.setattr(work3, "go_to_func", lambda rules, input_df, job: str(tmp_path / "out.csv"))
+    work3.app.config["TESTING"] = True
+    return work3
+
+
+FORM = {"source_column": "code", "target_column": "CODE", "mapping": "a=1"}
+
+
+def test_form_posts_get_a_page_and_scripts_get_json(work3):
+    client = work3.app.test_client()
+    page = client.post("/", data=FORM, headers={"Accept": "text/html,application/xhtml+xml,*/*;q=0.8"})
+    assert page.status_code == 202 and page.mimetype == "text/html"
+    assert b"/jobs/" in page.data
+
+    for headers in ({"X-Requested-With": "XMLHttpRequest"}, {"Accept": "application/json, text/plain, */*"}):
+        queued = client.post("/", data=FORM, headers=headers)
+        assert queued.status_code == 202
+        assert queued.get_json()["status_url"] == f"/jobs/{queued.get_json()['job_id']}"
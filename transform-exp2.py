@@ -1,8 +1,9 @@
 import os
+from functools import lru_cache
 import json
 import pandas as pd
-from langchain_openai import AzureChatOpenAI
-import gradio as gr
+
+from transformation import serialization
 
 os.environ["AZURE_OPENAI_API_KEY"] = "xxx"
 os.environ["AZURE_OPENAI_ENDPOINT"] = "https://codedocumentation.openai.azure.com/"
@@ -10,11 +11,15 @@ os.environ["AZURE_OPENAI_API_VERSION"] = "2024-02-15-preview"
 os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = "gpt-4o"
 
 
-model = AzureChatOpenAI(
-    openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-    azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
-    temperature=0.0
-)
+@lru_cache(maxsize=None)
+def get_model():
+    """Azure OpenAI client, created on first use instead of on import."""
+    from langchain_openai import AzureChatOpenAI
+    return AzureChatOpenAI(
+        openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+        temperature=0.0
+    )
 
 
 def load_input_data(input_file_path):
@@ -103,7 +108,7 @@ Your job is to transform the given input row using the provided structured trans
 
 ----------------------
 TRANSFORMATION RULES:
-{json.dumps(mapping_instructions, indent=2)}
+{serialization.dumps(mapping_instructions)}
 ----------------------
 
 RULE TYPES:
@@ -121,13 +126,13 @@ IMPORTANT INSTRUCTIONS:
 6. Maintain the tranformed column order in the final output.
 
 INPUT ROW:
-{json.dumps(input_row, indent=2)}
+{serialization.dumps(input_row)}
 
 Return all the transformed row(s) as a valid JSON object.
 
 """
 
-    response = model.invoke(prompt)
+    response = get_model().invoke(prompt)
     content = response.content.strip()
     start_index = content.find('{')
     end_index = content.rfind('}') + 1
@@ -137,7 +142,7 @@ Return all the transformed row(s) as a valid JSON object.
         return {}
 
     try:
-        return json.loads(content[start_index:end_index])
+        return serialization.loads(content[start_index:end_index])
     except json.JSONDecodeError:
         print(f"Failed to decode AI response: {content}")
         return {}
@@ -166,7 +171,8 @@ def transform_excel(input_csv, mapping_excel):
     print(f"\nTransformation complete. Output saved to: {output_file}")
 
 
-transform_excel('CIFINPUT/NF_CLIENT_24042025.csv', "CIFINPUT/TRANS_NAM 4.xlsx")
+if __name__ == "__main__":
+    transform_excel('CIFINPUT/NF_CLIENT_24042025.csv', "CIFINPUT/TRANS_NAM 4.xlsx")
 #TRANS_ADRPART01
 #TRANS_NAM 4
 #TRANS_ADRPART02
@@ -1,9 +1,18 @@
 import pandas as pd
-from flask import Flask, render_template, request
+from flask import Flask, Response, render_template, request
 import os
+from functools import lru_cache
 import json
 import pandas as pd
-from langchain_openai import AzureChatOpenAI
+
+from transformation import serialization
+from transformation.column_cache import ColumnCache, select_rules
+from transformation.datasets import DatasetStore
+from transformation.native import apply_rules, is_native
+from transformation.preview import PreviewCache, batch_prompt, parse_batch_response, preview_records, preview_rules
+from transformation.rules import compile_rules
+from transformation.strings import catalog
+from transformation.web import datasets_blueprint, session_dataset, session_id
 
 os.environ["AZURE_OPENAI_API_KEY"] = "70683713e7"
 os.environ["AZURE_OPENAI_ENDPOINT"] = "https://codedocumentation.openai.azure.com/"
@@ -11,19 +20,29 @@ os.environ["AZURE_OPENAI_API_VERSION"] = "2024-02-15-preview"
 os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = "gpt-4o"
 
 
-model = AzureChatOpenAI(
-    openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-    azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
-    temperature=0.0
-)
+@lru_cache(maxsize=None)
+def get_model():
+    """Azure OpenAI client, created on first use instead of on import."""
+    from langchain_openai import AzureChatOpenAI
+    return AzureChatOpenAI(
+        openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+        temperature=0.0
+    )
 
 app = Flask(__name__)
 
 
-def transform_to_df(file):
-    return pd.read_csv(file)
+# Uploads are parsed once per distinct file and kept per session; sessions
+# without an upload fall back to the bundled sample file
+app.secret_key = os.environ.get("FLASK_SECRET_KEY") or os.urandom(24)
+dataset_store = DatasetStore()
+app.register_blueprint(datasets_blueprint(dataset_store))
+
 
-csv_df = transform_to_df('NAM 4.csv')
+def current_df():
+    """Dataset of the current session (shared, don't mutate)."""
+    return session_dataset(dataset_store, 'NAM 4.csv')
 
 
 def transformation_dict(form_data):
@@ -31,8 +50,12 @@ def transformation_dict(form_data):
         print(f"\n key:{key} values:{value}")
     
 
-def process_data(form_data):
-    print('displaying process_data function')
+# Model results shown in rule previews, reused while a form is being edited
+preview_cache = PreviewCache()
+
+
+def build_rules(form_data):
+    """Rule dict keyed by target column from a submitted rule form, or None if the type is unknown."""
     result_dict = {}
 
     rule_type = form_data.get("type")
@@ -43,7 +66,7 @@ def process_data(form_data):
         mapping_dict = {}
         for line in mapping_str.splitlines():
             if '=' in line:
-                key, value = line.split('=')
+                key, value = line.split('=', 1)
                 mapping_dict[key.strip()] = value.strip()
 
         result_dict[form_data["target_column"]] = {
@@ -74,6 +97,25 @@ def process_data(form_data):
             "target_column": form_data["target_column"]
         }
 
+    elif rule_type == "S":
+        result_dict[form_data["target_column"]] = {
+            "type": "S",
+            "rule": {
+                "source_column": form_data["source_column"],
+                "operation": form_data.get('operation', '')
+            },
+            "target_column": form_data["target_column"]
+        }
+
+    elif rule_type == "W":
+        result_dict[form_data["target_column"]] = {
+            "type": "W",
+            "rule": {
+                "condition": form_data.get('condition', '')
+            },
+            "target_column": form_data["target_column"]
+        }
+
     elif rule_type == "C":
         result_dict[form_data["target_column"]] = {
             "type": "C",
@@ -87,6 +129,15 @@ def process_data(form_data):
 
     else:
         print(f"Unknown transformation type: {rule_type}")
+        return None
+
+    return result_dict
+
+
+def process_data(form_data):
+    print('displaying process_data function')
+    result_dict = build_rules(form_data)
+    if result_dict is None:
         return
 
     print(result_dict)
@@ -105,7 +156,7 @@ def transform_row_with_ai(input_row, transformation_dict):
 
             ----------------------
             TRANSFORMATION RULES:
-            {json.dumps(transformation_dict, indent=2)}
+            {serialization.dumps(transformation_dict)}
             ----------------------
 
             RULE TYPES:
@@ -122,12 +173,12 @@ def transform_row_with_ai(input_row, transformation_dict):
             5. Use the new column name specified for the transformation.
 
             INPUT ROW:
-            {json.dumps(input_row, indent=2)}
+            {serialization.dumps(input_row)}
 
             Return only the transformed row as a valid JSON dictionary with final target column names.
         """
 
-    response = model.invoke(prompt)
+    response = get_model().invoke(prompt)
     content = response.content.strip()
     start_index = content.find('{')
     end_index = content.rfind('}') + 1
@@ -137,7 +188,7 @@ def transform_row_with_ai(input_row, transformation_dict):
         return {}
 
     try:
-        return json.loads(content[start_index:end_index])
+        return serialization.loads(content[start_index:end_index])
     except json.JSONDecodeError:
         print(f"Failed to decode AI response: {content}")
         return {}
@@ -145,19 +196,76 @@ def transform_row_with_ai(input_row, transformation_dict):
 
 
 
-def go_to_func(transformation_dict):
-    input_df = transform_to_df('NAM 4.csv')
+def transform_rows_with_ai(input_rows, transformation_dict):
+    """Transform several rows in one model call (used by the rule preview)."""
+    response = get_model().invoke(batch_prompt(input_rows, transformation_dict))
+    return parse_batch_response(response.content.strip(), len(input_rows))
+
+
+# Output columns keyed by rule definition and dataset, so resubmitting one
+# edited rule only recomputes that rule's column
+column_cache = ColumnCache()
+
+# Rules submitted so far per session and dataset, by target column; the output
+# file holds the columns of all of them
+session_rules = {}
 
 
-    result_rows = []
+def output_frame(input_df, rules, columns):
+    """Input rows with each rule's source column replaced by its target column."""
+    plan = compile_rules(rules)
+    sources = {}
+    for rule in plan:
+        for source in rule["source_columns"]:
+            sources.setdefault(source.strip().lower(), rule["target_column"])
 
-    for _, row in input_df.iterrows():
+    output_df = pd.DataFrame(index=input_df.index)
+    for col in input_df.columns:
+        target = sources.get(str(col).strip().lower())
+        if target is None:
+            output_df[col] = input_df[col]
+        elif target not in output_df.columns:
+            output_df[target] = columns[target]
+    for target in columns:
+        if target not in output_df.columns:
+            output_df[target] = columns[target]
+    return output_df
+
+
+def go_to_func(transformation_dict):
+    input_df = current_df()
+    dataset_key = dataset_store.session_key(session_id())
+    rules = session_rules.setdefault((session_id(), dataset_key), {})
+    rules.update(transformation_dict)
+
+    # Only rules that are new or edited since the last submission are recomputed
+    columns, pending = column_cache.lookup(dataset_key, rules)
+    print(f"Reusing {len(columns)} column(s), recomputing {pending}")
+
+    # Native rules (e.g. S string operations) run over the whole column, the rest go to the model
+    native_plan = [rule for rule in compile_rules(select_rules(rules, pending)) if is_native(rule)]
+    computed = {}
+    if native_plan:
+        native_df = apply_rules(input_df, native_plan)
+        computed.update({target: native_df[target].tolist() for target in native_df.columns})
+    model_targets = [target for target in pending if target not in computed]
+    pending_rules = select_rules(rules, model_targets)
+
+    computed.update({target: [] for target in model_targets})
+    failed = False
+    for _, row in (input_df.iterrows() if model_targets else []):
         input_row = row.to_dict()
-        transformed_row = transform_row_with_ai(input_row, transformation_dict)
+        transformed_row = transform_row_with_ai(input_row, pending_rules)
         print(f"\nAI input:\n{json.dumps(input_row,indent=2)}\nAI output:\n{transformed_row}")
-        result_rows.append(transformed_row)
+        failed = failed or not transformed_row
+        for target in model_targets:
+            computed[target].append(transformed_row.get(target))
 
-    output_df = pd.DataFrame(result_rows)
+    # Columns with failed rows aren't cached, so they are retried on the next submission
+    if pending and not failed:
+        column_cache.put(dataset_key, rules, computed)
+    columns.update(computed)
+    output_df = output_frame(input_df, rules, columns)
 
     output_folder = "Output"
     os.makedirs(output_folder, exist_ok=True)
@@ -175,28 +283,46 @@ def home():
 
 @app.route('/Tforms')
 def Tforms():
-    return render_template('Tform.html', source_cls=csv_df.columns)
+    return render_template('Tform.html', source_cls=current_df().columns)
 
 
 @app.route('/Tformsdynamic')
 def Tformsdynamic():
-    return render_template('updatedropdown.html', source_cls=csv_df.columns.tolist())
+    return render_template('updatedropdown.html', source_cls=current_df().columns.tolist())
 
 
 
 @app.route('/Oforms')
 def Oforms(): 
-    return render_template('Oform.html', source_cls=csv_df.columns)
+    return render_template('Oform.html', source_cls=current_df().columns)
 
 
 @app.route('/Xforms')
 def Xforms(): 
-    return render_template('Xform.html', source_cls=csv_df.columns)
+    return render_template('Xform.html', source_cls=current_df().columns, operations=catalog())
 
 
 @app.route('/Cforms')
 def Cforms(): 
-    return render_template('Conform.html', source_cls=csv_df.columns)
+    return render_template('Conform.html', source_cls=current_df().columns)
+
+
+@app.route('/preview', methods=['POST'])
+def preview():
+    """
+    Apply the rule being edited to a small sample; the forms call this as the user types.
+
+    Model rules are answered from the preview cache only, unless the form asks
+    for a model call with ``preview_model=1``.
+    """
+    rules = build_rules(request.form)
+    if not rules:
+        return Response(serialization.dumps({"error": "Unknown transformation type"}),
+                        status=400, mimetype="application/json")
+    model_batch = transform_rows_with_ai if request.form.get("preview_model") == "1" else None
+    sample, output = preview_rules(current_df(), rules, model_batch=model_batch, cache=preview_cache)
+    payload = {"input": preview_records(sample), "output": preview_records(output)}
+    return Response(serialization.dumps(payload), mimetype="application/json")
 
 
 @app.route('/processing', methods=['GET', 'POST'])
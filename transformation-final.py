@@ -1,9 +1,15 @@
 import os
+from functools import lru_cache
 import json
 import pandas as pd
 import numpy as np
-from langchain_openai import AzureChatOpenAI
-import gradio as gr
+
+from transformation import serialization
+from transformation.dates import DATE_RULE_TYPE, fallback_instruction, unparsed_dates
+from transformation.executor import referenced_columns
+from transformation.ids import ID_RULE_TYPE
+from transformation.native import apply_rules, is_native
+from transformation.rules import compile_rule, compile_rules, target_schema
 
 os.environ["AZURE_OPENAI_API_KEY"] = "70683714873e7"
 os.environ["AZURE_OPENAI_ENDPOINT"] = "https://codedocumentation.openai.azure.com/"
@@ -11,11 +17,15 @@ os.environ["AZURE_OPENAI_API_VERSION"] = "2024-02-15-preview"
 os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = "gpt-4o"
 
 
-model = AzureChatOpenAI(
-    openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-    azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
-    temperature=0.0
-)
+@lru_cache(maxsize=None)
+def get_model():
+    """Azure OpenAI client, created on first use instead of on import."""
+    from langchain_openai import AzureChatOpenAI
+    return AzureChatOpenAI(
+        openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+        temperature=0.0
+    )
 
 
 def load_input_data(input_file_path):
@@ -110,8 +120,9 @@ def load_transformation_rules(rules_file_path):
                 "type": "A",
                 "source_column": source_col,
                 "target_column": target_col,
-                "auto_generate_rule": f"Generate a unique ID using last four characters of ClientId column followed by current timestamp in the format YYYY-DDMM-HHMM (Day and Month, Hours and Minutes are combined) separated with hyphens(-) after every four characters having max length of 16 characters. Return the generated unique ID as a string. And assign this value to the {target_col} column. Ensure each ID must be unique. No duplicate ID(s)."
-                
+                "auto_generate_rule": f"Generate a unique ID using last four characters of ClientId column followed by current timestamp in the format YYYY-DDMM-HHMM (Day and Month, Hours and Minutes are combined) separated with hyphens(-) after every four characters having max length of 16 characters. Return the generated unique ID as a string. And assign this value to the {target_col} column. Ensure each ID must be unique. No duplicate ID(s).",
+                # Generated natively; the last block is random rather than HHMM so IDs are unique
+                "id_pattern": "{ClientId[-4:]}-{timestamp:%Y-%d%m}-{random:4}"
             }
             mapping_instructions.append(instruction)
         
@@ -133,11 +144,13 @@ def load_transformation_rules(rules_file_path):
             }
             mapping_instructions.append(instruction)
         
-        elif rule_type == 'X': #custom rule
+        elif rule_type == 'X': #custom rule, a date format change applied natively
             instruction = {
-                "type":"X",
+                "type":DATE_RULE_TYPE,
                 "source_column":source_col,
                 "target_column":target_col,
+                "source_format":"DD-MMM-YYYY",
+                "target_format":"YYYY/DD/MMM",
                 "instruction":"Change the date format from DD-MMM-YYYY to YYYY/DD/MMM. Do not modify the month abbreviation or convert it to a numeric format. Only rearrange the components of the date as specified."
             }
             mapping_instructions.append(instruction)
@@ -162,7 +175,7 @@ Your job is to transform the given input row using the provided structured trans
 
 ----------------------
 TRANSFORMATION RULES:
-{json.dumps(mapping_instructions, indent=2)}
+{serialization.dumps(mapping_instructions)}
 ----------------------
 
 RULE TYPES:
@@ -186,14 +199,14 @@ TRANSFORMATION INSTRUCTIONS:
 
 ----------------------
 INPUT ROW:
-{json.dumps(input_row, indent=2)}
+{serialization.dumps(input_row)}
 ----------------------
 
 Return all the transformed row(s) as a valid JSON object containing only the target columns from the transformation rules.
 
 """
 
-    response = model.invoke(prompt)
+    response = get_model().invoke(prompt)
     content = response.content.strip()
     start_index = content.find('{')
     end_index = content.rfind('}') + 1
@@ -203,7 +216,7 @@ Return all the transformed row(s) as a valid JSON object containing only the tar
         return {}
 
     try:
-        return json.loads(content[start_index:end_index])
+        return serialization.loads(content[start_index:end_index])
     except json.JSONDecodeError:
         print(f"Failed to decode AI response: {content}")
         return {}
@@ -213,15 +226,35 @@ def transform_excel(input_csv, mapping_excel):
     input_df = load_input_data(input_csv)
     mapping_instructions  = load_transformation_rules(mapping_excel)
 
+    # Date rules and IDs are computed for the whole column at once; only dates
+    # that don't match the format go to the model with the rest of their row
+    native_types = (DATE_RULE_TYPE, ID_RULE_TYPE)
+    native_rules = [rule for rule in map(compile_rule, mapping_instructions)
+                    if rule and rule["type"] in native_types and is_native(rule)]
+    native_targets = {rule["target_column"] for rule in native_rules}
+    model_rules = [i for i in mapping_instructions if i["target_column"] not in native_targets]
+    date_rules = [rule for rule in native_rules if rule["type"] == DATE_RULE_TYPE]
+    native_df = apply_rules(input_df, native_rules)
+    unparsed = {}
+    for rule in date_rules:
+        columns = referenced_columns(input_df, [rule])
+        if columns:
+            unparsed[rule["target_column"]] = unparsed_dates(input_df[columns[0]], native_df[rule["target_column"]])
+
     result_rows = []
 
-    for _, row in input_df.iterrows():
+    for position, (_, row) in enumerate(input_df.iterrows()):
         input_row = row.to_dict()
-        transformed_row = transform_row_with_ai(input_row, mapping_instructions)
+        row_rules = model_rules + [fallback_instruction(rule) for rule in date_rules
+                                   if rule["target_column"] in unparsed and unparsed[rule["target_column"]][position]]
+        transformed_row = transform_row_with_ai(input_row, row_rules) if row_rules else {}
         print(f"\nAI input:\n{json.dumps(input_row,indent=2)}\nAI output:\n{transformed_row}")
+        for target in native_df.columns:
+            if native_df[target].iat[position] is not None:
+                transformed_row[target] = native_df[target].iat[position]
         result_rows.append(transformed_row)
 
-    output_df = pd.DataFrame(result_rows)
+    output_df = pd.DataFrame(result_rows).reindex(columns=target_schema(compile_rules(mapping_instructions)))
 
 
     output_folder = "Output"
@@ -232,7 +265,8 @@ def transform_excel(input_csv, mapping_excel):
     print(f"\nTransformation complete. Output saved to: {output_file}")
 
 
-transform_excel('CIFINPUT/NF_CLIENT_24042025.csv', "CIFINPUT/TRANS_REL 3.xlsx")
+if __name__ == "__main__":
+    transform_excel('CIFINPUT/NF_CLIENT_24042025.csv', "CIFINPUT/TRANS_REL 3.xlsx")
 
 
 '''
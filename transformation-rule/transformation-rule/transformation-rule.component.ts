@@ -7,11 +7,14 @@ import { MatOptionModule } from '@angular/material/core';
 import { MatSelectModule } from '@angular/material/select';
 import { MatInputModule } from '@angular/material/input';
 import { MatDialog } from '@angular/material/dialog';
-import { HttpClient } from '@angular/common/http';
+import { HttpClient, HttpHeaders, HttpParams } from '@angular/common/http';
 import { ActivatedRoute, Router } from '@angular/router';
 import { BreadcrumbService } from '../breadcrumb.service';
 import { MessageDialogComponent } from '../../shared/message-dialog/message-dialog.component';
 import { MatIconModule } from '@angular/material/icon';
+import { switchMap, takeWhile, timer } from 'rxjs';
+
+const JOB_POLL_INTERVAL_MS = 2000;
 
 @Component({
   selector: 'app-transformation-rule',
@@ -40,6 +43,7 @@ export class TransformationRuleComponent {
   breadcrumbs: any;
   currentIndex: number = 0;
   sourceColumns: string[] = ['PersonInd'];
+  jobProgress: number | null = null;
 
   constructor(
     private dialog: MatDialog,
@@ -56,12 +60,18 @@ export class TransformationRuleComponent {
   }
 
   onSubmit() {
-    this.http.get('/').subscribe({
-      next: (res) => {
-        this.loader = false;
-        this.isNextDisabled = true;
-        this.openDialog('Success', 'Success! .');
-      },
+    this.loader = true;
+    this.jobProgress = null;
+    const body = new HttpParams()
+      .set('source_column', this.scourceColumn)
+      .set('target_column', this.targetColumnName)
+      .set('mapping', this.instructions);
+
+    // The backend queues the transformation and answers with a job id at once;
+    // the header asks for JSON instead of the page a plain form post gets
+    const headers = new HttpHeaders({ 'X-Requested-With': 'XMLHttpRequest' });
+    this.http.post<any>('/', body, { headers }).subscribe({
+      next: (job) => this.pollJob(job.status_url),
       error: (err) => {
         this.loader = false;
         this.isNextDisabled = false;
@@ -70,6 +80,33 @@ export class TransformationRuleComponent {
     });
   }
 
+  pollJob(statusUrl: string) {
+    timer(0, JOB_POLL_INTERVAL_MS)
+      .pipe(
+        switchMap(() => this.http.get<any>(statusUrl)),
+        takeWhile((job) => job.status === 'queued' || job.status === 'running', true)
+      )
+      .subscribe({
+        next: (job) => {
+          this.jobProgress = job.progress;
+          if (job.status === 'succeeded') {
+            this.loader = false;
+            this.isNextDisabled = true;
+            this.openDialog('Success', 'Success! .');
+          } else if (job.status === 'failed') {
+            this.loader = false;
+            this.isNextDisabled = false;
+            this.openDialog('Error', `Failed! ${job.error ?? 'Error'} .`);
+          }
+        },
+        error: (err) => {
+          this.loader = false;
+          this.isNextDisabled = false;
+          this.openDialog('Error', 'Failed! Error .');
+        },
+      });
+  }
+
   ngOnInit(): void {
     // const savedData = localStorage.getItem('breadcrumbData');
     const savedData = sessionStorage.getItem('breadcrumbData');
@@ -0,0 +1,52 @@
+"""
+Shared engine code for the transformation entry points.
+
+The Streamlit, Flask and batch scripts at the repository root each grew their
+own copy of rule handling and output assembly; the modules in this package hold
+the pieces they have in common.
+
+Importing the package is free of side effects and loads nothing heavy: the
+names below resolve to their module on first access, so a process that only
+compiles rules never imports pandas, and one that only runs native rules never
+imports Flask, Streamlit or a model client.
+"""
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    "compile_rules": "rules",
+    "compile_rule": "rules",
+    "target_schema": "rules",
+    "apply_rules": "native",
+    "is_native": "native",
+    "PartitionedExecutor": "executor",
+    "OutputBuilder": "output",
+    "CsvChunkWriter": "output",
+    "ProgressTracker": "progress",
+    "JobManager": "jobs",
+    "DatasetStore": "datasets",
+    "PreviewCache": "preview",
+    "preview_rules": "preview",
+    "stratified_sample": "sampling",
+    "profile_columns": "profiling",
+    "plan_strategies": "profiling",
+    "estimate_run": "estimate",
+    "DataTransformationEngine": "engine",
+    "reformat_dates": "dates",
+    "parse_operation": "strings",
+    "apply_operation": "strings",
+    "parse_conditional": "conditions",
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -0,0 +1,283 @@
+"""
+Command-line batch runner.
+
+    python -m transformation CIFINPUT/*.csv --workbook CIFINPUT/TRANS_ADRPART01.xlsx \
+        --format parquet --jobs 4 --cache-dir .transform-cache
+
+Every input file is run against every workbook. Input files are processed
+concurrently (``--jobs``) and each is loaded once for all workbooks; every
+input and workbook pair gets its own ``ProgressTracker`` whose counters go into
+a JSON manifest written at the end of the run:
+
+* per file: rows, status and error, duration, model calls, input and output
+  tokens, cache hits and misses (program cache lookups, rows answered by
+  another row's per-value call and rows reused from the delta index), and
+  failed rows
+* totals over all files, plus the arguments and timestamps of the run
+
+Manifests are plain JSON with sorted keys, so nightly runs can be diffed and
+compared run-over-run. The exit code is non-zero when any file failed.
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from . import ids, serialization
+from .datasets import DatasetStore
+from .delta import DeltaIndex, source_name
+from .programs import ProgramCache
+from .progress import ProgressTracker
+from .watermark import DATE_COLUMN, WatermarkStore
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ("csv", "parquet", "jsonl")
+ENGINES = ("azure", "native")
+
+# Tracker counters copied into each manifest entry and summed into the totals
+MANIFEST_COUNTERS = {
+    "model_calls": "calls_done",
+    "input_tokens": "input_tokens",
+    "output_tokens": "output_tokens",
+    "cache_hits": "cache_hits",
+    "cache_misses": "cache_misses",
+    "failed_rows": "rows_failed",
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m transformation",
+        description="Transform input files with the rules of one or more mapping workbooks.")
+    parser.add_argument("inputs", nargs="+", help="Input files or glob patterns")
+    parser.add_argument("-w", "--workbook", action="append", required=True,
+                        help="Rules workbook (Mapping and Transform sheets); repeat for several")
+    parser.add_argument("-o", "--output-dir", default="Output", help="Directory for results (default: Output)")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="csv", help="Output format")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Input files processed concurrently")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for native rules per file (default: CPU count)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Keep parsed inputs here so unchanged files are not re-parsed, the "
+                             "programs synthesized for custom rules so they are not asked for again, "
+                             "and the counters of generated IDs so later runs don't repeat them")
+    parser.add_argument("--delta", action="store_true",
+                        help="Only transform rows that changed since the last run of the same source "
+                             "(keyed by ClientId/TaxId); needs --cache-dir")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only load rows whose EffectiveDate is past the last successful load of the same "
+                             "source and workbook; needs --cache-dir")
+    parser.add_argument("--date-column", default=DATE_COLUMN,
+                        help=f"Effective date column for --incremental (default: {DATE_COLUMN})")
+    parser.add_argument("--date-format", default=None,
+                        help="Format of the effective dates, e.g. DD/MM/YYYY (default: detected per file)")
+    parser.add_argument("--engine", choices=ENGINES, default="azure",
+                        help="azure: call the model for rules that need it; native: skip those rules")
+    parser.add_argument("--delimiter", default="|", help="Input field delimiter (default: |)")
+    parser.add_argument("--manifest", default=None,
+                        help="Manifest path (default: <output-dir>/manifests/run-<timestamp>-<id>.json)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log debug messages")
+    return parser
+
+
+def expand_inputs(patterns: Sequence[str]) -> List[str]:
+    """Input paths for files and glob patterns, de-duplicated in argument order."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logger.warning(f"No input files match {pattern}")
+        paths.extend(matches)
+    return list(dict.fromkeys(paths))
+
+
+def output_name(input_path: str, workbook_path: str, output_format: str) -> str:
+    """``<input stem>__<workbook stem>.<format>``, unique per input and workbook pair."""
+    input_stem = os.path.splitext(os.path.basename(input_path))[0]
+    workbook_stem = os.path.splitext(os.path.basename(workbook_path))[0]
+    return f"{input_stem}__{workbook_stem}.{output_format}"
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run every input against every workbook and write the manifest.
+
+    Returns:
+        The manifest
+    """
+    from .engine import DataTransformationEngine
+
+    started_at = time.time()
+    run_id = new_run_id(started_at)
+    programs = ProgramCache(os.path.join(args.cache_dir, "programs.json")) if args.cache_dir else None
+    if args.cache_dir:
+        # Generated IDs continue after the previous run's instead of repeating them
+        ids.use_state(os.path.join(args.cache_dir, "ids.json"))
+    engine = DataTransformationEngine(max_workers=args.workers, program_cache=programs)
+    store = DatasetStore(root=os.path.join(args.cache_dir, "datasets")) if args.cache_dir else None
+    watermarks = WatermarkStore(os.path.join(args.cache_dir, "watermarks.json")) if args.incremental else None
+
+    # Each workbook is read once, not once per input file
+    rules = {}
+    failures = []
+    for workbook in dict.fromkeys(args.workbook):
+        try:
+            rules[workbook] = engine.load_transformation_rules(workbook)[0]
+        except Exception as e:
+            failures.append(_entry(None, workbook, None, None, "failed", str(e), 0.0))
+
+    inputs = expand_inputs(args.inputs)
+    if not inputs:
+        logger.warning("No input files to process")
+
+    def process(input_path):
+        return process_file(engine, input_path, rules, args.output_dir, args.format, delimiter=args.delimiter,
+                            use_model=args.engine != "native", store=store,
+                            delta_dir=os.path.join(args.cache_dir, "delta") if args.delta else None,
+                            watermarks=watermarks, date_column=args.date_column,
+                            date_format=args.date_format)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        files = failures + [entry for entries in pool.map(process, inputs) for entry in entries]
+
+    arguments = {key: value for key, value in vars(args).items() if key != "verbose"}
+    manifest = build_manifest(run_id, started_at, args.engine, arguments, files)
+    manifest["path"] = write_manifest(manifest, args.manifest
+                                      or os.path.join(args.output_dir, "manifests", f"run-{run_id}.json"))
+    return manifest
+
+
+def new_run_id(started_at: float) -> str:
+    return f"{datetime.fromtimestamp(started_at):%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+def build_manifest(run_id: str, started_at: float, engine: str, arguments: Dict[str, Any],
+                   files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Manifest of a run from its per-file entries (see ``process_file``)."""
+    totals = {key: sum(entry[key] for entry in files) for key in ("rows", *MANIFEST_COUNTERS)}
+    totals["files"] = len(files)
+    totals["failed_files"] = sum(1 for entry in files if entry["status"] != "ok")
+
+    finished_at = time.time()
+    return {
+        "run_id": run_id,
+        "started_at": datetime.fromtimestamp(started_at).isoformat(timespec="seconds"),
+        "finished_at": datetime.fromtimestamp(finished_at).isoformat(timespec="seconds"),
+        "duration_seconds": round(finished_at - started_at, 3),
+        "engine": engine,
+        "arguments": arguments,
+        "files": files,
+        "totals": totals,
+    }
+
+
+def write_manifest(manifest: Dict[str, Any], path: str) -> str:
+    """Write a manifest atomically; returns its path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(serialization.dumps_bytes(manifest))
+    os.replace(path + ".tmp", path)
+    logger.info(f"Manifest written to {path}")
+    return path
+
+
+def process_file(engine: Any, input_path: str, rules: Dict[str, List[Dict]], output_dir: str,
+                 output_format: str = "csv", delimiter: str = "|", use_model: bool = True,
+                 store: Optional[DatasetStore] = None, delta_dir: Optional[str] = None,
+                 watermarks: Optional[WatermarkStore] = None,
+                 date_column: str = DATE_COLUMN, date_format: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Transform one input with each workbook's rules.
+
+    Args:
+        engine: ``DataTransformationEngine`` shared between files
+        input_path: Input file
+        rules: Mapping instructions per workbook path
+        output_dir: Directory for results
+        output_format: One of ``OUTPUT_FORMATS``
+        delimiter: Input field delimiter
+        use_model: False to skip rules that need the model
+        store: Dataset store for parsed inputs
+        delta_dir: Keep a ``DeltaIndex`` per source and workbook here and only
+                   transform rows that changed since the previous run
+        watermarks: Only load rows whose ``date_column`` is past the watermark
+                    of the source and workbook, and advance it on success
+        date_column: Effective date column used with ``watermarks``
+        date_format: Format of its dates; detected when not given
+
+    Returns:
+        One manifest entry per workbook; failures are recorded there, not raised
+    """
+    started = time.time()
+    try:
+        input_df = engine.load_input_data(input_path, delimiter=delimiter, store=store)
+    except Exception as e:
+        logger.error(f"{input_path} could not be loaded: {e}")
+        return [_entry(input_path, workbook, None, None, "failed", str(e), time.time() - started)
+                for workbook in rules]
+
+    entries = []
+    for workbook, mapping_instructions in rules.items():
+        progress = ProgressTracker()
+        started = time.time()
+        workbook_stem = os.path.splitext(os.path.basename(workbook))[0]
+        delta = DeltaIndex(delta_dir, f"{source_name(input_path)}__{workbook_stem}") if delta_dir else None
+        watermark = None
+        if watermarks is not None:
+            watermark = watermarks.watermark(source_name(input_path), workbook_stem, date_column, date_format)
+        try:
+            output_path = engine.transform_frame(input_df, mapping_instructions, output_dir,
+                                                 output_name(input_path, workbook, output_format),
+                                                 progress=progress, use_model=use_model, delta=delta,
+                                                 watermark=watermark)
+            status, error = "ok", None
+            logger.info(f"{input_path} x {workbook} -> {output_path}")
+        except Exception as e:
+            output_path, status, error = None, "failed", str(e)
+            logger.error(f"{input_path} x {workbook} failed: {e}")
+        entries.append(_entry(input_path, workbook, output_path, progress, status, error, time.time() - started))
+    return entries
+
+
+def _entry(input_path: Optional[str], workbook: str, output_path: Optional[str],
+           progress: Optional[ProgressTracker], status: str, error: Optional[str],
+           duration: float) -> Dict[str, Any]:
+    snapshot = progress.snapshot() if progress is not None else {}
+    entry = {
+        "input": input_path,
+        "workbook": workbook,
+        "output": output_path,
+        "rows": snapshot.get("total") or 0,
+        "status": status,
+        "error": error,
+        "duration_seconds": round(duration, 3),
+    }
+    for key, counter in MANIFEST_COUNTERS.items():
+        entry[key] = snapshot.get(counter, 0)
+    return entry
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if (args.delta or args.incremental) and not args.cache_dir:
+        parser.error("--delta and --incremental need --cache-dir")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    manifest = run(args)
+    totals = manifest["totals"]
+    print(f"{totals['files'] - totals['failed_files']}/{totals['files']} files transformed, "
+          f"{totals['rows']} rows, {totals['model_calls']} model calls, {totals['failed_rows']} failed rows. "
+          f"Manifest: {manifest['path']}")
+    return 1 if totals["failed_files"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
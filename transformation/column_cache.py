@@ -0,0 +1,114 @@
+"""
+Per-target-column result cache.
+
+In the rule builders every rule is applied to the whole dataset again when one
+rule changes, although each target column only depends on the rules that write
+it and on the input. ``ColumnCache`` keeps finished output columns keyed by
+
+* the dataset key (``DatasetStore`` content hash of the upload), and
+* the canonical JSON of the compiled rules targeting that column
+
+so after an edit ``lookup`` returns every column whose rules are unchanged and
+names only the targets that need recomputing. Callers run those rules, ``put``
+the new columns and assemble the output from cached columns.
+
+A column is cached as a whole, so callers only ``put`` columns for which every
+row got a result; rows that failed are retried on the next run.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+
+from . import serialization
+from .rules import compile_rule, flatten_rules
+
+# Default memory budget: cached columns are dropped least recently used first
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ColumnCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            max_bytes: Approximate upper bound for the cached columns
+        """
+        self.max_bytes = max_bytes
+        self._columns = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(dataset_key: str, rules: List[Dict[str, Any]]) -> str:
+        """Cache key for the column written by ``rules`` (compiled) over a dataset."""
+        return serialization.fingerprint([dataset_key, rules])
+
+    def lookup(self, dataset_key: str,
+               rules: Union[List[Dict], Dict[str, Dict]]) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        """
+        Split a rule set into cached columns and targets to recompute.
+
+        Args:
+            dataset_key: Key of the input dataset
+            rules: Rules in any shape accepted by ``compile_rules``
+
+        Returns:
+            Tuple of (cached values per target column, target columns to compute)
+        """
+        cached, pending = {}, []
+        for target, plan in _rules_by_target(rules).items():
+            key = self.key(dataset_key, plan)
+            with self._lock:
+                values = self._columns.get(key)
+                if values is not None:
+                    self._columns.move_to_end(key)
+            if values is None:
+                pending.append(target)
+            else:
+                cached[target] = values
+        return cached, pending
+
+    def put(self, dataset_key: str, rules: Union[List[Dict], Dict[str, Dict]],
+            columns: Dict[str, Iterable[Any]]) -> None:
+        """
+        Store finished columns.
+
+        Args:
+            dataset_key: Key of the input dataset
+            rules: The rule set the columns were computed with
+            columns: Values per target column, for every row of the dataset
+        """
+        by_target = _rules_by_target(rules)
+        for target, values in columns.items():
+            if target not in by_target:
+                continue
+            values = np.asarray(values, dtype=object)
+            key = self.key(dataset_key, by_target[target])
+            with self._lock:
+                self._columns[key] = values
+                self._sizes[key] = values.nbytes
+                self._columns.move_to_end(key)
+                # Evict least recently used columns; the newest one always stays
+                while len(self._columns) > 1 and sum(self._sizes.values()) > self.max_bytes:
+                    evicted, _ = self._columns.popitem(last=False)
+                    self._sizes.pop(evicted)
+
+
+def select_rules(rules: Union[List[Dict], Dict[str, Dict]],
+                 targets: Iterable[str]) -> Union[List[Dict], Dict[str, Dict]]:
+    """The rules writing one of ``targets``, in the shape they were given."""
+    targets = set(targets)
+    if isinstance(rules, dict):
+        return {name: rule for name, rule in rules.items() if rule.get("target_column", name) in targets}
+    return [rule for rule in rules if rule.get("target_column") in targets]
+
+
+def _rules_by_target(rules: Union[List[Dict], Dict[str, Dict]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Compiled rules grouped by target column, in rule order."""
+    grouped = {}
+    for rule in flatten_rules(rules):
+        compiled = compile_rule(rule)
+        if compiled:
+            grouped.setdefault(compiled["target_column"], []).append(compiled)
+    return grouped
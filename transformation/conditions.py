@@ -0,0 +1,219 @@
+"""
+Conditional rules (rule type W).
+
+Mappings often depend on the kind of record, e.g. PersonInd Y vs N or
+CompanyType Individual vs Corporate, and the only way to say so used to be
+free text in an X rule sent to the model for every row. A W rule states it
+directly, in the Mapping sheet (``Parameter#2``) or a rule form::
+
+    when PersonInd == "Y" then O(FirstName) else D("Corporate")
+    when CompanyType in ("Corporate", "Trust") then S(Name, "upper")
+        else when CompanyType is empty then D("UNKNOWN") else O(Name)
+
+Branches are written ``TYPE(arguments)``: bare names are columns and quoted
+values are parameters:
+
+* ``O(Column)`` / ``R(Column)``: copy a column
+* ``D("value")``: a constant; ``D()`` is empty
+* ``T(Column)``: look the value up in the rule's mapping
+* ``S(Column, "operation")``: a string operation (see ``strings``)
+* ``F(Column, "source format", "target format")``: date reformatting (see ``dates``)
+* ``J(Column, Column, ..., "separator")``: join columns
+* ``X("instruction")``: free text for the model
+* another ``when ...`` expression
+
+A missing ``else`` yields an empty string. ``parse_conditional`` turns the
+text into ``{"when": condition, "then": rule, "else": rule}``; ``rules``
+compiles the branches like any other rule, and ``native`` evaluates the
+condition once per column into a boolean mask and selects between the branch
+columns. Only a rule with a branch that needs the model (e.g. X) is sent to
+it, as a whole.
+
+Parsing needs neither NumPy nor pandas, so compiling rules doesn't load them.
+"""
+import ast
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+CONDITIONAL_RULE_TYPE = "W"
+
+# Comparison operators; "=" and "<>" are accepted for "==" and "!="
+OPERATORS = ("is not empty", "is empty", "not in", "in", "==", "!=", ">=", "<=", ">", "<")
+OPERATOR_ALIASES = {"=": "==", "<>": "!="}
+NUMERIC_OPERATORS = (">=", "<=", ">", "<")
+
+_CONDITION = re.compile(
+    r'^\s*(?P<column>"[^"]+"|\'[^\']+\'|[^\s=!<>]+)\s*'
+    r"(?P<op>is\s+not\s+empty|is\s+empty|not\s+in|in|==|!=|<>|>=|<=|=|>|<)\s*(?P<value>.*?)\s*$",
+    flags=re.I | re.S)
+_BRANCH = re.compile(r"^\s*([A-Za-z])\s*\((.*)\)\s*$", flags=re.S)
+
+
+def parse_conditional(text: str) -> Dict[str, Any]:
+    """
+    Parse ``when <column> <op> <value> then <rule> [else <rule>]``.
+
+    Returns:
+        ``{"when": {"column", "op", "value"}, "then": rule, "else": rule or None}``
+        with the branches as uncompiled rule dicts
+
+    Raises:
+        ValueError: If the text doesn't follow the syntax
+    """
+    text = str(text).strip()
+    if not re.match(r"when\s", text, flags=re.I):
+        raise ValueError(f"A conditional rule starts with 'when': {text!r}")
+    condition, rest = _split_keyword(text[4:], "then")
+    if rest is None:
+        raise ValueError(f"Missing 'then' in {text!r}")
+    then_text, else_text = _split_keyword(rest, "else")
+    return {
+        "when": parse_condition(condition),
+        "then": parse_branch(then_text),
+        "else": parse_branch(else_text) if else_text is not None else None,
+    }
+
+
+def parse_condition(text: str) -> Dict[str, Any]:
+    """Parse ``<column> <op> <value>``."""
+    match = _CONDITION.match(text)
+    if not match:
+        raise ValueError(f"Not a condition: {text!r}")
+    column = _column_name(match.group("column"))
+    op = " ".join(match.group("op").lower().split())
+    op = OPERATOR_ALIASES.get(op, op)
+    raw = match.group("value")
+    if op in ("is empty", "is not empty"):
+        if raw:
+            raise ValueError(f"'{op}' takes no value: {text!r}")
+        value = None
+    elif op in ("in", "not in"):
+        value = [str(item) for item in _literal_list(raw)]
+    else:
+        value = _literal(raw)
+        if op in NUMERIC_OPERATORS and not isinstance(value, (int, float)):
+            raise ValueError(f"'{op}' compares with a number: {text!r}")
+    condition = {"column": column, "op": op, "value": value}
+    validate_condition(condition)
+    return condition
+
+
+def parse_branch(text: str) -> Dict[str, Any]:
+    """Parse one branch, e.g. ``O(FirstName)``, into an uncompiled rule dict."""
+    text = text.strip()
+    if re.match(r"when\s", text, flags=re.I):
+        return {"type": CONDITIONAL_RULE_TYPE, "condition": parse_conditional(text)}
+    match = _BRANCH.match(text)
+    if not match:
+        raise ValueError(f"A branch is written TYPE(arguments), e.g. O(Column) or D(\"value\"): {text!r}")
+    rule_type = match.group(1).upper()
+    args = [_argument(arg) for arg in _split_arguments(match.group(2))]
+    columns = [value for is_column, value in args if is_column]
+    values = [value for is_column, value in args if not is_column]
+
+    if rule_type in ("O", "R", "T") and len(columns) == 1 and not values:
+        return {"type": rule_type, "source_column": columns[0]}
+    if rule_type == "D" and len(args) <= 1:
+        # A constant, quoted or not
+        return {"type": "D", "default_value": str(args[0][1]) if args else ""}
+    if rule_type == "S" and columns and len(values) == 1:
+        return {"type": "S", "columns": columns, "operation": str(values[0])}
+    if rule_type == "F" and len(columns) == 1 and len(values) in (1, 2):
+        formats = {"target_format": str(values[-1])}
+        if len(values) == 2:
+            formats["source_format"] = str(values[0])
+        return {"type": "F", "source_column": columns[0], **formats}
+    if rule_type in ("J", "C") and columns and len(values) <= 1:
+        return {"type": rule_type, "columns": columns, "separator": str(values[0]) if values else " "}
+    if rule_type == "X" and len(values) == 1 and len(columns) <= 1:
+        return {"type": "X", "instruction": str(values[0]),
+                **({"source_column": columns[0]} if columns else {})}
+    raise ValueError(f"Unsupported arguments for a {rule_type} branch: {text!r}")
+
+
+def validate_condition(condition: Dict[str, Any]) -> None:
+    """
+    Check a condition dict.
+
+    Raises:
+        ValueError: Describing the problem
+    """
+    if not isinstance(condition, dict) or not condition.get("column"):
+        raise ValueError(f"A condition needs a column: {condition!r}")
+    op = OPERATOR_ALIASES.get(condition.get("op"), condition.get("op"))
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown operator {condition.get('op')!r}; use one of {', '.join(OPERATORS)}")
+    if op in ("in", "not in") and not isinstance(condition.get("value"), (list, tuple)):
+        raise ValueError(f"'{op}' needs a list of values: {condition!r}")
+
+
+def _split_keyword(text: str, keyword: str) -> Tuple[str, Optional[str]]:
+    """Split at the first ``keyword`` outside quotes and parentheses."""
+    depth, quote = 0, None
+    pattern = re.compile(rf"\s{keyword}\s", flags=re.I)
+    for position, char in enumerate(text):
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "\"'":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and pattern.match(text, position):
+            return text[:position].strip(), text[position + len(keyword) + 2:].strip()
+    return text.strip(), None
+
+
+def _split_arguments(text: str) -> List[str]:
+    """Split at commas outside quotes and parentheses."""
+    parts, depth, quote, current = [], 0, None, ""
+    for char in text:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "\"'":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current.strip() or parts:
+        parts.append(current)
+    return [part.strip() for part in parts]
+
+
+def _argument(text: str) -> Tuple[bool, Any]:
+    """``(is_column, value)`` for one branch argument."""
+    if text[:1] in "\"'" or re.fullmatch(r"-?\d+(\.\d+)?", text):
+        return False, _literal(text)
+    return True, _column_name(text)
+
+
+def _literal(text: str) -> Any:
+    """A quoted string or number, or the bare text itself."""
+    text = text.strip()
+    try:
+        value = ast.literal_eval(text)
+        if isinstance(value, (str, int, float)):
+            return value
+    except (ValueError, SyntaxError):
+        pass
+    return text
+
+
+def _literal_list(text: str) -> List[Any]:
+    text = text.strip()
+    if text[:1] in "([" and text[-1:] in ")]":
+        text = text[1:-1]
+    return [_literal(item) for item in _split_arguments(text) if item]
+
+
+def _column_name(text: str) -> str:
+    """Column name without quotes or a ``TABLE:`` prefix, as in the Mapping sheet."""
+    text = text.strip().strip("\"'")
+    return text.split(":", 1)[1].strip() if ":" in text else text
@@ -0,0 +1,135 @@
+"""
+Rule dependency graph and dataflow execution.
+
+Rules used to be applied as a flat list, each reading only the input. A rule
+may also read a column written by another rule, such as an A rule built from a
+transformed ClientId or a J rule over the output of T rules. ``rule_dependencies``
+finds those edges in a compiled plan:
+
+* a source column that exists in the input is read from the input
+* any other source column is read from the rules that write that target
+
+``topological_waves`` orders the rules in waves whose members only depend on
+earlier waves, and ``run_dataflow`` runs units of work on a thread pool as soon
+as everything they depend on has finished. A fast native rule downstream of
+another native rule therefore starts while slower model rules elsewhere in the
+graph are still in flight.
+"""
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Units of work run at the same time by ``run_dataflow``
+MAX_CONCURRENT_TASKS = 4
+
+
+def rule_dependencies(plan: List[Dict[str, Any]], input_columns: Optional[Iterable[str]] = None) -> List[Set[int]]:
+    """
+    Rules each rule reads from.
+
+    Args:
+        plan: Compiled rules
+        input_columns: Columns of the input; source columns found there are
+                       read from the input even if a rule also writes them
+
+    Returns:
+        For each rule, in plan order, the positions of the rules it depends on
+    """
+    inputs = {str(col).strip().lower() for col in (input_columns if input_columns is not None else [])}
+    writers = {}
+    for position, rule in enumerate(plan):
+        writers.setdefault(rule["target_column"].strip().lower(), set()).add(position)
+
+    dependencies = []
+    for position, rule in enumerate(plan):
+        needed = set()
+        for source in rule["source_columns"]:
+            source = source.strip().lower()
+            if source not in inputs:
+                needed |= writers.get(source, set())
+        needed.discard(position)
+        dependencies.append(needed)
+    return dependencies
+
+
+def topological_waves(dependencies: List[Set[int]], plan: Optional[List[Dict[str, Any]]] = None) -> List[List[int]]:
+    """
+    Group rules into waves; every rule only depends on rules of earlier waves.
+
+    Args:
+        dependencies: Output of ``rule_dependencies``
+        plan: Compiled rules, only used to name the rules of a cycle
+
+    Raises:
+        ValueError: If the rules depend on each other in a cycle
+    """
+    level = {}
+    remaining = set(range(len(dependencies)))
+    while remaining:
+        ready = sorted(i for i in remaining if all(d in level for d in dependencies[i]))
+        if not ready:
+            names = sorted(plan[i]["target_column"] for i in remaining) if plan else sorted(remaining)
+            raise ValueError(f"Rules depend on each other in a cycle: {names}")
+        for i in ready:
+            level[i] = 1 + max((level[d] for d in dependencies[i]), default=-1)
+        remaining -= set(ready)
+
+    waves = [[] for _ in range(max(level.values(), default=-1) + 1)]
+    for i in range(len(dependencies)):
+        waves[level[i]].append(i)
+    return waves
+
+
+def split_waves(waves: List[List[int]], n_native: int) -> List[List[int]]:
+    """
+    Split each wave into a group of native rules and a group of model rules.
+
+    Args:
+        waves: Output of ``topological_waves`` for a plan that lists its native rules first
+        n_native: Native rules at the start of the plan
+
+    Returns:
+        Non-empty groups of rule positions, in wave order, native group first
+    """
+    groups = []
+    for wave in waves:
+        for members in ([i for i in wave if i < n_native], [i for i in wave if i >= n_native]):
+            if members:
+                groups.append(members)
+    return groups
+
+
+def run_dataflow(tasks: Dict[Hashable, Callable[[], Any]], dependencies: Dict[Hashable, Set[Hashable]],
+                 max_workers: int = MAX_CONCURRENT_TASKS) -> Dict[Hashable, Any]:
+    """
+    Run tasks concurrently, each as soon as the tasks it depends on are done.
+
+    Args:
+        tasks: Callables by task key
+        dependencies: Keys of the tasks each task waits for
+        max_workers: Tasks running at the same time
+
+    Returns:
+        Result per task key
+
+    Raises:
+        Exception: The first exception raised by a task; tasks not yet started
+                   are not started
+    """
+    results = {}
+    running = {}
+    pending = set(tasks)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="rules") as pool:
+        while pending or running:
+            for key in sorted((k for k in pending if dependencies.get(k, set()) <= results.keys()), key=str):
+                running[pool.submit(tasks[key])] = key
+                pending.discard(key)
+            if not running:
+                raise ValueError(f"Tasks wait on each other or on unknown tasks: {sorted(map(str, pending))}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                results[key] = future.result()
+    return results
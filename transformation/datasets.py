@@ -0,0 +1,214 @@
+"""
+Upload-keyed store of parsed input datasets.
+
+The Flask apps used to read their CSV into a module-global ``csv_df`` at import
+time (and sometimes again per request), and one global dict held the upload for
+every user. ``DatasetStore`` replaces that:
+
+* datasets are keyed by the SHA-256 of the uploaded bytes, so the same file is
+  parsed once no matter how many users upload it
+* parsed frames are persisted in Arrow/Feather format (pickle when pyarrow is
+  missing or the frame can't be represented in Arrow) and reloaded from there
+  instead of re-parsing the CSV
+* frames are loaded lazily on first use and kept in an LRU cache bounded by
+  ``max_memory_bytes``
+* each session is bound to its own dataset key, so concurrent users never see
+  or overwrite each other's upload
+
+Frames returned by ``get`` are shared between callers; copy before mutating.
+"""
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+# pyarrow is imported on first read or write of a dataset, not on import
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MEMORY_BYTES = 512 * 1024 * 1024
+
+# Bytes per read when hashing a file on disk
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def content_key(data: bytes) -> str:
+    """Dataset key for raw upload bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_key(path: str) -> str:
+    """Dataset key for a file on disk, hashed without reading it all into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _dataset_key(content_hash: str, read_csv_kwargs: Dict[str, Any]) -> str:
+    """The same bytes parsed with different options are different datasets."""
+    if not read_csv_kwargs:
+        return content_hash
+    options = repr(sorted(read_csv_kwargs.items()))
+    return hashlib.sha256(f"{content_hash}:{options}".encode()).hexdigest()
+
+
+class DatasetStore:
+    def __init__(self, root: str = os.path.join("uploads", "datasets"),
+                 max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES):
+        """
+        Args:
+            root: Directory holding the persisted parsed datasets
+            max_memory_bytes: Upper bound for frames kept in memory
+        """
+        self.root = root
+        self.max_memory_bytes = max_memory_bytes
+        self._frames = OrderedDict()
+        self._sizes = {}
+        self._sessions = {}
+        self._path_keys = {}
+        self._key_locks = {}
+        self._lock = threading.RLock()
+
+    def put_bytes(self, data: bytes, session_id: Optional[str] = None, **read_csv_kwargs: Any) -> str:
+        """
+        Register uploaded CSV bytes, parsing them only if this content is new.
+
+        Args:
+            data: Raw CSV file contents
+            session_id: Bind the dataset to this session
+            read_csv_kwargs: Passed to ``pd.read_csv`` (e.g. ``delimiter='|'``)
+
+        Returns:
+            Dataset key
+        """
+        key = _dataset_key(content_key(data), read_csv_kwargs)
+        self._ensure(key, lambda: pd.read_csv(io.BytesIO(data), **read_csv_kwargs))
+        if session_id is not None:
+            self.bind(session_id, key)
+        return key
+
+    def put_path(self, path: str, session_id: Optional[str] = None, **read_csv_kwargs: Any) -> str:
+        """Register a CSV file on disk; see ``put_bytes``."""
+        # Skip re-hashing a file that hasn't changed since it was last registered
+        stat = os.stat(path)
+        signature = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, repr(sorted(read_csv_kwargs.items())))
+        with self._lock:
+            key = self._path_keys.get(signature)
+        if key is None:
+            key = _dataset_key(file_key(path), read_csv_kwargs)
+            with self._lock:
+                self._path_keys[signature] = key
+        self._ensure(key, lambda: pd.read_csv(path, **read_csv_kwargs))
+        if session_id is not None:
+            self.bind(session_id, key)
+        return key
+
+    def get(self, key: str) -> pd.DataFrame:
+        """
+        Parsed dataset for a key, loaded from disk on first use.
+
+        Raises:
+            KeyError: If no dataset with this key has been stored
+        """
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key]
+
+        path = self._persisted_path(key)
+        if not path:
+            raise KeyError(f"Unknown dataset {key}")
+        if path.endswith(".feather"):
+            import pyarrow.feather as feather
+            df = feather.read_feather(path)
+        else:
+            with open(path, "rb") as f:
+                df = pickle.load(f)
+        self._remember(key, df)
+        return df
+
+    def columns(self, key: str) -> List[str]:
+        return list(self.get(key).columns)
+
+    def bind(self, session_id: str, key: str) -> None:
+        """Make ``key`` the current dataset of a session."""
+        with self._lock:
+            self._sessions[session_id] = key
+
+    def session_key(self, session_id: str) -> Optional[str]:
+        """Dataset key bound to a session, if any."""
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def for_session(self, session_id: str) -> Optional[pd.DataFrame]:
+        """Dataset bound to a session, or None if the session has no upload yet."""
+        key = self.session_key(session_id)
+        return self.get(key) if key else None
+
+    def _persisted_path(self, key: str) -> Optional[str]:
+        for extension in (".feather", ".pkl"):
+            path = os.path.join(self.root, key + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _ensure(self, key: str, parse: Callable[[], pd.DataFrame]) -> None:
+        """Parse and persist a dataset unless it is stored already; concurrent uploads of it parse it once."""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if not self._persisted_path(key):
+                self._persist(key, parse())
+
+    def _persist(self, key: str, df: pd.DataFrame) -> None:
+        df = df.reset_index(drop=True)
+        os.makedirs(self.root, exist_ok=True)
+        if ARROW_AVAILABLE:
+            try:
+                import pyarrow.feather as feather
+                self._write(key, ".feather", lambda path: feather.write_feather(df, path))
+                self._remember(key, df)
+                return
+            except Exception as e:
+                logger.warning(f"Dataset {key[:12]} can't be stored as Feather, using pickle: {e}")
+
+        def dump(path: str) -> None:
+            with open(path, "wb") as f:
+                pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(key, ".pkl", dump)
+        self._remember(key, df)
+
+    def _write(self, key: str, extension: str, write: Callable[[str], None]) -> None:
+        """Write under a unique temporary name and rename, so readers never see partial files."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=key[:12] + ".", suffix=extension + ".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, os.path.join(self.root, key + extension))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _remember(self, key: str, df: pd.DataFrame) -> None:
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            self._frames[key] = df
+            self._sizes[key] = size
+            self._frames.move_to_end(key)
+            # Evict least recently used frames; the newest one always stays
+            while len(self._frames) > 1 and sum(self._sizes.values()) > self.max_memory_bytes:
+                evicted, _ = self._frames.popitem(last=False)
+                self._sizes.pop(evicted)
+                logger.info(f"Evicted dataset {evicted[:12]} from memory")
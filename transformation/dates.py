@@ -0,0 +1,190 @@
+"""
+Vectorized date reformatting (rule type F).
+
+Date rules such as "change the date format from DD-MMM-YYYY to YYYY/DD/MMM"
+used to go to the model row by row although they are fixed rearrangements.
+An F rule names both formats::
+
+    {"type": "F", "source_column": "BirthDate", "target_column": "BIRTH_DT",
+     "source_format": "DD-MMM-YYYY", "target_format": "YYYY/DD/MMM"}
+
+Formats use the tokens YYYY, YY, MMMM, MMM, MM, DD, HH, MI and SS, or
+``strftime`` directives when they contain ``%``. ``reformat_dates`` converts a
+whole column at once:
+
+* when the target only rearranges tokens of the source, each value is split
+  with one regular expression and reassembled, so the components (e.g. the
+  case of a month abbreviation) are kept exactly as they were; values are
+  still validated as real dates
+* otherwise the column is parsed once with the explicit format and formatted
+  with ``Series.dt.strftime``
+
+Without a ``source_format`` the format is detected from a sample of the
+column; detections are cached per column and sample. Values that don't parse
+come back as None (empty sources as ""), and ``fallback_instruction`` builds
+the equivalent X rule so callers can send just those values to the model.
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DATE_RULE_TYPE = "F"
+
+# Pattern tokens, longest first so MMMM is not read as MM + MM
+TOKENS = {
+    "YYYY": ("%Y", r"\d{4}"),
+    "MMMM": ("%B", r"[A-Za-z]+"),
+    "MMM": ("%b", r"[A-Za-z]{3}"),
+    "YY": ("%y", r"\d{2}"),
+    "MM": ("%m", r"\d{1,2}"),
+    "DD": ("%d", r"\d{1,2}"),
+    "HH": ("%H", r"\d{1,2}"),
+    "MI": ("%M", r"\d{1,2}"),
+    "SS": ("%S", r"\d{1,2}"),
+}
+_TOKEN_PATTERN = re.compile("|".join(TOKENS))
+
+# Formats tried, in order, when a rule has no source format
+CANDIDATE_FORMATS = (
+    "YYYY-MM-DD", "DD-MMM-YYYY", "DD/MM/YYYY", "MM/DD/YYYY", "DD-MM-YYYY", "DD.MM.YYYY",
+    "YYYY/MM/DD", "DDMMYYYY", "YYYYMMDD", "DD MMM YYYY", "DD-MMM-YY", "YYYY-MM-DD HH:MI:SS",
+)
+
+# Distinct values used to detect a format
+DETECTION_SAMPLE = 200
+
+
+def tokenize(pattern: str) -> List[Tuple[bool, str]]:
+    """Split a pattern into ``(is_token, text)`` parts."""
+    parts, position = [], 0
+    for match in _TOKEN_PATTERN.finditer(pattern):
+        if match.start() > position:
+            parts.append((False, pattern[position:match.start()]))
+        parts.append((True, match.group()))
+        position = match.end()
+    if position < len(pattern):
+        parts.append((False, pattern[position:]))
+    return parts
+
+
+def to_strftime(pattern: str) -> str:
+    """``strftime`` format of a pattern; patterns containing ``%`` are returned as they are."""
+    if "%" in pattern:
+        return pattern
+    return "".join(TOKENS[text][0] if is_token else text.replace("%", "%%") for is_token, text in tokenize(pattern))
+
+
+def detect_format(values: pd.Series, column: str = "") -> Optional[str]:
+    """
+    Format of a date column, from ``CANDIDATE_FORMATS``.
+
+    Returns:
+        The candidate that parses the most sampled values, or None if none does
+    """
+    sample = values.dropna().astype(str).str.strip()
+    sample = tuple(sample[sample != ""].drop_duplicates().head(DETECTION_SAMPLE))
+    if not sample:
+        return None
+    return _detect_format(column, sample)
+
+
+@lru_cache(maxsize=256)
+def _detect_format(column: str, sample: Tuple[str, ...]) -> Optional[str]:
+    values = pd.Series(sample, dtype=object)
+    best, best_count = None, 0
+    for pattern in CANDIDATE_FORMATS:
+        count = int(pd.to_datetime(values, format=to_strftime(pattern), errors="coerce").notna().sum())
+        if count > best_count:
+            best, best_count = pattern, count
+    logger.info(f"Detected date format {best} for column {column or '?'} "
+                f"({best_count}/{len(sample)} sampled values)")
+    return best
+
+
+def reformat_dates(values: pd.Series, target_format: str, source_format: Optional[str] = None,
+                   column: str = "", detect: bool = True) -> pd.Series:
+    """
+    Reformat a column of date strings.
+
+    Args:
+        values: Source values
+        target_format: Output pattern
+        source_format: Input pattern; detected from the values when not given
+        column: Column name, for the detection cache and log messages
+        detect: Detect a missing source format from ``values``; off when the
+                format was already detected on the whole column
+
+    Returns:
+        Reformatted values on the same index: "" for empty sources and None
+        for values that could not be parsed
+    """
+    text = values.astype(object).where(values.notna(), "").astype(str).str.strip()
+    empty = (text == "").to_numpy()
+    if not source_format and detect:
+        source_format = detect_format(values, column)
+    result = pd.Series(np.where(empty, "", None), index=values.index, dtype=object)
+    if not source_format:
+        logger.warning(f"No date format found for column {column or '?'}")
+        return result
+
+    parsed = pd.to_datetime(text.where(~empty), format=to_strftime(source_format), errors="coerce")
+    valid = parsed.notna().to_numpy().copy()
+    rearranged = _rearrange(text, source_format, target_format)
+    if rearranged is not None:
+        valid &= rearranged.notna().to_numpy()
+        result[valid] = rearranged[valid]
+    else:
+        result[valid] = parsed[valid].dt.strftime(to_strftime(target_format))
+
+    unparsed = int((~valid & ~empty).sum())
+    if unparsed:
+        logger.info(f"{unparsed} values of column {column or '?'} don't match {source_format}")
+    return result
+
+
+def _rearrange(text: pd.Series, source_format: str, target_format: str) -> Optional[pd.Series]:
+    """Target values built from the source's own components, or None if the target needs conversion."""
+    if "%" in source_format or "%" in target_format:
+        return None
+    source_parts = tokenize(source_format)
+    source_tokens = [part for is_token, part in source_parts if is_token]
+    target_parts = tokenize(target_format)
+    if len(set(source_tokens)) != len(source_tokens):
+        return None
+    if any(is_token and part not in source_tokens for is_token, part in target_parts):
+        return None
+
+    regex = "^" + "".join(f"(?P<{part}>{TOKENS[part][1]})" if is_token else re.escape(part)
+                          for is_token, part in source_parts) + "$"
+    components = text.str.extract(regex)
+    matched = components.notna().all(axis=1)
+    result = pd.Series("", index=text.index, dtype=object)
+    for is_token, part in target_parts:
+        result = result + (components[part].fillna("") if is_token else part)
+    return result.where(matched, None)
+
+
+def fallback_instruction(rule: Dict[str, Any]) -> Dict[str, Any]:
+    """X rule asking the model for the same conversion, for values that did not parse."""
+    params = rule["params"]
+    source_format = params.get("source_format") or "whatever format it is in"
+    return {
+        "type": "X",
+        "source_column": rule["source_columns"][0],
+        "target_column": rule["target_column"],
+        "instruction": params.get("instruction") or (
+            f"Change the date format from {source_format} to {params['target_format']}. "
+            f"Only rearrange the components of the date as specified."),
+    }
+
+
+def unparsed_dates(source: pd.Series, output: pd.Series) -> np.ndarray:
+    """Mask of rows whose source has a value that ``reformat_dates`` could not convert."""
+    present = source.notna() & (source.astype(str).str.strip() != "")
+    return (present & output.isna()).to_numpy()
@@ -0,0 +1,194 @@
+"""
+Change detection between daily snapshots.
+
+Most of a day's NF_CLIENT file is identical to the previous day's. A
+``DeltaIndex`` remembers, per source and workbook, a hash of every row's
+rule-relevant projection together with the output produced for it, keyed by
+the row's ClientId/TaxId. On the next run ``compare`` marks only rows that are
+new or whose projection changed; the engine transforms those and reuses the
+stored output for the rest, so a daily run costs in proportion to what changed
+rather than to the file size.
+
+* the projection is the input columns the rules read (every column when a
+  model rule reads whole rows), so edits to columns no rule uses don't count
+* hashes are 64-bit ``pd.util.hash_pandas_object`` values computed in one
+  vectorized pass; rows are matched by a hash of their key columns
+* the stored index is only used with the rules it was built with; any rule
+  change makes every row count as changed
+* rows with a duplicated key are always transformed, and rows that failed are
+  not stored, so they are retried on the next run
+* the output stored for a key outlives changes to its row: A rules keep the
+  ID issued for the key and only new keys get new IDs (see the engine)
+* the index is stored as JSON (hashes, outputs and the rules fingerprint are
+  plain values), so reading it never runs code from the cache directory
+"""
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import serialization
+from .executor import referenced_columns
+from .native import is_native
+
+logger = logging.getLogger(__name__)
+
+# Row identity columns, matched case-insensitively; the ones present are used together
+KEY_COLUMNS = ("clientid", "taxid")
+
+# Hash columns of the stored index; output columns are stored next to them
+KEY_HASH = "__key_hash"
+ROW_HASH = "__row_hash"
+
+_index_locks = defaultdict(threading.Lock)
+
+
+def source_name(path: str) -> str:
+    """
+    Source table of an input file: its name without extension and date suffix,
+    e.g. ``NF_CLIENT`` for ``NF_CLIENT_24042025.csv``.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r"[_-]?\d{6,8}$", "", stem) or stem
+
+
+def rules_fingerprint(plan: List[Dict[str, Any]]) -> str:
+    """SHA-256 of the canonical JSON of compiled rules."""
+    return serialization.fingerprint(plan)
+
+
+def key_columns(df: pd.DataFrame, candidates: Sequence[str] = KEY_COLUMNS) -> List[str]:
+    """Columns of ``df`` that identify a row, matched case-insensitively."""
+    wanted = {col.lower() for col in candidates}
+    return [col for col in df.columns if str(col).strip().lower() in wanted]
+
+
+def projection_columns(df: pd.DataFrame, plan: List[Dict[str, Any]]) -> List[str]:
+    """Input columns whose values can change the output of ``plan``."""
+    if any(not rule["source_columns"] for rule in plan if not is_native(rule)):
+        return list(df.columns)
+    return referenced_columns(df, plan)
+
+
+def row_hashes(df: pd.DataFrame, columns: Sequence[str]) -> np.ndarray:
+    """64-bit hash per row of ``columns``; equal values give equal hashes."""
+    if not len(columns):
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(df[list(columns)], index=False).to_numpy()
+
+
+class DeltaIndex:
+    def __init__(self, root: str, name: str, key_columns: Sequence[str] = KEY_COLUMNS):
+        """
+        Args:
+            root: Directory holding the stored indexes
+            name: Index name, unique per source and workbook (see ``source_name``)
+            key_columns: Candidate row identity columns
+        """
+        self.root = root
+        self.name = name
+        self.key_columns = tuple(key_columns)
+        self.path = os.path.join(root, f"{name}.json")
+
+    @property
+    def lock(self) -> threading.Lock:
+        """Held from ``compare`` to ``save`` so concurrent runs of one source don't interleave."""
+        return _index_locks[os.path.abspath(self.path)]
+
+    def compare(self, input_df: pd.DataFrame, plan: List[Dict[str, Any]]) -> Tuple[np.ndarray, pd.DataFrame]:
+        """
+        Find the rows that need to be transformed.
+
+        Args:
+            input_df: Today's input rows
+            plan: Compiled rules the input is run through
+
+        Returns:
+            Tuple of (boolean mask of new or changed rows, output stored for
+            each row's key aligned to ``input_df``). Changed rows get the
+            output of their key's earlier values, e.g. to keep its IDs; rows
+            of new or duplicated keys are null
+        """
+        keys = key_columns(input_df, self.key_columns)
+        changed = np.ones(len(input_df), dtype=bool)
+        previous = pd.DataFrame(index=pd.RangeIndex(len(input_df)))
+        if not keys:
+            logger.warning(f"No key column ({', '.join(self.key_columns)}) in input, transforming every row")
+            return changed, previous
+
+        stored = self._load(plan)
+        if stored is None or stored.empty:
+            return changed, previous
+
+        key_hash = row_hashes(input_df, keys)
+        row_hash = row_hashes(input_df, projection_columns(input_df, plan))
+        positions = pd.Index(stored[KEY_HASH]).get_indexer(key_hash)
+        duplicated = pd.Series(key_hash).duplicated(keep=False).to_numpy()
+        found = positions >= 0
+        same = np.zeros(len(input_df), dtype=bool)
+        same[found] = stored[ROW_HASH].to_numpy()[positions[found]] == row_hash[found]
+        changed = ~same | duplicated
+
+        outputs = stored.drop(columns=[KEY_HASH, ROW_HASH])
+        known = found & ~duplicated
+        previous = outputs.iloc[np.where(known, positions, 0)].reset_index(drop=True)
+        previous[~known] = None
+        logger.info(f"Delta {self.name}: {int(changed.sum())} of {len(input_df)} rows new or changed")
+        return changed, previous
+
+    def save(self, input_df: pd.DataFrame, output_df: pd.DataFrame, plan: List[Dict[str, Any]],
+             failed_df: Optional[pd.DataFrame] = None) -> None:
+        """
+        Store row hashes and outputs of a successful run.
+
+        Args:
+            input_df: Input rows that were transformed successfully
+            output_df: Their output rows, aligned to ``input_df``
+            plan: Compiled rules the rows were run through
+            failed_df: Input rows that failed; what an earlier run stored for
+                       their keys is kept, so their retry still finds their IDs
+        """
+        keys = key_columns(input_df, self.key_columns)
+        if not keys:
+            return
+        key_hash = row_hashes(input_df, keys)
+        unique = ~pd.Series(key_hash).duplicated(keep=False).to_numpy()
+        stored = output_df.reset_index(drop=True)[unique].reset_index(drop=True)
+        stored.insert(0, KEY_HASH, key_hash[unique])
+        stored.insert(1, ROW_HASH, row_hashes(input_df, projection_columns(input_df, plan))[unique])
+
+        earlier = self._load(plan) if failed_df is not None and len(failed_df) else None
+        if earlier is not None:
+            failed_keys = row_hashes(failed_df, key_columns(failed_df, self.key_columns))
+            kept = earlier[np.isin(earlier[KEY_HASH], failed_keys) & ~np.isin(earlier[KEY_HASH], stored[KEY_HASH])]
+            stored = pd.concat([stored, kept.reindex(columns=stored.columns)], ignore_index=True)
+
+        os.makedirs(self.root, exist_ok=True)
+        payload = {"rules": rules_fingerprint(plan), "columns": list(stored.columns),
+                   "rows": stored.to_dict(orient="list")}
+        with open(self.path + ".tmp", "wb") as f:
+            f.write(serialization.dumps_bytes(payload))
+        os.replace(self.path + ".tmp", self.path)
+        logger.info(f"Delta {self.name}: stored {len(stored)} row hashes")
+
+    def _load(self, plan: List[Dict[str, Any]]) -> Optional[pd.DataFrame]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                stored = serialization.loads(f.read())
+            rows = pd.DataFrame(stored["rows"], columns=stored["columns"], dtype=object)
+            rows[KEY_HASH] = rows[KEY_HASH].astype(np.uint64)
+            rows[ROW_HASH] = rows[ROW_HASH].astype(np.uint64)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Delta index {self.path} can't be read, transforming every row: {e}")
+            return None
+        if stored["rules"] != rules_fingerprint(plan):
+            logger.info(f"Delta {self.name}: rules changed since the last run, transforming every row")
+            return None
+        return rows
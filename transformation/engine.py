@@ -0,0 +1,898 @@
+"""
+Batch transformation engine.
+
+``DataTransformationEngine`` loads a pipe-delimited input file and a rules
+workbook (Mapping and Transform sheets), runs deterministic rules natively and
+sends the rest to Azure OpenAI, choosing per rule whether to call the model per
+distinct value or per batch of rows. tr.py and the command-line runner
+(``python -m transformation``) are thin wrappers around it.
+"""
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import serialization
+from .datasets import DatasetStore
+from .dag import rule_dependencies, run_dataflow, split_waves, topological_waves
+from .dates import DATE_RULE_TYPE, fallback_instruction, unparsed_dates
+from .delta import DeltaIndex
+from .watermark import Watermark
+from .estimate import DEFAULT_SECONDS_PER_CALL, estimate_run, format_estimate
+from .executor import PartitionedExecutor, referenced_columns
+from .id_patterns import ID_RULE_TYPE
+from .native import apply_rules, is_native
+from .output import OutputBuilder
+from .preview import parse_batch_response
+from .profiling import PER_VALUE, group_model_calls
+from .programs import ProgramCache, is_candidate, synthesize_program
+from .progress import ProgressTracker
+from .rules import compile_rule
+
+logger = logging.getLogger(__name__)
+
+
+class DataTransformationEngine:
+    def __init__(self, azure_config: Optional[Dict[str, str]] = None, max_workers: int = None,
+                 program_cache: Optional[ProgramCache] = None):
+        """
+        Initialize the AI-powered data transformation engine.
+        
+        Args:
+            azure_config: Dictionary containing Azure OpenAI configuration; when
+                          omitted the AZURE_OPENAI_* environment variables are used
+            max_workers: Worker processes for native rules (defaults to CPU count)
+            program_cache: Programs synthesized for X rules; kept in memory when omitted
+        """
+        self.azure_config = azure_config or {}
+        self.max_workers = max_workers
+        self.program_cache = program_cache or ProgramCache()
+        self._model = None
+        
+    @property
+    def model(self) -> "AzureChatOpenAI":
+        """Azure OpenAI client, created on first use so native-only runs and dry runs never load it."""
+        if self._model is None:
+            self._model = self._setup_azure_openai(self.azure_config)
+        return self._model
+        
+    def _setup_azure_openai(self, config: Dict[str, str]) -> "AzureChatOpenAI":
+        """Setup Azure OpenAI client with provided configuration."""
+        from langchain_openai import AzureChatOpenAI
+        
+        for key, value in config.items():
+            os.environ[key] = value
+            
+        return AzureChatOpenAI(
+            openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+            azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+            temperature=0.0
+        )
+
+    def _invoke(self, prompt: str, progress: Optional[ProgressTracker] = None) -> Any:
+        """Call the model, recording the call and its reported token usage on ``progress``."""
+        if progress is None:
+            return self.model.invoke(prompt)
+        progress.call_started()
+        try:
+            response = self.model.invoke(prompt)
+        finally:
+            progress.call_finished()
+        input_tokens, output_tokens = _token_usage(response)
+        if input_tokens or output_tokens:
+            progress.record_tokens(input_tokens, output_tokens)
+        return response
+
+    def load_input_data(self, input_file_path: str, delimiter: str = '|',
+                        store: Optional[DatasetStore] = None) -> pd.DataFrame:
+        """
+        Load input CSV data with pipe delimiter and normalize column names.
+        
+        Args:
+            input_file_path: Path to input CSV file
+            delimiter: Field delimiter of the input file
+            store: Parse the file through this store, so an unchanged file is
+                   reloaded from its persisted copy instead of re-parsed
+            
+        Returns:
+            DataFrame with normalized column names
+        """
+        try:
+            if store is not None:
+                df = store.get(store.put_path(input_file_path, delimiter=delimiter)).copy()
+            else:
+                df = pd.read_csv(input_file_path, delimiter=delimiter)
+            df.columns = df.columns.str.lower().str.strip()
+            logger.info(f"Loaded input data: {len(df)} rows, {len(df.columns)} columns")
+            return df
+        except Exception as e:
+            logger.error(f"Error loading input data: {e}")
+            raise
+
+    def load_transformation_rules(self, rules_file_path: str) -> Tuple[List[Dict], Dict[str, Dict]]:
+        """
+        Load transformation rules from Excel file with enhanced error handling.
+        
+        Args:
+            rules_file_path: Path to Excel file containing transformation rules
+            
+        Returns:
+            Tuple of (mapping_instructions, transformation_dict)
+        """
+        try:
+            # Load mapping sheet
+            mapping_df = pd.read_excel(rules_file_path, engine='openpyxl', sheet_name='Mapping')
+            
+            # Load transform sheet
+            transform_df = pd.read_excel(rules_file_path, engine='openpyxl', sheet_name='Transform')
+            transform_df = transform_df.dropna(how='any')
+            
+            # Clean transformed values
+            if 'Transformed Value' in transform_df.columns:
+                transform_df['Transformed Value'] = transform_df['Transformed Value'].astype(str).str.replace('\xa0', '', regex=False)
+            
+            # Filter valid rows
+            required_cols = ["MapName", 'Map Criteria#1', 'Transformed Value']
+            transform_df = transform_df.dropna(subset=required_cols)
+            
+            # Build transformation dictionary
+            transformation_dict = self._build_transformation_dict(transform_df)
+            
+            # Build mapping instructions
+            mapping_instructions = self._build_mapping_instructions(mapping_df, transformation_dict)
+            
+            logger.info(f"Loaded {len(mapping_instructions)} transformation rules")
+            logger.info(f"Loaded {len(transformation_dict)} transformation mappings")
+            
+            return mapping_instructions, transformation_dict
+            
+        except Exception as e:
+            logger.error(f"Error loading transformation rules: {e}")
+            raise
+
+    def _build_transformation_dict(self, transform_df: pd.DataFrame) -> Dict[str, Dict]:
+        """Build transformation dictionary from transform sheet."""
+        transformation_dict = {}
+        
+        for map_name in transform_df['MapName'].unique():
+            group_df = transform_df[transform_df['MapName'] == map_name]
+            inner_dict = dict(zip(group_df['Map Criteria#1'], group_df['Transformed Value']))
+            transformation_dict[map_name] = inner_dict
+            
+        return transformation_dict
+
+    def _build_mapping_instructions(self, mapping_df: pd.DataFrame, transformation_dict: Dict) -> List[Dict]:
+        """Build mapping instructions from mapping sheet."""
+        mapping_instructions = []
+        
+        for _, row in mapping_df.iterrows():
+            source_col_raw = row.get('Parameter#1', None)
+            rule_type = row.get('Transformation Type', None)
+            target_col = row.get('STG_Column_Name', None)
+            parameter = row.get('Parameter#2', None)
+            
+            # Skip invalid rows
+            if pd.isna(rule_type) or pd.isna(target_col):
+                continue
+                
+            # Extract substring after colon if present
+            source_col = self._extract_source_column(source_col_raw)
+            
+            # Build instruction based on rule type
+            instruction = self._build_instruction(rule_type, source_col, target_col, transformation_dict,
+                                                  None if pd.isna(parameter) else str(parameter).strip())
+            
+            if instruction:
+                mapping_instructions.append(instruction)
+                
+        return mapping_instructions
+
+    def _extract_source_column(self, source_col_raw: Any) -> str:
+        """Extract source column name from raw parameter value."""
+        if isinstance(source_col_raw, str) and ':' in source_col_raw:
+            return source_col_raw.split(':', 1)[1].strip()
+        return str(source_col_raw) if source_col_raw is not None else ""
+
+    def _build_instruction(self, rule_type: str, source_col: str, target_col: str, 
+                          transformation_dict: Dict, parameter: Optional[str] = None) -> Dict[str, Any]:
+        """Build individual transformation instruction; ``parameter`` is the Parameter#2 cell."""
+        rule_type = rule_type.upper().strip()
+        
+        if rule_type == 'D':
+            return {
+                "type": "D",
+                "default_value": source_col,
+                "target_column": target_col,
+                "description": f"Set {target_col} to default value: {source_col}"
+            }
+            
+        elif rule_type == 'O':
+            return {
+                "type": "O",
+                "source_column": source_col,
+                "target_column": target_col,
+                "description": f"Copy {source_col} to {target_col}"
+            }
+            
+        elif rule_type == 'T':
+            return {
+                "type": "T",
+                "source_column": source_col,
+                "target_column": target_col,
+                "mapping": transformation_dict,
+                "description": f"Transform {source_col} to {target_col} using mapping dictionary"
+            }
+            
+        elif rule_type == 'A':
+            # Parameter#2 may hold an ID pattern, e.g. {ClientId[:4]}{random:4},
+            # generated natively and unique across rows (see ``ids``); without
+            # one the model generates the ID as before
+            return {
+                "type": "A",
+                "source_column": source_col,
+                "target_column": target_col,
+                "auto_generated_rule": f"Generate a random alphanumeric string with a maximum length of 8 characters. The first 4 characters should be extracted from the value in the {source_col} column. The remaining characters should be randomly generated to complete the string. Assign the final string to the {target_col} column.",
+                **({"id_pattern": parameter} if parameter else {}),
+                "description": f"Auto-generate {target_col} based on {source_col}"
+            }
+            
+        elif rule_type == 'S':
+            # Parameter#2 holds the string operation, e.g. pad_left(10, "0");
+            # Parameter#1 may list several columns joined with '+' for concat
+            if not parameter:
+                logger.warning(f"S rule for {target_col} has no operation in Parameter#2")
+                return None
+            sources = [self._extract_source_column(part) for part in source_col.split('+')]
+            return {
+                "type": "S",
+                "columns": sources,
+                "target_column": target_col,
+                "operation": parameter,
+                "description": f"Apply {parameter} to {' + '.join(sources)} into {target_col}"
+            }
+            
+        elif rule_type == 'W':
+            # Parameter#2 holds the condition, e.g.
+            # when PersonInd == "Y" then O(FirstName) else D("Corporate")
+            if not parameter:
+                logger.warning(f"W rule for {target_col} has no condition in Parameter#2")
+                return None
+            return {
+                "type": "W",
+                "target_column": target_col,
+                "condition": parameter,
+                "mapping": transformation_dict,
+                "description": f"Set {target_col} {parameter}"
+            }
+            
+        else:
+            logger.warning(f"Unknown rule type: {rule_type}")
+            return None
+
+    def transform_row_with_ai(self, input_row: Dict[str, Any], mapping_instructions: List[Dict],
+                              progress: Optional[ProgressTracker] = None) -> Dict[str, Any]:
+        """
+        Transform a single row using AI with enhanced prompt and error handling.
+        
+        Args:
+            input_row: Dictionary representing a single row of data
+            mapping_instructions: List of transformation rules
+            progress: Optional tracker that receives the call and its token usage
+            
+        Returns:
+            Transformed row as dictionary
+        """
+        if not input_row:
+            return {}
+
+        prompt = self._build_transformation_prompt(input_row, mapping_instructions)
+        
+        try:
+            response = self._invoke(prompt, progress)
+            content = response.content.strip()
+            
+            # Extract JSON from response
+            transformed_row = self._extract_json_from_response(content)
+            
+            if not transformed_row:
+                logger.warning(f"Failed to transform row: {input_row}")
+                return {}
+                
+            return transformed_row
+            
+        except Exception as e:
+            logger.error(f"Error transforming row: {e}")
+            return {}
+
+    def transform_rows_with_ai(self, input_rows: List[Dict[str, Any]], mapping_instructions: List[Dict],
+                               progress: Optional[ProgressTracker] = None) -> List[Dict[str, Any]]:
+        """
+        Transform several rows with one model call.
+        
+        Falls back to one call per row if the batched answer can't be used.
+        
+        Returns:
+            One transformed row per input row ({} for rows that failed)
+        """
+        if len(input_rows) == 1:
+            return [self.transform_row_with_ai(input_rows[0], mapping_instructions, progress)]
+        
+        prompt = self._build_batch_prompt(input_rows, mapping_instructions)
+        try:
+            response = self._invoke(prompt, progress)
+            results = parse_batch_response(response.content.strip(), len(input_rows))
+            return [result if isinstance(result, dict) else {} for result in results]
+        except Exception as e:
+            logger.warning(f"Batched transformation failed, retrying row by row: {e}")
+            return [self.transform_row_with_ai(input_row, mapping_instructions, progress) for input_row in input_rows]
+
+    def _build_batch_prompt(self, input_rows: List[Dict[str, Any]], mapping_instructions: List[Dict]) -> str:
+        """Build the transformation prompt for several rows at once."""
+        return f"""
+You are a precise data transformation engine. Your task is to transform each of the given input rows using the provided transformation rules.
+
+TRANSFORMATION RULES:
+{serialization.dumps(mapping_instructions)}
+
+RULE TYPES EXPLAINED:
+- 'D' (Default): Replace with the specified default value
+- 'O' (One-to-One): Copy source column value directly to target column
+- 'T' (Transform): Use the mapping dictionary to transform values. Find the appropriate mapping by column context.
+- 'A' (Auto-Generate): Generate values according to the specified pattern
+
+CRITICAL INSTRUCTIONS:
+1. Apply transformations exactly as specified, to every row independently
+2. Use the target column names from the rules
+3. If a value is not found in mapping or source is empty, use empty string ""
+4. Only include transformed columns in the output
+
+INPUT ROWS:
+{serialization.dumps(input_rows)}
+
+OUTPUT REQUIREMENTS:
+- Return ONLY a valid JSON array with exactly {len(input_rows)} objects, one per input row, in the same order
+- Use exact target column names from the transformation rules
+
+JSON OUTPUT:
+"""
+
+    def _build_transformation_prompt(self, input_row: Dict[str, Any], mapping_instructions: List[Dict]) -> str:
+        """Build comprehensive transformation prompt for AI."""
+        return f"""
+You are a precise data transformation engine. Your task is to transform the given input row using the provided transformation rules.
+
+TRANSFORMATION RULES:
+{serialization.dumps(mapping_instructions)}
+
+RULE TYPES EXPLAINED:
+- 'D' (Default): Replace with the specified default value
+- 'O' (One-to-One): Copy source column value directly to target column
+- 'T' (Transform): Use the mapping dictionary to transform values. Find the appropriate mapping by column context.
+- 'A' (Auto-Generate): Generate values according to the specified pattern
+
+CRITICAL INSTRUCTIONS:
+1. Apply transformations exactly as specified
+2. Use the target column names from the rules
+3. For 'T' type rules, search through the mapping dictionary to find the appropriate transformation
+4. If a value is not found in mapping or source is empty, use empty string ""
+5. For 'A' type rules, follow the auto-generation pattern precisely
+6. Only include transformed columns in the output
+7. Ensure all target columns from the rules are present in the output
+
+INPUT ROW DATA:
+{serialization.dumps(input_row)}
+
+OUTPUT REQUIREMENTS:
+- Return ONLY a valid JSON object
+- Use exact target column names from the transformation rules
+- Include all target columns specified in the rules
+- Use empty string "" for missing or unmappable values
+
+JSON OUTPUT:
+"""
+
+    def _extract_json_from_response(self, content: str) -> Dict[str, Any]:
+        """Extract JSON object from AI response with multiple fallback strategies."""
+        # Try to find JSON block
+        json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
+        if json_match:
+            try:
+                return serialization.loads(json_match.group(1))
+            except json.JSONDecodeError:
+                pass
+        
+        # Try to find JSON object directly
+        start_index = content.find('{')
+        end_index = content.rfind('}') + 1
+        
+        if start_index != -1 and end_index != -1:
+            try:
+                json_str = content[start_index:end_index]
+                return serialization.loads(json_str)
+            except json.JSONDecodeError:
+                pass
+        
+        logger.error(f"Could not extract valid JSON from AI response: {content}")
+        return {}
+
+    def transform_data(self, input_csv_path: str, mapping_excel_path: str, 
+                      output_folder: str = "Output", progress: ProgressTracker = None) -> str:
+        """
+        Main transformation method that processes the entire dataset.
+        
+        Args:
+            input_csv_path: Path to input CSV file
+            mapping_excel_path: Path to Excel file with transformation rules
+            output_folder: Output directory for results
+            progress: Optional tracker that receives row, call and ETA updates
+            
+        Returns:
+            Path to output file
+        """
+        progress = progress or ProgressTracker()
+        try:
+            # Load input data and transformation rules
+            input_df = self.load_input_data(input_csv_path)
+            mapping_instructions, transformation_dict = self.load_transformation_rules(mapping_excel_path)
+        except Exception as e:
+            progress.finish(error=str(e))
+            raise
+        return self.transform_frame(input_df, mapping_instructions, output_folder, progress=progress)
+
+    def transform_frame(self, input_df: pd.DataFrame, mapping_instructions: List[Dict],
+                        output_folder: str = "Output", output_name: str = "mapped_output_file.csv",
+                        progress: ProgressTracker = None, use_model: bool = True,
+                        delta: Optional[DeltaIndex] = None, watermark: Optional[Watermark] = None) -> Optional[str]:
+        """
+        Transform already loaded input rows and save the result.
+        
+        Args:
+            input_df: Input rows with normalized column names
+            mapping_instructions: Rules as returned by ``load_transformation_rules``
+            output_folder: Output directory for results
+            output_name: Output file name; its extension picks the format
+                         (``.csv``, ``.parquet`` or ``.jsonl``)
+            progress: Optional tracker that receives row, call, token and ETA updates
+            use_model: Run only the native rules and skip those that need the model
+            delta: Transform only rows that are new or changed since the run
+                   stored in this index, reusing its output for the others
+            watermark: Only load rows effective after this watermark and advance
+                       it once the output is saved
+            
+        Returns:
+            Path to output file, or None when no row is past the watermark
+        """
+        progress = progress or ProgressTracker()
+        try:
+            if watermark is not None:
+                input_df, dates = watermark.filter(input_df)
+                if input_df.empty:
+                    logger.info("No rows past the watermark, nothing to load")
+                    progress.set_total(0)
+                    progress.finish()
+                    return None
+            
+            # Log transformation summary
+            logger.info(f"Processing {len(input_df)} rows with {len(mapping_instructions)} transformation rules")
+            progress.set_total(len(input_df))
+            
+            native_rules, ai_instructions = self._split_rules(mapping_instructions)
+            if ai_instructions and not use_model:
+                logger.warning(f"Skipping {len(ai_instructions)} rules that need the model: "
+                               f"{[instruction.get('target_column') for instruction in ai_instructions]}")
+                ai_instructions = []
+            if ai_instructions and len(input_df):
+                program_rules, ai_instructions = self._compile_programs(input_df, ai_instructions, progress)
+                native_rules = native_rules + program_rules
+            
+            if delta is not None:
+                output_df, succeeded = self._transform_delta(input_df, mapping_instructions, native_rules,
+                                                             ai_instructions, progress, delta, use_model)
+            else:
+                output_df, succeeded = self._transform_rows(input_df, mapping_instructions, native_rules,
+                                                            ai_instructions, progress, use_model)
+                output_df = output_df[succeeded].reset_index(drop=True)
+            
+            # Save results
+            output_path = self._save_results(output_df, output_folder, output_name)
+            if watermark is not None:
+                # Failed rows hold the watermark back so they are loaded again
+                watermark.advance(watermark.loaded_until(dates, succeeded))
+            
+            logger.info(f"Transformation complete. Processed {len(output_df)}/{len(input_df)} rows successfully")
+            progress.finish()
+            return output_path
+            
+        except Exception as e:
+            logger.error(f"Error during transformation: {e}")
+            progress.finish(error=str(e))
+            raise
+
+    def _transform_rows(self, input_df: pd.DataFrame, mapping_instructions: List[Dict], native_rules: List[Dict],
+                        ai_instructions: List[Dict], progress: ProgressTracker,
+                        use_model: bool = True) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Run native rules and model instructions over ``input_df``.
+        
+        Rules that read other rules' target columns run as a dependency graph
+        (see ``_transform_graph``); otherwise native rules run first, then the model.
+        
+        Returns:
+            Tuple of (output rows aligned to ``input_df``, mask of the rows for which no model rule failed)
+        """
+        plan = native_rules + [compile_rule(instruction) for instruction in ai_instructions]
+        dependencies = rule_dependencies(plan, input_df.columns)
+        if any(dependencies) and len(input_df):
+            return self._transform_graph(input_df, mapping_instructions, plan, dependencies,
+                                         native_rules, ai_instructions, progress, use_model)
+        
+        output = OutputBuilder.from_rules(mapping_instructions, len(input_df))
+        
+        # Deterministic rules run vectorized across a process pool
+        if native_rules and len(input_df):
+            native_df = PartitionedExecutor(native_rules, max_workers=self.max_workers).run(input_df)
+            if use_model:
+                self._date_fallback(input_df, native_rules, native_df, progress)
+            for column in native_df.columns:
+                output.set_column(column, native_df[column])
+            logger.info(f"Applied {len(native_rules)} rules natively")
+        
+        if not ai_instructions or not len(input_df):
+            progress.row_done(len(input_df))
+            return output.to_frame(), np.ones(len(input_df), dtype=bool)
+        
+        self._transform_model(input_df, ai_instructions, output, progress)
+        return output.to_frame(), output.succeeded
+
+    def _transform_model(self, input_df: pd.DataFrame, ai_instructions: List[Dict], output: OutputBuilder,
+                         progress: ProgressTracker, count_rows: bool = True) -> None:
+        """Run model instructions over ``input_df`` with a strategy per rule, writing into ``output``."""
+        # Profile the columns the model rules read and pick a strategy per rule:
+        # one call per distinct value where values repeat, batches of rows otherwise
+        groups = group_model_calls([compile_rule(instruction) for instruction in ai_instructions], input_df)
+        batched = False
+        for group in groups:
+            instructions = [ai_instructions[i] for i in group["rules"]]
+            if group["strategy"] == PER_VALUE:
+                self._transform_per_value(input_df, instructions, group["strategies"], output, progress)
+            else:
+                self._transform_batches(input_df, instructions, group["strategies"], output, progress, count_rows)
+                batched = True
+        if count_rows and not batched:
+            progress.row_done(len(input_df))
+
+    def _transform_graph(self, input_df: pd.DataFrame, mapping_instructions: List[Dict], plan: List[Dict],
+                         dependencies: List[set], native_rules: List[Dict], ai_instructions: List[Dict],
+                         progress: ProgressTracker, use_model: bool = True) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Run rules in dependency order, independent groups concurrently.
+        
+        Each topological wave is split into a native group and a model group;
+        a group starts as soon as the groups writing the columns it reads are
+        done, with those columns added to its input. Native groups run in the
+        dataflow's threads, without a process pool.
+        """
+        n_native = len(native_rules)
+        waves = topological_waves(dependencies, plan)
+        groups = split_waves(waves, n_native)
+        group_of = {i: g for g, members in enumerate(groups) for i in members}
+        group_dependencies = {g: {group_of[d] for i in members for d in dependencies[i]}
+                              for g, members in enumerate(groups)}
+        logger.info(f"Running {len(plan)} rules as a dependency graph: {len(waves)} waves, {len(groups)} groups")
+        
+        results = {}
+        
+        def run_group(g: int) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+            members = groups[g]
+            resolved = {}
+            for d in sorted(set().union(*(dependencies[i] for i in members))):
+                target = plan[d]["target_column"]
+                resolved[target] = results[group_of[d]][0][target]
+            frame = input_df.assign(**resolved)
+            if members[0] < n_native:
+                # In-process: starting a process pool from one of the dataflow's
+                # threads would fork a multithreaded process and oversubscribe the CPUs
+                native_df = apply_rules(frame, [plan[i] for i in members])
+                if use_model:
+                    self._date_fallback(frame, [plan[i] for i in members], native_df, progress)
+                return ({col: native_df[col].to_numpy(dtype=object) for col in native_df.columns},
+                        np.ones(len(frame), dtype=bool))
+            instructions = [ai_instructions[i - n_native] for i in members]
+            output = OutputBuilder.from_rules(instructions, len(frame))
+            self._transform_model(frame, instructions, output, progress, count_rows=False)
+            output_df = output.to_frame()
+            return {col: output_df[col].to_numpy() for col in output_df.columns}, output.succeeded
+        
+        def task(g: int):
+            def run():
+                results[g] = run_group(g)
+                return results[g]
+            return run
+        
+        run_dataflow({g: task(g) for g in range(len(groups))}, group_dependencies)
+        
+        output_df = OutputBuilder.from_rules(mapping_instructions, len(input_df)).to_frame()
+        # Rules writing the same target are applied in plan order, later ones win
+        for i, rule in enumerate(plan):
+            columns = results[group_of[i]][0]
+            if rule["target_column"] in columns:
+                output_df[rule["target_column"]] = columns[rule["target_column"]]
+        # A row succeeded only if every model group succeeded for it
+        succeeded = np.ones(len(input_df), dtype=bool)
+        for g, members in enumerate(groups):
+            if members[0] >= n_native:
+                succeeded &= results[g][1]
+        progress.row_done(len(input_df))
+        return output_df, succeeded
+
+    def _transform_delta(self, input_df: pd.DataFrame, mapping_instructions: List[Dict], native_rules: List[Dict],
+                         ai_instructions: List[Dict], progress: ProgressTracker, delta: DeltaIndex,
+                         use_model: bool = True) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Transform only rows that are new or changed since the last run of this
+        source and reuse the stored output for the others.
+        
+        Returns:
+            Tuple of (output of the rows that succeeded, mask of those rows in ``input_df``)
+        """
+        # Only the rules that actually run here, so a native-only run never
+        # hands its output to a later run with the model
+        plan = native_rules + [compile_rule(instruction) for instruction in ai_instructions]
+        with delta.lock:
+            changed, previous = delta.compare(input_df, plan)
+            progress.record_cache(hit=True, count=int((~changed).sum()))
+            progress.record_cache(hit=False, count=int(changed.sum()))
+            changed_df = input_df[changed].reset_index(drop=True)
+            # A changed row keeps the IDs issued for its key; only new keys get new ones
+            stored = previous[changed].reset_index(drop=True)
+            carried = self._carry_ids(changed_df, stored, plan, native_rules)
+            # Rules reading an ID get it as an input column
+            read = {col.strip().lower() for rule in plan for col in rule["source_columns"]}
+            read -= {str(col).strip().lower() for col in changed_df.columns}
+            frame = changed_df.assign(**{target: values for target, values in carried.items()
+                                         if target.strip().lower() in read})
+            changed_output, changed_succeeded = self._transform_rows(
+                frame, mapping_instructions, [rule for rule in native_rules if rule["target_column"] not in carried],
+                ai_instructions, progress, use_model)
+            for instruction in ai_instructions:
+                target = instruction.get("target_column")
+                if instruction.get("type") == ID_RULE_TYPE and target in stored.columns:
+                    known = stored[target].notna() & (stored[target] != "")
+                    carried[target] = stored[target].where(known, changed_output[target]).to_numpy()
+            for target, values in carried.items():
+                changed_output[target] = values
+            progress.row_done(int((~changed).sum()))
+            
+            output_df = previous.reindex(columns=changed_output.columns).astype(object)
+            output_df.loc[changed, :] = changed_output.to_numpy()
+            # Rows whose model rules failed are neither output nor stored, so the next run retries them
+            succeeded = ~changed
+            succeeded[np.flatnonzero(changed)[changed_succeeded]] = True
+            
+            output_df = output_df[succeeded].reset_index(drop=True)
+            delta.save(input_df[succeeded], output_df, plan, failed_df=input_df[~succeeded])
+        logger.info(f"Reused stored output for {int((~changed).sum())} unchanged rows")
+        return output_df, succeeded
+
+    def _carry_ids(self, changed_df: pd.DataFrame, stored: pd.DataFrame, plan: List[Dict],
+                   native_rules: List[Dict]) -> Dict[str, np.ndarray]:
+        """
+        Values of native A rules for changed rows: the ID stored for the row's
+        key, and new IDs, allocated for those rows only, where there is none.
+        A rules that read other rules' outputs are left to run as usual.
+        """
+        dependencies = rule_dependencies(plan, changed_df.columns)
+        carried = {}
+        for position, rule in enumerate(native_rules):
+            target = rule["target_column"]
+            if rule["type"] != ID_RULE_TYPE or dependencies[position] or target not in stored.columns:
+                continue
+            values = stored[target].to_numpy(dtype=object).copy()
+            new = pd.isna(values) | (values == "")
+            if new.any():
+                generated = PartitionedExecutor([rule], max_workers=self.max_workers).run(changed_df[new])
+                values[new] = generated[target].to_numpy()
+            carried[target] = values
+        return carried
+
+    def dry_run(self, input_csv_path: str, mapping_excel_path: str,
+                seconds_per_call: float = DEFAULT_SECONDS_PER_CALL) -> Dict[str, Any]:
+        """
+        Estimate model calls, tokens, cost and duration of ``transform_data``
+        without calling the model.
+        
+        Args:
+            input_csv_path: Path to input CSV file
+            mapping_excel_path: Path to Excel file with transformation rules
+            seconds_per_call: Expected latency of one model call
+            
+        Returns:
+            Estimate as returned by ``transformation.estimate.estimate_run``
+        """
+        input_df = self.load_input_data(input_csv_path)
+        mapping_instructions, _ = self.load_transformation_rules(mapping_excel_path)
+        estimate = estimate_run(input_df, mapping_instructions, seconds_per_call=seconds_per_call,
+                                program_cache=self.program_cache)
+        logger.info(f"Dry run: {format_estimate(estimate)}")
+        return estimate
+
+    def _date_fallback(self, input_df: pd.DataFrame, native_rules: List[Dict], native_df: pd.DataFrame,
+                       progress: ProgressTracker) -> None:
+        """Ask the model for the values F rules could not parse, writing them into ``native_df``."""
+        for rule in native_rules:
+            if rule["type"] != DATE_RULE_TYPE:
+                continue
+            columns = referenced_columns(input_df, [rule])
+            if not columns:
+                continue
+            target = rule["target_column"]
+            failed = unparsed_dates(input_df[columns[0]], native_df[target])
+            if not failed.any():
+                continue
+            logger.info(f"Sending {int(failed.sum())} unparsed {target} values to the model")
+            instruction = fallback_instruction(rule)
+            failed_df = input_df[failed].reset_index(drop=True)
+            output = OutputBuilder.from_rules([instruction], len(failed_df))
+            self._transform_model(failed_df, [instruction], output, progress, count_rows=False)
+            values = native_df[target].to_numpy(dtype=object).copy()
+            values[failed] = output.to_frame()[target].to_numpy()
+            native_df[target] = values
+
+    def _transform_per_value(self, input_df: pd.DataFrame, instructions: List[Dict], strategies: List[Dict],
+                             output: OutputBuilder, progress: ProgressTracker) -> None:
+        """
+        Call the model once per distinct combination of source values and copy
+        each answer to every row with those values.
+        """
+        groups = {}
+        for instruction, strategy in zip(instructions, strategies):
+            groups.setdefault(tuple(strategy["source_columns"]), []).append(instruction)
+        
+        for sources, group in groups.items():
+            keys = input_df[list(sources)]
+            codes = keys.groupby(list(sources), dropna=False, sort=False).ngroup().to_numpy()
+            first_rows = pd.Series(range(len(keys))).groupby(codes).first().to_numpy()
+            targets = [instruction["target_column"] for instruction in group]
+            answers = {target: [] for target in targets}
+            
+            group_sizes = np.bincount(codes, minlength=len(first_rows))
+            # Rows answered by another row's call count as cache hits
+            progress.record_cache(hit=True, count=len(keys) - len(first_rows))
+            progress.record_cache(hit=False, count=len(first_rows))
+            failed_codes = np.zeros(len(first_rows), dtype=bool)
+            
+            for code, position in enumerate(first_rows):
+                transformed_row = self.transform_row_with_ai(keys.iloc[position].to_dict(), group, progress)
+                if not transformed_row:
+                    logger.warning(f"Failed to transform values {keys.iloc[position].to_dict()}")
+                    progress.row_failed(int(group_sizes[code]))
+                    failed_codes[code] = True
+                for target in targets:
+                    answers[target].append(transformed_row.get(target))
+            
+            for target in targets:
+                output.set_column(target, pd.Series(answers[target], dtype=object).to_numpy()[codes])
+            # Every row sharing a value whose call failed is failed too
+            output.mark_failed(failed_codes[codes])
+            logger.info(f"Applied {len(group)} rules with {len(first_rows)} model calls "
+                        f"for {len(input_df)} rows (one per distinct value of {list(sources)})")
+
+    def _transform_batches(self, input_df: pd.DataFrame, instructions: List[Dict], strategies: List[Dict],
+                           output: OutputBuilder, progress: ProgressTracker, count_rows: bool = True) -> None:
+        """Send rows to the model in batches sized by the profiled value lengths."""
+        batch_size = min(strategy["batch_size"] for strategy in strategies)
+        if all(strategy["source_columns"] for strategy in strategies):
+            # Only send the model the columns the rules read
+            columns = referenced_columns(input_df, [compile_rule(instruction) for instruction in instructions])
+            rows_df = input_df[columns]
+        else:
+            rows_df = input_df
+        
+        for start in range(0, len(rows_df), batch_size):
+            chunk = rows_df.iloc[start:start + batch_size]
+            input_rows = [row.to_dict() for _, row in chunk.iterrows()]
+            transformed_rows = self.transform_rows_with_ai(input_rows, instructions, progress)
+            
+            for offset, transformed_row in enumerate(transformed_rows):
+                if transformed_row:
+                    output.set_row(start + offset, transformed_row)
+                else:
+                    logger.warning(f"Failed to transform row {start + offset + 1}")
+                    output.mark_failed(start + offset)
+                    progress.row_failed()
+            if count_rows:
+                progress.row_done(len(input_rows))
+            logger.info(f"Processed {start + len(input_rows)}/{len(rows_df)} rows")
+
+    def _split_rules(self, mapping_instructions: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Separate rules that run natively from those that need the model.
+        
+        Returns:
+            Tuple of (compiled native rules, mapping instructions for the model)
+        """
+        native_rules, ai_instructions = [], []
+        for instruction in mapping_instructions:
+            rule = compile_rule(instruction)
+            if rule is None:
+                continue
+            if is_native(rule):
+                native_rules.append(rule)
+            else:
+                ai_instructions.append(instruction)
+        return native_rules, ai_instructions
+
+    def _compile_programs(self, input_df: pd.DataFrame, ai_instructions: List[Dict],
+                          progress: ProgressTracker) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Replace X rules by programs synthesized once per instruction (see ``programs``).
+        
+        Returns:
+            Tuple of (compiled program rules, mapping instructions still for the model)
+        """
+        program_rules, remaining = [], []
+        for instruction in ai_instructions:
+            rule = compile_rule(instruction)
+            program = None
+            if is_candidate(rule):
+                found, _ = self.program_cache.get(ProgramCache.key(rule))
+                progress.record_cache(hit=found)
+                program = synthesize_program(
+                    input_df, rule,
+                    complete=lambda prompt: self._invoke(prompt, progress).content.strip(),
+                    model_batch=lambda rows, _: self.transform_rows_with_ai(rows, [instruction], progress),
+                    cache=self.program_cache)
+            if program is None:
+                remaining.append(instruction)
+            else:
+                program_rules.append(program)
+        if program_rules:
+            logger.info(f"Running {len(program_rules)} custom rules as programs: "
+                        f"{[rule['target_column'] for rule in program_rules]}")
+        return program_rules, remaining
+
+    def _save_results(self, output_df: pd.DataFrame, output_folder: str,
+                      output_name: str = "mapped_output_file.csv") -> str:
+        """Save transformation results as CSV, Parquet or JSON lines, by file extension."""
+        if output_df.empty:
+            raise ValueError("No valid transformed rows to save")
+        
+        # Ensure output folder exists
+        os.makedirs(output_folder, exist_ok=True)
+        
+        output_file = os.path.join(output_folder, output_name)
+        extension = os.path.splitext(output_name)[1].lower()
+        if extension == ".parquet":
+            output_df.to_parquet(output_file, index=False)
+        elif extension == ".jsonl":
+            output_df.to_json(output_file, orient="records", lines=True, force_ascii=False)
+        else:
+            output_df.to_csv(output_file, index=False)
+        
+        logger.info(f"Results saved to: {output_file}")
+        logger.info(f"Output shape: {output_df.shape}")
+        
+        return output_file
+
+    def validate_configuration(self) -> bool:
+        """Validate that the transformation engine is properly configured."""
+        try:
+            # Test AI model connection
+            test_response = self.model.invoke("Test connection")
+            return bool(test_response.content)
+        except Exception as e:
+            logger.error(f"Configuration validation failed: {e}")
+            return False
+
+
+def _token_usage(response: Any) -> Tuple[int, int]:
+    """(input, output) tokens reported on a LangChain chat response, (0, 0) if unknown."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return int(usage.get("prompt_tokens", 0) or 0), int(usage.get("completion_tokens", 0) or 0)
@@ -0,0 +1,208 @@
+"""
+Dry-run cost and latency estimates.
+
+``estimate_run`` answers "how long will this take and what will it cost" before
+a single request is sent. It follows the engine's plan rather than a model of
+it: rules are split into native and model rules with ``native.is_native``, X
+rules are checked against the program cache (see ``programs``), rules that read
+other rules' outputs are grouped by ``dag.split_waves``, and model calls are
+grouped by ``profiling.group_model_calls``, the function the engine sends them
+with. It then counts:
+
+* model calls after de-duplication (per distinct value) and batching
+* calls to synthesize programs for X rules the program cache hasn't seen; the
+  rule is assumed to stay with the model, so the estimate is an upper bound
+* calls for F rule values that don't parse as dates, found by running the
+  native date conversion over the input
+* input and output tokens, from the profiled value lengths and the prompt size
+* wall-clock time, from a configured or observed time per model call
+
+Nothing here talks to the network, so an oversized job can be re-planned (more
+native rules, a smaller input) before it is started.
+"""
+import math
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from . import serialization
+from .dag import rule_dependencies, split_waves, topological_waves
+from .dates import DATE_RULE_TYPE, fallback_instruction, unparsed_dates
+from .executor import referenced_columns
+from .native import apply_rules, is_native
+from .profiling import group_model_calls, profile_columns, plan_strategies
+from .programs import SAMPLE_ROWS, ProgramCache, is_candidate, program_rule, synthesis_calls
+from .progress import ProgressTracker
+from .rules import compile_rule, compile_rules
+
+CHARS_PER_TOKEN = 4
+
+# Fixed instructions around the rules and rows in a transformation prompt
+PROMPT_OVERHEAD_CHARS = 1_500
+
+# Characters of JSON around each value in a prompt or answer
+VALUE_OVERHEAD_CHARS = 8
+
+# Assumed answer length for rules whose output length can't be derived from a source
+DEFAULT_OUTPUT_CHARS = 12
+
+DEFAULT_SECONDS_PER_CALL = 2.0
+
+# USD per 1,000 tokens; override for the deployment actually used
+PRICE_PER_1K_INPUT_TOKENS = 0.0025
+PRICE_PER_1K_OUTPUT_TOKENS = 0.01
+
+
+def observed_seconds_per_call(tracker: ProgressTracker) -> Optional[float]:
+    """Average time per model call of a run so far, or None before the first call."""
+    if not tracker.calls_done:
+        return None
+    snapshot = tracker.snapshot()
+    return snapshot["elapsed_seconds"] / tracker.calls_done
+
+
+def estimate_run(df: pd.DataFrame, rules: Union[List[Dict], Dict[str, Dict]],
+                 seconds_per_call: float = DEFAULT_SECONDS_PER_CALL, concurrency: int = 1,
+                 program_cache: Optional[ProgramCache] = None, per_row: bool = False,
+                 price_per_1k_input: float = PRICE_PER_1K_INPUT_TOKENS,
+                 price_per_1k_output: float = PRICE_PER_1K_OUTPUT_TOKENS) -> Dict[str, Any]:
+    """
+    Estimate model calls, tokens, cost and duration of a run without running it.
+
+    Args:
+        df: Full input
+        rules: Rules in any shape accepted by ``compile_rules``
+        seconds_per_call: Configured or observed (``observed_seconds_per_call``) latency
+        concurrency: Model calls in flight at the same time
+        program_cache: Programs the engine has synthesized; X rules found there
+                       need no synthesis, and those with a program no model calls
+        per_row: Estimate the simple loop that sends every row with every rule
+                 in its own call, instead of the planned strategies
+        price_per_1k_input: USD per 1,000 prompt tokens
+        price_per_1k_output: USD per 1,000 completion tokens
+
+    Returns:
+        Totals (``model_calls``, ``input_tokens``, ``output_tokens``,
+        ``estimated_cost``, ``estimated_seconds``), the part of the calls
+        spent on ``program_calls`` and ``fallback_calls``, and the per-rule
+        ``strategies``
+    """
+    plan = compile_rules(rules)
+    n_rows = len(df)
+    profiles = profile_columns(df)
+    strategies = plan_strategies(plan, df, profiles)
+
+    if per_row:
+        groups = [_call_group(df, plan, strategies, profiles, calls=n_rows, rows_per_call=1, whole_rows=True)]
+        native_rules = sum(1 for rule in plan if is_native(rule))
+    else:
+        groups, native_rules = _planned_groups(df, plan, profiles, program_cache)
+
+    model_calls = sum(group["calls"] for group in groups)
+    input_tokens = sum(group["calls"] * group["input_chars"] for group in groups) // CHARS_PER_TOKEN
+    output_tokens = sum(group["calls"] * group["output_chars"] for group in groups) // CHARS_PER_TOKEN
+    return {
+        "rows": n_rows,
+        "rules": len(plan),
+        "native_rules": native_rules,
+        "model_calls": model_calls,
+        "program_calls": sum(group["calls"] for group in groups if group.get("kind") == "program"),
+        "fallback_calls": sum(group["calls"] for group in groups if group.get("kind") == "fallback"),
+        "input_tokens": int(input_tokens),
+        "output_tokens": int(output_tokens),
+        "estimated_cost": round(input_tokens / 1000 * price_per_1k_input
+                                + output_tokens / 1000 * price_per_1k_output, 2),
+        "estimated_seconds": math.ceil(model_calls / max(1, concurrency)) * seconds_per_call,
+        "strategies": strategies,
+    }
+
+
+def _planned_groups(df: pd.DataFrame, plan: List[Dict[str, Any]], profiles: Dict[str, Dict[str, Any]],
+                    program_cache: Optional[ProgramCache]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Model calls the engine makes for ``plan``, grouped the way it sends them.
+
+    Returns:
+        Tuple of (call groups, rules that run natively)
+    """
+    if not len(df):
+        return [], sum(1 for rule in plan if is_native(rule))
+    native_rules = [rule for rule in plan if is_native(rule)]
+    model_rules, groups = [], []
+    for rule in plan:
+        if is_native(rule):
+            continue
+        if is_candidate(rule):
+            calls = synthesis_calls(df, rule, program_cache)
+            if calls:
+                group = _call_group(df, [rule], plan_strategies([rule], df, profiles), profiles,
+                                    calls=calls, rows_per_call=min(SAMPLE_ROWS, len(df)))
+                groups.append({**group, "kind": "program"})
+            found, program = program_cache.get(ProgramCache.key(rule)) if program_cache is not None else (False, None)
+            if found and program is not None:
+                native_rules.append(program_rule(rule, program))
+                continue
+        model_rules.append(rule)
+
+    # Rules reading other rules' outputs run per group of a wave, as in the engine
+    ordered = native_rules + model_rules
+    dependencies = rule_dependencies(ordered, df.columns)
+    if any(dependencies):
+        rule_groups = [[ordered[i] for i in members]
+                       for members in split_waves(topological_waves(dependencies, ordered), len(native_rules))
+                       if members[0] >= len(native_rules)]
+    else:
+        rule_groups = [model_rules] if model_rules else []
+    for rules in rule_groups:
+        groups.extend(_model_groups(df, rules, profiles))
+
+    for rule in native_rules:
+        columns = referenced_columns(df, [rule])
+        if rule["type"] != DATE_RULE_TYPE or not columns:
+            continue
+        failed = unparsed_dates(df[columns[0]], apply_rules(df, [rule])[rule["target_column"]])
+        if failed.any():
+            failed_df = df[failed].reset_index(drop=True)
+            groups.extend({**group, "kind": "fallback"} for group in
+                          _model_groups(failed_df, [compile_rule(fallback_instruction(rule))],
+                                        profile_columns(failed_df)))
+    return groups, len(native_rules)
+
+
+def _model_groups(df: pd.DataFrame, rules: List[Dict[str, Any]],
+                  profiles: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Call groups of ``profiling.group_model_calls`` with their prompt and answer sizes."""
+    return [_call_group(df, [rules[i] for i in group["rules"]], group["strategies"], profiles,
+                        calls=group["calls"], rows_per_call=group["batch_size"])
+            for group in group_model_calls(rules, df, profiles)]
+
+
+def _call_group(df: pd.DataFrame, plan: List[Dict[str, Any]], strategies: List[Dict[str, Any]],
+                profiles: Dict[str, Dict[str, Any]], calls: int, rows_per_call: int,
+                whole_rows: bool = False) -> Dict[str, Any]:
+    """Characters sent and received per call for calls carrying ``plan`` over ``rows_per_call`` rows."""
+    sources = list(dict.fromkeys(col for strategy in strategies for col in strategy["source_columns"]))
+    if whole_rows or any(not strategy["source_columns"] for strategy in strategies):
+        sources = list(df.columns)
+    row_chars = sum(profiles[col]["avg_length"] + len(str(col)) + VALUE_OVERHEAD_CHARS for col in sources)
+
+    output_row_chars = 0.0
+    for strategy in strategies:
+        lengths = [profiles[col]["avg_length"] for col in strategy["source_columns"]]
+        value_chars = max(lengths) if lengths else DEFAULT_OUTPUT_CHARS
+        output_row_chars += value_chars + len(strategy["target_column"]) + VALUE_OVERHEAD_CHARS
+
+    return {
+        "calls": max(0, calls),
+        "input_chars": PROMPT_OVERHEAD_CHARS + len(serialization.dumps(plan)) + rows_per_call * row_chars,
+        "output_chars": rows_per_call * output_row_chars,
+    }
+
+
+def format_estimate(estimate: Dict[str, Any]) -> str:
+    """One-paragraph human-readable summary of ``estimate_run``."""
+    minutes = estimate["estimated_seconds"] / 60
+    return (f"{estimate['rows']} rows, {estimate['rules']} rules ({estimate['native_rules']} native): "
+            f"~{estimate['model_calls']} model calls, ~{estimate['input_tokens']:,} input and "
+            f"~{estimate['output_tokens']:,} output tokens, ~${estimate['estimated_cost']:.2f}, "
+            f"~{minutes:.1f} minutes")
@@ -0,0 +1,187 @@
+"""
+Process-pool execution of the native rule plan.
+
+The input is split into contiguous row ranges and each range is transformed in
+a worker process. The compiled plan is sent to every worker once, through the
+pool initializer, rather than with each partition. Results are put back together
+in input order.
+
+When pyarrow is installed the input is not pickled into the workers at all: the
+columns the plan reads are written once to an uncompressed Arrow IPC file, every
+worker memory-maps that file and slices its row range out of it without copying,
+so the operating system shares one copy of the data between all processes.
+Without pyarrow, partitions are pickled to the workers as before.
+"""
+import importlib.util
+import logging
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .native import apply_rules, prepare_rules
+
+# pyarrow is imported only when a run actually shares its input, so importing
+# this module (e.g. for a small in-process run) stays cheap
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+logger = logging.getLogger(__name__)
+
+# Below this many rows the cost of starting workers outweighs the gain
+MIN_PARALLEL_ROWS = 50_000
+
+# Rows converted to Arrow at a time while writing the shared input file
+WRITE_BATCH_ROWS = 100_000
+
+_worker_plan = None
+_worker_table = None
+
+
+def _init_worker(plan: List[Dict[str, Any]], shared_path: Optional[str] = None) -> None:
+    """Pool initializer: keep the compiled plan, and attach to the shared input if there is one."""
+    global _worker_plan, _worker_table
+    _worker_plan = plan
+    if shared_path:
+        import pyarrow as pa
+        _worker_table = pa.ipc.open_file(pa.memory_map(shared_path, "r")).read_all()
+
+
+def _run_partition(start: int, partition: pd.DataFrame) -> Tuple[int, pd.DataFrame]:
+    return start, apply_rules(partition, _worker_plan, row_offset=start)
+
+
+def _run_shared_range(start: int, stop: int) -> Tuple[int, pd.DataFrame]:
+    # Slicing a memory-mapped table is zero-copy; only this range is materialized
+    partition = _worker_table.slice(start, stop - start).to_pandas()
+    return start, apply_rules(partition, _worker_plan, row_offset=start)
+
+
+def partition_bounds(n_rows: int, n_partitions: int) -> List[Tuple[int, int]]:
+    """
+    Split ``range(n_rows)`` into contiguous ``(start, stop)`` ranges of near-equal size.
+    """
+    n_partitions = max(1, min(n_partitions, n_rows))
+    size = math.ceil(n_rows / n_partitions) if n_rows else 0
+    return [(start, min(start + size, n_rows)) for start in range(0, n_rows, size or 1)]
+
+
+def referenced_columns(df: pd.DataFrame, plan: List[Dict[str, Any]]) -> List[str]:
+    """Input columns read by any rule in the plan, matched case-insensitively."""
+    wanted = {col.strip().lower() for rule in plan for col in rule["source_columns"]}
+    return [col for col in df.columns if str(col).strip().lower() in wanted]
+
+
+class SharedInput:
+    def __init__(self, df: pd.DataFrame, columns: List[str]):
+        """
+        Write input columns to a memory-mappable Arrow IPC file.
+
+        Conversion happens in batches so the parent never holds a second full
+        copy of the input. Call ``close`` (or use as a context manager) to
+        remove the file.
+
+        Args:
+            df: Input rows
+            columns: Columns to share
+        """
+        import pyarrow as pa
+
+        self._dir = tempfile.mkdtemp(prefix="transform-shared-")
+        self.path = os.path.join(self._dir, "input.arrow")
+        try:
+            projected = df[columns].reset_index(drop=True)
+            schema = pa.Schema.from_pandas(projected, preserve_index=False)
+            with pa.OSFile(self.path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+                for start in range(0, len(projected), WRITE_BATCH_ROWS):
+                    chunk = projected.iloc[start:start + WRITE_BATCH_ROWS]
+                    writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+        except Exception:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self) -> "SharedInput":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class PartitionedExecutor:
+    def __init__(self, plan: List[Dict[str, Any]], max_workers: Optional[int] = None,
+                 partitions_per_worker: int = 4, min_parallel_rows: int = MIN_PARALLEL_ROWS,
+                 shared_memory: bool = True):
+        """
+        Run a native rule plan over row ranges in a process pool.
+
+        Args:
+            plan: Compiled native rules (see ``native.is_native``)
+            max_workers: Worker processes; defaults to the number of CPUs
+            partitions_per_worker: Row ranges per worker, for load balancing
+            min_parallel_rows: Inputs smaller than this run in-process
+            shared_memory: Hand the input to workers through a memory-mapped
+                           Arrow file instead of pickling partitions
+        """
+        self.plan = plan
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.partitions_per_worker = partitions_per_worker
+        self.min_parallel_rows = min_parallel_rows
+        self.shared_memory = shared_memory and ARROW_AVAILABLE
+
+    def run(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Transform the whole input.
+
+        Args:
+            df: Input rows
+
+        Returns:
+            DataFrame with one column per target, in the same row order and index as ``df``
+        """
+        if not self.plan:
+            return pd.DataFrame(index=df.index)
+        # ID counters, integer rendering and date formats are settled for the
+        # whole input here, in the parent, so every partition agrees on them
+        # and numbers its rows from its offset without coordinating
+        plan = prepare_rules(df, self.plan)
+        if self.max_workers <= 1 or len(df) < self.min_parallel_rows:
+            return apply_rules(df, plan)
+        columns = referenced_columns(df, plan)
+        if not columns:
+            # Only constants; nothing worth shipping to workers
+            return apply_rules(df, plan)
+
+        bounds = partition_bounds(len(df), self.max_workers * self.partitions_per_worker)
+        logger.info(f"Running {len(self.plan)} native rules over {len(df)} rows "
+                    f"in {len(bounds)} partitions on {self.max_workers} workers")
+
+        shared = None
+        if self.shared_memory:
+            import pyarrow as pa
+            try:
+                shared = SharedInput(df, columns)
+            except (pa.ArrowException, ValueError, TypeError) as e:
+                logger.warning(f"Input can't be shared as Arrow, pickling partitions instead: {e}")
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(plan, shared.path if shared else None)) as pool:
+                if shared:
+                    futures = [pool.submit(_run_shared_range, start, stop) for start, stop in bounds]
+                else:
+                    futures = [pool.submit(_run_partition, start, df.iloc[start:stop]) for start, stop in bounds]
+                results = [future.result() for future in futures]
+        finally:
+            if shared:
+                shared.close()
+
+        results.sort(key=lambda item: item[0])
+        output_df = pd.concat([frame for _, frame in results])
+        output_df.index = df.index
+        return output_df
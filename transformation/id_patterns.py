@@ -0,0 +1,131 @@
+"""
+ID pattern syntax (A rules, see ``ids``).
+
+Parsing lives apart from ID generation so that compiling rules, which only
+needs the columns a pattern reads, doesn't load NumPy or pandas.
+"""
+import re
+import string
+from functools import lru_cache
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+ID_RULE_TYPE = "A"
+
+# Characters of random tokens
+ALPHABET = string.digits + string.ascii_uppercase
+
+# Characters a counter token is written with
+COUNTER_CHARACTERS = {"seq": string.digits, "random": ALPHABET}
+
+# Character short column slices are padded with
+PAD_CHARACTER = "0"
+
+# strftime directives that always give the same number of characters
+FIXED_WIDTH_DIRECTIVES = set("YmdHMSyjfIUWw%")
+
+# Widest random token a pattern can ask for
+MAX_RANDOM_WIDTH = 6
+
+DEFAULT_TIMESTAMP_FORMAT = "%Y%m%d%H%M%S"
+
+_TOKEN = re.compile(r"\{([^{}\[\]:]+?)(?:\[(-?\d*):(-?\d*)\])?(?::([^{}]*))?\}")
+
+
+class Token(NamedTuple):
+    # "text", "column", "timestamp", "seq" or "random"
+    kind: str
+    value: Any = None
+    start: Optional[int] = None
+    stop: Optional[int] = None
+
+
+@lru_cache(maxsize=256)
+def parse_pattern(pattern: str) -> Tuple[Token, ...]:
+    """
+    Split an ID pattern into tokens.
+
+    Raises:
+        ValueError: If a token is malformed, or the pattern has no seq or random
+                    token whose characters can be told apart from the rest of the ID
+    """
+    tokens, position = [], 0
+    for match in _TOKEN.finditer(pattern):
+        if match.start() > position:
+            tokens.append(Token("text", pattern[position:match.start()]))
+        name, start, stop, option = match.groups()
+        name = name.strip()
+        if name in ("seq", "random", "timestamp"):
+            if name == "timestamp":
+                tokens.append(Token("timestamp", option or DEFAULT_TIMESTAMP_FORMAT))
+            else:
+                width = int(option) if option and option.strip().isdigit() else (0 if name == "seq" else None)
+                if name == "random" and not (width and 1 <= width <= MAX_RANDOM_WIDTH):
+                    raise ValueError(f"{{random:<width>}} needs a width from 1 to {MAX_RANDOM_WIDTH}: {match.group()}")
+                tokens.append(Token(name, width))
+        else:
+            tokens.append(Token("column", name, int(start) if start else None, int(stop) if stop else None))
+        position = match.end()
+    if position < len(pattern):
+        tokens.append(Token("text", pattern[position:]))
+    if not any(token.kind in ("seq", "random") for token in tokens):
+        raise ValueError(f"ID pattern {pattern!r} needs a {{seq}} or {{random:<width>}} token to be unique")
+    if not any(_delimited(tokens, position) for position, token in enumerate(tokens)
+               if token.kind in ("seq", "random")):
+        raise ValueError(f"ID pattern {pattern!r} can give two rows the same ID: put a separator such as '-' "
+                         f"next to its {{seq}} or {{random}} token, or take a fixed-width slice of the "
+                         f"columns around it, e.g. {{Column[:4]}}")
+    return tuple(tokens)
+
+
+def slice_width(token: Token) -> Optional[int]:
+    """
+    Width of a column token's slice, or None if it depends on the value.
+
+    Values shorter than the slice are padded to this width (see ``ids``).
+    """
+    start, stop = token.start, token.stop
+    if start is None and stop is not None and stop > 0:
+        return stop
+    if start is not None and start < 0 and (stop is None or stop < 0):
+        return max((stop or 0) - start, 0)
+    if start is not None and start >= 0 and stop is not None and stop >= 0:
+        return max(stop - start, 0)
+    return None
+
+
+def _fixed_width(token: Token) -> bool:
+    """Whether a token gives every row of a run the same number of characters."""
+    if token.kind == "text":
+        return True
+    if token.kind == "timestamp":
+        return set(re.findall(r"%(.)", token.value)) <= FIXED_WIDTH_DIRECTIVES
+    if token.kind == "column":
+        return slice_width(token) is not None
+    # Counters grow past their width
+    return False
+
+
+def _delimited(tokens: List[Token], position: int) -> bool:
+    """
+    Whether the characters of the counter token at ``position`` can be found
+    in every ID, so that distinct counters give distinct IDs.
+
+    One side of the token must have a fixed width, which places one end of
+    it; the other end is placed by a fixed width as well, or by the edge of
+    the ID or a separator that the counter's characters can't contain.
+    """
+    characters = COUNTER_CHARACTERS[tokens[position].kind]
+    before, after = tokens[:position], tokens[position + 1:]
+
+    def separated(neighbours: List[Token], edge: int) -> bool:
+        return not neighbours or (neighbours[edge].kind == "text" and neighbours[edge].value[edge] not in characters)
+
+    before_fixed = all(_fixed_width(token) for token in before)
+    after_fixed = all(_fixed_width(token) for token in after)
+    return ((before_fixed and (after_fixed or separated(after, 0)))
+            or (after_fixed and separated(before, -1)))
+
+
+def pattern_columns(pattern: str) -> List[str]:
+    """Columns an ID pattern reads."""
+    return [token.value for token in parse_pattern(pattern) if token.kind == "column"]
@@ -0,0 +1,266 @@
+"""
+Deterministic, collision-free ID generation (A rules).
+
+A rules used to ask the model to "generate a unique ID" row by row, which
+can't be unique across rows it never sees together. An A rule with an
+``id_pattern`` runs natively instead::
+
+    {"type": "A", "source_column": "ClientId", "target_column": "REL_ID",
+     "id_pattern": "{ClientId[-4:]}-{timestamp:%Y-%d%m}-{random:4}"}
+
+Pattern tokens, between braces; everything else is copied as is:
+
+* ``{Column}`` / ``{Column[start:stop]}``: a source column's value or a slice
+  of it (Python slice semantics); values shorter than a slice of fixed width,
+  such as ``[:4]`` or ``[-4:]``, are padded to it with "0" on the side the
+  slice is cut from
+* ``{timestamp:<strftime format>}``: the time of the run, the same for every row
+* ``{seq}`` / ``{seq:<width>}``: a sequence number, zero-padded to the width
+* ``{random:<width>}``: random-looking base-36 characters (width 1 to 6); once
+  a rule has handed out ``36 ** width`` IDs, later ones get a character more
+
+A pattern needs a ``seq`` or ``random`` token, placed so its characters can
+be told apart from the rest of every ID: next to the edge of the ID, to a
+separator it can't contain (e.g. "-"), or to parts of fixed width. Otherwise
+"12" + "31" and "123" + "1" would both give "1231", and ``parse_pattern``
+rejects the pattern. Both tokens are computed from one
+counter per rule, handed out in blocks by a process-wide ``IdAllocator``: the
+parent reserves a block for the whole input before native rules are split over
+worker processes, and each partition numbers its rows from its offset in that
+block. ``random`` characters are a seeded permutation of the counter, so
+distinct counters always give distinct characters. IDs are therefore unique
+within a run, across parallel workers and across the files and workbooks
+transformed by one process, without the workers coordinating.
+
+Across runs, IDs stay unique when the allocator keeps its high-water marks in
+a state file (``use_state``; the command-line runner and the watch service do
+so in their cache or state directory): the next run continues after the
+counters of the previous one, and processes using the file at the same time,
+e.g. a command-line run next to the watch service, take turns on it through
+a lock file. Without a state file the counters restart at
+zero in every process, and ``random`` tokens are seeded with a per-process
+nonce so a new run doesn't repeat the previous run's IDs (``seq`` does).
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+import pandas as pd
+
+from . import serialization
+from .id_patterns import ALPHABET, ID_RULE_TYPE, PAD_CHARACTER, parse_pattern, slice_width
+
+logger = logging.getLogger(__name__)
+
+
+class IdAllocator:
+    def __init__(self, path: Optional[str] = None):
+        """
+        Hands out blocks of consecutive counter values per namespace.
+
+        Args:
+            path: JSON file keeping the high-water mark of every namespace, so
+                  later runs continue after this one; processes sharing the
+                  file take turns through a lock file next to it. Kept in
+                  memory when omitted
+        """
+        self.path = path
+        # Seeds random tokens; only stable when the counters are persisted
+        self.nonce = "" if path else uuid.uuid4().hex
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, namespace: str, count: int) -> int:
+        """Reserve ``count`` values; returns the first one."""
+        if not self.path:
+            with self._lock:
+                start = self._next.get(namespace, 0)
+                self._next[namespace] = start + count
+                return start
+
+        # Other processes (another CLI run, the watch service) share the file,
+        # so the read-modify-write happens under a lock on it
+        with self._lock, _file_lock(self.path + ".lock"):
+            for key, value in self._read().items():
+                self._next[key] = max(self._next.get(key, 0), int(value))
+            start = self._next.get(namespace, 0)
+            self._next[namespace] = start + count
+            with open(self.path + ".tmp", "wb") as f:
+                f.write(serialization.dumps_bytes(self._next))
+            os.replace(self.path + ".tmp", self.path)
+            return start
+
+    def _read(self) -> Dict[str, int]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            return serialization.loads(f.read())
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Exclusive lock on ``path`` across processes; the OS releases it if the holder dies."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Shared by every engine, job and thread of the process
+allocator = IdAllocator()
+
+
+def use_state(path: str) -> None:
+    """Keep the process-wide allocator's high-water marks in ``path`` (see ``IdAllocator``)."""
+    global allocator
+    if allocator.path != path:
+        allocator = IdAllocator(path)
+
+
+def allocate_ids(plan: List[Dict[str, Any]], n_rows: int) -> List[Dict[str, Any]]:
+    """
+    Reserve counters and fix the timestamp of the ID rules in a plan.
+
+    Call once for the whole input before it is split into partitions; the
+    returned plan is then applied with each partition's row offset. ID rules
+    nested as branches of conditional rules are prepared too.
+    """
+    timestamp = datetime.now().isoformat()
+    return [_prepare(rule, n_rows, timestamp) for rule in plan]
+
+
+def _prepare(rule: Dict[str, Any], n_rows: int, timestamp: str) -> Dict[str, Any]:
+    params = rule["params"]
+    if rule["type"] == ID_RULE_TYPE and params.get("id_pattern") and "id_start" not in params:
+        start = allocator.allocate(_namespace(rule), n_rows)
+        return {**rule, "params": {**params, "id_start": start, "id_timestamp": timestamp,
+                                   "id_seed": _namespace(rule) + allocator.nonce}}
+    branches = {key: _prepare(params[key], n_rows, timestamp) for key in ("then", "else")
+                if isinstance(params.get(key), dict) and "params" in params[key]}
+    return {**rule, "params": {**params, **branches}} if branches else rule
+
+
+def generate_ids(columns: Dict[str, pd.Series], rule: Dict[str, Any], index: pd.Index,
+                 row_offset: int = 0) -> pd.Series:
+    """
+    IDs for a block of rows.
+
+    Args:
+        columns: Source column values as text, by column name
+        rule: Compiled A rule prepared by ``allocate_ids``
+        index: Index of the rows
+        row_offset: Position of the first row in the prepared input
+
+    Returns:
+        One ID per row, distinct from every other ID the rule's counter gave
+    """
+    params = rule["params"]
+    tokens = parse_pattern(params["id_pattern"])
+    counters = params["id_start"] + row_offset + np.arange(len(index), dtype=np.int64)
+    by_name = {name.strip().lower(): values for name, values in columns.items()}
+    timestamp = datetime.fromisoformat(params["id_timestamp"])
+
+    result = pd.Series("", index=index, dtype=object)
+    for token in tokens:
+        if token.kind == "text":
+            part = token.value
+        elif token.kind == "column":
+            values = by_name.get(token.value.lower())
+            if values is None:
+                values = pd.Series("", index=index, dtype=object)
+            part = values.astype(str).str.slice(token.start, token.stop)
+            width = slice_width(token)
+            if width:
+                # Padded to the slice's width so the parts after it keep their place
+                part = part.str.pad(width, side="left" if (token.start or 0) < 0 else "right",
+                                    fillchar=PAD_CHARACTER)
+            part = part.to_numpy()
+        elif token.kind == "timestamp":
+            part = timestamp.strftime(token.value)
+        elif token.kind == "seq":
+            part = pd.Series(counters + 1).astype(str).str.zfill(token.value).to_numpy()
+        else:
+            part = _random_tokens(counters, token.value, params.get("id_seed", _namespace(rule)))
+        result = result + part
+    return result
+
+
+def _random_tokens(counters: np.ndarray, width: int, seed: str) -> np.ndarray:
+    """
+    Base-36 strings of at least ``width`` characters, a bijection of ``counters``.
+
+    A counter past the ``36 ** width`` values the width can hold gets as many
+    characters more as it needs, instead of wrapping around to a token that
+    was already handed out.
+    """
+    result = np.empty(len(counters), dtype=object)
+    remaining = np.ones(len(counters), dtype=bool)
+    while remaining.any():
+        modulus = len(ALPHABET) ** width
+        fits = remaining & (counters < modulus) if modulus <= np.iinfo(np.int64).max else remaining
+        if fits.any():
+            result[fits] = _permute(counters[fits], width, seed)
+        remaining &= ~fits
+        width += 1
+    return result
+
+
+def _permute(counters: np.ndarray, width: int, seed: str) -> np.ndarray:
+    """
+    Tokens of exactly ``width`` characters for counters below ``36 ** width``.
+
+    The permutation is an affine map, a reversal of the base-36 digits and
+    another affine map, each invertible modulo ``36 ** width``.
+    """
+    modulus = len(ALPHABET) ** width
+    if modulus ** 2 > np.iinfo(np.int64).max:
+        # Products of the affine maps would overflow int64
+        counters = counters.astype(object)
+    digest = hashlib.sha256(seed.encode()).digest()
+    # Multipliers coprime to 36 (odd and not divisible by 3) keep the maps invertible
+    a1, c1, a2, c2 = (int.from_bytes(digest[i:i + 4], "big") % modulus for i in range(0, 16, 4))
+    a1, a2 = (_coprime(a, modulus) for a in (a1, a2))
+    places = np.array([len(ALPHABET) ** i for i in range(width)], dtype=object)
+
+    values = (a1 * counters + c1) % modulus
+    digits = np.stack([(values // place) % len(ALPHABET) for place in places], axis=1)
+    values = (digits * places[::-1]).sum(axis=1)
+    values = (a2 * values + c2) % modulus
+
+    digits = np.stack([(values // place) % len(ALPHABET) for place in places[::-1]], axis=1)
+    chars = np.array(list(ALPHABET))[digits.astype(np.int64)]
+    return np.ascontiguousarray(chars).view(f"<U{width}").ravel().astype(object)
+
+
+def _coprime(value: int, modulus: int) -> int:
+    value = max(value, 1)
+    while value % 2 == 0 or value % 3 == 0:
+        value = (value + 1) % modulus or 1
+    return value
+
+
+def _namespace(rule: Dict[str, Any]) -> str:
+    return f"{rule['target_column']}|{rule['params']['id_pattern']}"
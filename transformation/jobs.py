@@ -0,0 +1,159 @@
+"""
+Background jobs for the web front ends.
+
+A transformation can take minutes to hours, far longer than an HTTP request
+should stay open. ``JobManager`` runs submitted work on a local thread pool and
+hands back a ``Job`` straight away; the Flask routes in ``transformation.web``
+expose its status, progress, ETA and result file.
+"""
+import logging
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .progress import ProgressTracker
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(self, name: str = "", total: Optional[int] = None):
+        """
+        State of one submitted unit of work.
+
+        Args:
+            name: Human-readable label
+            total: Expected number of work items (rows), if known up front
+        """
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = QUEUED
+        self.tracker = ProgressTracker(total=total)
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        # Set by jobs that write their output incrementally, so it can be streamed early
+        self.output_path = None
+
+    @property
+    def total(self) -> Optional[int]:
+        return self.tracker.total
+
+    @property
+    def done(self) -> int:
+        return self.tracker.rows_done
+
+    def set_total(self, total: int) -> None:
+        self.tracker.set_total(total)
+
+    def advance(self, count: int = 1) -> None:
+        """Record that ``count`` more work items have finished."""
+        self.tracker.row_done(count)
+
+    @property
+    def progress(self) -> Optional[float]:
+        """Fraction complete between 0 and 1, or None if the total is unknown."""
+        if self.status == SUCCEEDED:
+            return 1.0
+        if not self.total:
+            return None
+        return min(self.done / self.total, 1.0)
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """Estimated seconds remaining, from the throughput observed so far."""
+        if self.status != RUNNING:
+            return None
+        return self.tracker.eta_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Status summary suitable for a JSON response."""
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "progress": self.progress,
+            "eta_seconds": self.eta_seconds,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "calls_in_flight": self.tracker.calls_in_flight,
+            "cache_hit_rate": self.tracker.snapshot()["cache_hit_rate"],
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = 2, keep_finished: int = 100):
+        """
+        Run jobs on a local thread pool.
+
+        Args:
+            max_workers: Jobs allowed to run at the same time
+            keep_finished: Finished jobs kept for status queries before the oldest are dropped
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transform-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.keep_finished = keep_finished
+
+    def submit(self, func: Callable[..., Any], *args, name: str = "", total: Optional[int] = None,
+               **kwargs) -> Job:
+        """
+        Queue ``func(*args, job=job, **kwargs)`` and return immediately.
+
+        The function receives its ``Job`` as the ``job`` keyword argument so it can
+        report progress with ``job.advance()``. Its return value (typically the
+        path of the output file) becomes ``job.result``.
+        """
+        job = Job(name=name, total=total)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        logger.info(f"Submitted job {job.id} ({name})")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Job, func: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.tracker.started_at = job.started_at
+        try:
+            job.result = func(*args, job=job, **kwargs)
+            job.status = SUCCEEDED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+            logger.error(f"Job {job.id} failed: {e}\n{traceback.format_exc()}")
+        finally:
+            job.finished_at = time.time()
+            job.tracker.finish(job.error)
+
+    def _prune(self) -> None:
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
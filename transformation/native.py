@@ -0,0 +1,281 @@
+"""
+Vectorized execution of deterministic rules.
+
+D, O, R, T, J, C and F rules never needed the model: they are constants, copies,
+dictionary lookups, string joins and date reformatting (see ``dates``); S rules
+apply an operation of the string catalog (see ``strings``), P rules run a
+program synthesized for an X rule (see ``programs``) and A rules with an ID
+pattern generate IDs (see ``ids``). W rules select per row between two of
+these with a boolean mask (see ``conditions``). ``apply_rules`` runs them as
+whole-column pandas operations on a DataFrame. Rules that do need the model
+(X, A without a pattern, a T rule whose mapping can't be resolved to a single
+dictionary, or a W rule with such a branch) are reported by ``is_native`` so
+callers can send only those to the model.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .conditions import CONDITIONAL_RULE_TYPE, NUMERIC_OPERATORS, OPERATOR_ALIASES
+from .dates import DATE_RULE_TYPE, detect_format, reformat_dates
+from .id_patterns import ID_RULE_TYPE, parse_pattern
+from .ids import allocate_ids, generate_ids
+from .programs import PROGRAM_RULE_TYPE, run_program, validate_program
+from .strings import STRING_RULE_TYPE, apply_operation, parse_operation
+
+logger = logging.getLogger(__name__)
+
+NATIVE_TYPES = ("D", "O", "R", "T", "J", "C", DATE_RULE_TYPE, PROGRAM_RULE_TYPE, STRING_RULE_TYPE, ID_RULE_TYPE,
+                CONDITIONAL_RULE_TYPE)
+
+
+def is_native(rule: Dict[str, Any]) -> bool:
+    """Whether a compiled rule can run without the model."""
+    if rule["type"] not in NATIVE_TYPES:
+        return False
+    if rule["type"] in ("O", "R", "T", DATE_RULE_TYPE, STRING_RULE_TYPE) and not rule["source_columns"]:
+        return False
+    if rule["type"] == DATE_RULE_TYPE:
+        # The instruction of a date rule only describes the conversion for the fallback
+        return bool(rule["params"].get("target_format"))
+    if rule["type"] == PROGRAM_RULE_TYPE:
+        # Likewise, the instruction a program was synthesized from is kept for reference
+        return rule["params"].get("program") is not None
+    if rule["type"] == ID_RULE_TYPE:
+        # Without a pattern the ID is described in free text for the model
+        try:
+            parse_pattern(rule["params"].get("id_pattern") or "")
+        except ValueError as e:
+            if rule["params"].get("id_pattern"):
+                logger.warning(f"ID pattern for {rule['target_column']} can't run natively: {e}")
+            return False
+        return True
+    if rule["type"] == CONDITIONAL_RULE_TYPE:
+        return is_native(rule["params"]["then"]) and is_native(rule["params"]["else"])
+    if rule["type"] == STRING_RULE_TYPE:
+        try:
+            parse_operation(rule["params"].get("operation") or "")
+        except ValueError as e:
+            logger.warning(f"String operation for {rule['target_column']} can't run natively: {e}")
+            return False
+        return True
+    if rule["params"].get("instruction"):
+        # e.g. a C rule from the Flask forms that says how to join in free text
+        return False
+    if rule["type"] == "T":
+        return resolve_mapping(rule) is not None
+    return True
+
+
+def resolve_mapping(rule: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Find the value dictionary a T rule should use.
+
+    Rule forms carry a flat ``{value: replacement}`` mapping. Rules built from the
+    Transform sheet carry every map keyed by MapName, so the right one is picked
+    by matching the source or target column name.
+
+    Returns:
+        Flat mapping with string keys, or None if it can't be determined
+    """
+    mapping = rule["params"].get("mapping") or {}
+    if mapping and all(isinstance(value, dict) for value in mapping.values()):
+        by_name = {str(name).strip().lower(): inner for name, inner in mapping.items()}
+        candidates = rule["source_columns"] + [rule["target_column"]]
+        for name in candidates:
+            if name.strip().lower() in by_name:
+                mapping = by_name[name.strip().lower()]
+                break
+        else:
+            if len(mapping) != 1:
+                return None
+            mapping = next(iter(mapping.values()))
+    return {str(key).strip(): value for key, value in mapping.items()}
+
+
+def apply_rules(df: pd.DataFrame, plan: List[Dict[str, Any]], row_offset: int = 0) -> pd.DataFrame:
+    """
+    Apply native rules to a DataFrame.
+
+    Args:
+        df: Input rows
+        plan: Compiled rules; every rule must satisfy ``is_native``
+        row_offset: Position of ``df``'s first row in the input ``plan`` was
+                    prepared for with ``ids.allocate_ids``; ID rules that
+                    weren't prepared get their IDs allocated here
+
+    Returns:
+        DataFrame with one column per target, on the same index as ``df``
+    """
+    results = {}
+    for rule in prepare_rules(df, plan):
+        results[rule["target_column"]] = apply_rule(df, rule, row_offset)
+    return pd.DataFrame(results, index=df.index)
+
+
+def prepare_rules(df: pd.DataFrame, plan: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Settle, on the whole input, everything a rule would otherwise infer from
+    the rows it is given.
+
+    ID counters are reserved (see ``ids.allocate_ids``), float columns that
+    only hold whole numbers are marked so they render as integers, and F rules
+    without a source format get the format detected on their column. Call it
+    once before the input is split into partitions, so that every partition
+    renders the same value the same way; ``apply_rules`` leaves prepared
+    rules as they are.
+    """
+    return [_prepare(df, rule) for rule in allocate_ids(plan, len(df))]
+
+
+def _prepare(df: pd.DataFrame, rule: Dict[str, Any]) -> Dict[str, Any]:
+    params = dict(rule["params"])
+    if "integer_columns" not in params:
+        params["integer_columns"] = [col for col in rule["source_columns"]
+                                     if _whole_numbers(_column(df, col, warn=False))]
+    if rule["type"] == DATE_RULE_TYPE and not params.get("source_format") and "detected_format" not in params:
+        column = rule["source_columns"][0]
+        params["detected_format"] = detect_format(_column(df, column, warn=False), column)
+    for key in ("then", "else"):
+        if isinstance(params.get(key), dict) and "params" in params[key]:
+            params[key] = _prepare(df, params[key])
+    return {**rule, "params": params}
+
+
+def apply_rule(df: pd.DataFrame, rule: Dict[str, Any], row_offset: int = 0) -> pd.Series:
+    """Evaluate one native rule as a whole-column operation."""
+    rule_type = rule["type"]
+    params = rule["params"]
+
+    if rule_type == "D":
+        return pd.Series(params.get("default_value", ""), index=df.index, dtype=object)
+
+    if rule_type in ("O", "R"):
+        return _source_text(df, rule, rule["source_columns"][0])
+
+    if rule_type == "T":
+        source = _column(df, rule["source_columns"][0])
+        keys = source.where(source.isna(), source.astype(str).str.strip())
+        return keys.map(resolve_mapping(rule)).fillna("").astype(object)
+
+    if rule_type in ("J", "C"):
+        separator = params.get("separator", " ")
+        parts = [_source_text(df, rule, col) for col in rule["source_columns"]]
+        if not parts:
+            return pd.Series("", index=df.index, dtype=object)
+        joined = parts[0]
+        for part in parts[1:]:
+            joined = joined + separator + part
+        return joined.astype(object)
+
+    if rule_type == DATE_RULE_TYPE:
+        source = _column(df, rule["source_columns"][0])
+        # A prepared rule carries the format detected on the whole column, even if none was found
+        return reformat_dates(source, params["target_format"],
+                              params.get("source_format") or params.get("detected_format"),
+                              column=rule["source_columns"][0], detect="detected_format" not in params)
+
+    if rule_type == ID_RULE_TYPE:
+        if "id_start" not in params:
+            rule = allocate_ids([rule], len(df))[0]
+        columns = {col: _source_text(df, rule, col) for col in rule["source_columns"]}
+        return generate_ids(columns, rule, df.index, row_offset)
+
+    if rule_type == STRING_RULE_TYPE:
+        columns = [_source_text(df, rule, col) for col in rule["source_columns"]]
+        return apply_operation(columns, *parse_operation(params["operation"]))
+
+    if rule_type == CONDITIONAL_RULE_TYPE:
+        # Both branches run over the whole column; the mask picks per row
+        when = params["when"]
+        mask = condition_mask(_source_text(df, rule, when["column"]), when)
+        selected = np.where(mask, apply_rule(df, params["then"], row_offset).to_numpy(dtype=object),
+                            apply_rule(df, params["else"], row_offset).to_numpy(dtype=object))
+        return pd.Series(selected, index=df.index, dtype=object)
+
+    if rule_type == PROGRAM_RULE_TYPE:
+        validate_program(params["program"], rule["source_columns"])
+        columns = {col: _source_text(df, rule, col) for col in rule["source_columns"]}
+        return run_program(params["program"], columns, df.index)
+
+    raise ValueError(f"Rule type '{rule_type}' cannot be executed natively")
+
+
+def condition_mask(values: pd.Series, condition: Dict[str, Any]) -> np.ndarray:
+    """
+    Rows where a condition holds.
+
+    Args:
+        values: The condition column as text, nulls as empty strings
+        condition: Parsed condition
+
+    Returns:
+        Boolean mask; values are compared after stripping whitespace, and
+        ordering operators compare numerically (non-numbers never match)
+    """
+    op = OPERATOR_ALIASES.get(condition["op"], condition["op"])
+    value = condition.get("value")
+    text = values.astype(str).str.strip()
+    if op == "is empty":
+        mask = text == ""
+    elif op == "is not empty":
+        mask = text != ""
+    elif op in ("in", "not in"):
+        mask = text.isin([str(item).strip() for item in value])
+        mask = ~mask if op == "not in" else mask
+    elif op in NUMERIC_OPERATORS:
+        numbers = pd.to_numeric(text, errors="coerce")
+        mask = {">": numbers > value, "<": numbers < value,
+                ">=": numbers >= value, "<=": numbers <= value}[op].fillna(False)
+    else:
+        mask = text == _condition_text(value)
+        mask = ~mask if op == "!=" else mask
+    return mask.to_numpy(dtype=bool)
+
+
+def _condition_text(value: Any) -> str:
+    """Condition value as it appears in the text of a column, e.g. 1 and "1" alike."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return "" if value is None else str(value).strip()
+
+
+def _column(df: pd.DataFrame, name: str, warn: bool = True) -> pd.Series:
+    """Look up a source column, falling back to a case-insensitive match."""
+    if name in df.columns:
+        return df[name]
+    lowered = {str(col).strip().lower(): col for col in df.columns}
+    if name.strip().lower() in lowered:
+        return df[lowered[name.strip().lower()]]
+    if warn:
+        logger.warning(f"Source column '{name}' not found in input; using empty values")
+    return pd.Series(None, index=df.index, dtype=object)
+
+
+def _source_text(df: pd.DataFrame, rule: Dict[str, Any], name: str) -> pd.Series:
+    """A source column as text, integer rendering as settled by ``prepare_rules``."""
+    integer_columns = rule["params"].get("integer_columns")
+    return _as_text(_column(df, name), None if integer_columns is None else name in integer_columns)
+
+
+def _whole_numbers(values: pd.Series) -> bool:
+    """Whether a float column only holds whole numbers (integers with gaps are read as float)."""
+    return pd.api.types.is_float_dtype(values) and bool((values.dropna() % 1 == 0).all())
+
+
+def _as_text(values: pd.Series, integer: Optional[bool] = None) -> pd.Series:
+    """
+    Render values the way the model was asked to: as-is, with nulls as empty strings.
+
+    Args:
+        values: Column values
+        integer: Render a float column as integers, e.g. "1234" rather than
+                 "1234.0"; decided from ``values`` when not given
+    """
+    if integer is None:
+        integer = _whole_numbers(values)
+    if integer and pd.api.types.is_float_dtype(values):
+        values = values.astype("Int64")
+    return values.astype(object).where(values.notna(), "").astype(str)
@@ -0,0 +1,226 @@
+"""
+Columnar output assembly.
+
+Instead of collecting one dict per row and letting ``pd.DataFrame`` work out the
+columns at the end, ``OutputBuilder`` fixes the target schema up front and
+writes results straight into preallocated per-column arrays. Columns the model
+leaves out stay null instead of disappearing from the frame.
+
+``CsvChunkWriter`` and ``iter_csv`` write or stream the result in blocks of
+rows, so web front ends can send a download as it is produced instead of
+holding several full copies of the CSV text in memory.
+"""
+import io
+import logging
+import os
+import tempfile
+import time
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .rules import compile_rules, target_schema
+
+logger = logging.getLogger(__name__)
+
+# Rows per CSV block when writing or streaming output
+CSV_CHUNK_ROWS = 10_000
+
+# Bytes per read when streaming a CSV file to a client
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class OutputBuilder:
+    def __init__(self, schema: Sequence[str], n_rows: int):
+        """
+        Preallocate output storage for a fixed schema.
+
+        Args:
+            schema: Ordered output column names
+            n_rows: Number of rows the output will hold
+        """
+        self.schema = list(dict.fromkeys(schema))
+        self.n_rows = n_rows
+        self._columns = {col: np.full(n_rows, None, dtype=object) for col in self.schema}
+        self._filled = np.zeros(n_rows, dtype=bool)
+        self._failed = np.zeros(n_rows, dtype=bool)
+        self._unexpected = set()
+
+    @classmethod
+    def from_rules(cls, rules: Union[List[Dict], Dict[str, Dict]], n_rows: int) -> "OutputBuilder":
+        """Build an output for the target columns of a rule set in either supported shape."""
+        return cls(target_schema(compile_rules(rules)), n_rows)
+
+    def set_row(self, position: int, values: Dict[str, Any]) -> None:
+        """
+        Store one transformed row.
+
+        Args:
+            position: Zero-based row position in the input
+            values: Column values returned for the row; keys outside the schema are ignored
+        """
+        for col in self.schema:
+            if col in values:
+                self._columns[col][position] = values[col]
+        self._filled[position] = True
+
+        extra = values.keys() - self._columns.keys()
+        if extra - self._unexpected:
+            self._unexpected.update(extra)
+            logger.warning(f"Ignoring columns outside the target schema: {sorted(extra)}")
+
+    def set_column(self, column: str, values: Iterable[Any], start: int = 0) -> None:
+        """
+        Store a block of values for one column, e.g. from a vectorized rule.
+
+        The rows don't count as filled: whether a row got its model results is
+        tracked by ``set_row`` and ``mark_failed``.
+
+        Args:
+            column: Target column name, must be part of the schema
+            values: Values for consecutive rows
+            start: Row position of the first value
+        """
+        if column not in self._columns:
+            raise KeyError(f"Column '{column}' is not part of the target schema")
+        if not hasattr(values, "__len__"):
+            values = list(values)
+        values = np.asarray(values, dtype=object)
+        self._columns[column][start:start + len(values)] = values
+
+    def mark_failed(self, rows: Union[int, slice, np.ndarray]) -> None:
+        """
+        Record rows for which a model rule returned no result.
+
+        Args:
+            rows: Row position, slice or boolean mask; the rows stay failed
+                  whatever is written to them afterwards
+        """
+        self._failed[rows] = True
+
+    @property
+    def filled_count(self) -> int:
+        """Number of rows that have received a result through ``set_row``."""
+        return int(self._filled.sum())
+
+    @property
+    def filled(self) -> np.ndarray:
+        """Boolean mask of the rows that have received a result through ``set_row``."""
+        return self._filled.copy()
+
+    @property
+    def succeeded(self) -> np.ndarray:
+        """Boolean mask of the rows for which no model rule failed."""
+        return ~self._failed
+
+    def to_frame(self, include_unfilled: bool = True) -> pd.DataFrame:
+        """
+        Assemble the final DataFrame in schema order.
+
+        Args:
+            include_unfilled: Keep rows that never received a result (as all-null rows)
+
+        Returns:
+            Output DataFrame with exactly the schema columns
+        """
+        output_df = pd.DataFrame(self._columns, columns=self.schema)
+        if not include_unfilled:
+            output_df = output_df[self._filled].reset_index(drop=True)
+        return output_df
+
+    def frame_slice(self, start: int, stop: int) -> pd.DataFrame:
+        """Rows ``start:stop`` as a DataFrame, without materializing the rest."""
+        return pd.DataFrame({col: self._columns[col][start:stop] for col in self.schema},
+                            columns=self.schema, index=pd.RangeIndex(start, min(stop, self.n_rows)))
+
+
+class CsvChunkWriter:
+    def __init__(self, path: str, schema: Sequence[str]):
+        """
+        Append blocks of rows to a CSV file as they are finished.
+
+        The header is written on creation and the file is flushed after every
+        block, so readers following the file see complete rows only.
+
+        Args:
+            path: Output CSV path; parent directories are created
+            schema: Ordered output columns
+        """
+        self.path = path
+        self.schema = list(schema)
+        self.rows_written = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        pd.DataFrame(columns=self.schema).to_csv(self._file, index=False)
+        self._file.flush()
+
+    def write(self, output_df: pd.DataFrame) -> None:
+        """Append rows; columns are written in schema order."""
+        output_df.reindex(columns=self.schema).to_csv(self._file, index=False, header=False)
+        self._file.flush()
+        self.rows_written += len(output_df)
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self) -> "CsvChunkWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def iter_csv(output_df: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[str]:
+    """
+    CSV text for a DataFrame, one block of rows at a time, header first.
+
+    Yields:
+        CSV text chunks that concatenate to ``output_df.to_csv(index=False)``
+    """
+    for start in range(0, max(len(output_df), 1), chunk_rows):
+        buffer = io.StringIO()
+        output_df.iloc[start:start + chunk_rows].to_csv(buffer, index=False, header=(start == 0))
+        yield buffer.getvalue()
+
+
+def csv_tempfile(output_df: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS) -> IO[bytes]:
+    """
+    Write a DataFrame as CSV to an anonymous temporary file, block by block.
+
+    Returns:
+        The open file, rewound to the start; it is deleted when closed
+    """
+    csv_file = tempfile.TemporaryFile(suffix=".csv")
+    for chunk in iter_csv(output_df, chunk_rows):
+        csv_file.write(chunk.encode("utf-8"))
+    csv_file.seek(0)
+    return csv_file
+
+
+def follow_file(path: str, is_finished: Callable[[], bool], poll_interval: float = 0.5,
+                chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    Stream a file that may still be growing, like ``tail -f``.
+
+    Args:
+        path: File to read
+        is_finished: Returns True once the writer will add nothing more
+        poll_interval: Seconds to wait for new data before checking again
+
+    Yields:
+        Byte chunks in file order, ending after the writer has finished
+    """
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_bytes)
+            if data:
+                yield data
+                continue
+            if is_finished():
+                # Pick up anything written between the last read and the check
+                for data in iter(lambda: f.read(chunk_bytes), b""):
+                    yield data
+                return
+            time.sleep(poll_interval)
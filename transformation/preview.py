@@ -0,0 +1,192 @@
+"""
+Instant rule previews on a small sample.
+
+Checking a rule used to mean running the whole file through the model.
+``preview_rules`` applies a rule set to a handful of representative rows
+instead:
+
+* native rules (see ``native.is_native``) are evaluated straight away
+* model rules are answered from a ``PreviewCache`` keyed by rule and input
+  values, and whatever is missing is sent to the model as one batched call
+
+so each edit of a rule form gets feedback in well under a second, and re-running
+an unchanged model rule costs nothing.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from . import serialization
+from .executor import referenced_columns
+from .native import apply_rules, is_native
+from .rules import compile_rules, target_schema
+from .sampling import sample_for_rules
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_ROWS = 20
+
+# Called with the rows and rules of one batch; returns one result dict per row
+ModelBatch = Callable[[List[Dict[str, Any]], Dict[str, Dict[str, Any]]], List[Dict[str, Any]]]
+
+
+class PreviewCache:
+    def __init__(self, max_entries: int = 10_000):
+        """
+        LRU cache of model results for single (rule, row) pairs.
+
+        Args:
+            max_entries: Results kept before the least recently used are dropped
+        """
+        self.max_entries = max_entries
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(rule: Dict[str, Any], row: Dict[str, Any]) -> str:
+        """Cache key for a compiled rule applied to the values it reads from a row."""
+        if rule["source_columns"]:
+            # Source columns match the input case-insensitively, like the native engine
+            lowered = {str(col).strip().lower(): value for col, value in row.items()}
+            values = [lowered.get(col.strip().lower()) for col in rule["source_columns"]]
+        else:
+            values = [[col, row[col]] for col in sorted(row)]
+        return serialization.fingerprint([rule, values])
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Returns ``(found, value)``."""
+        with self._lock:
+            if key not in self._values:
+                return False, None
+            self._values.move_to_end(key)
+            return True, self._values[key]
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+
+def preview_sample(df: pd.DataFrame, plan: List[Dict[str, Any]], n_rows: int = PREVIEW_ROWS) -> pd.DataFrame:
+    """Representative rows for a preview; see ``sampling.stratified_sample``."""
+    return sample_for_rules(df, plan, max_rows=n_rows)
+
+
+def preview_rules(df: pd.DataFrame, rules: Union[List[Dict], Dict[str, Dict]],
+                  model_batch: Optional[ModelBatch] = None, cache: Optional[PreviewCache] = None,
+                  n_rows: int = PREVIEW_ROWS) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Apply rules to a sample of the input.
+
+    Args:
+        df: Full input
+        rules: Rules in any shape accepted by ``compile_rules``
+        model_batch: Function answering model rules for a batch of rows; without
+                     it, model rules are filled from the cache only
+        cache: Cache of earlier model results
+        n_rows: Sample size
+
+    Returns:
+        ``(sample, output)``: the sampled input rows and the previewed target
+        columns on the same index; values that couldn't be computed are null
+    """
+    plan = compile_rules(rules)
+    sample = preview_sample(df, plan, n_rows)
+    output = pd.DataFrame(index=sample.index, columns=target_schema(plan), dtype=object)
+
+    native_plan = [rule for rule in plan if is_native(rule)]
+    model_plan = [rule for rule in plan if not is_native(rule)]
+    if native_plan:
+        native = apply_rules(sample, native_plan)
+        for col in native.columns:
+            output[col] = native[col]
+    if model_plan:
+        _preview_model_rules(sample, model_plan, output, model_batch, cache)
+    return sample, output
+
+
+def _preview_model_rules(sample: pd.DataFrame, plan: List[Dict[str, Any]], output: pd.DataFrame,
+                         model_batch: Optional[ModelBatch], cache: Optional[PreviewCache]) -> None:
+    if all(rule["source_columns"] for rule in plan):
+        # Only send the model the columns the rules read
+        sample = sample[referenced_columns(sample, plan)]
+    rows = [_row_dict(row) for _, row in sample.iterrows()]
+    keys = [[PreviewCache.key(rule, row) for rule in plan] for row in rows]
+
+    missing = []
+    for position, row_keys in enumerate(keys):
+        complete = True
+        for rule, key in zip(plan, row_keys):
+            found, value = cache.get(key) if cache is not None else (False, None)
+            if found:
+                output.iat[position, output.columns.get_loc(rule["target_column"])] = value
+            else:
+                complete = False
+        if not complete:
+            missing.append(position)
+
+    if not missing or model_batch is None:
+        return
+    rules_by_target = {rule["target_column"]: rule for rule in plan}
+    try:
+        results = model_batch([rows[position] for position in missing], rules_by_target)
+    except Exception as e:
+        logger.warning(f"Preview model call failed: {e}")
+        return
+
+    for position, result in zip(missing, results):
+        if not isinstance(result, dict):
+            continue
+        for rule, key in zip(plan, keys[position]):
+            if rule["target_column"] in result:
+                value = result[rule["target_column"]]
+                output.iat[position, output.columns.get_loc(rule["target_column"])] = value
+                if cache is not None:
+                    cache.put(key, value)
+
+
+def _row_dict(row: pd.Series) -> Dict[str, Any]:
+    return {col: (None if pd.isna(value) else value) for col, value in row.items()}
+
+
+def batch_prompt(rows: List[Dict[str, Any]], rules: Dict[str, Dict[str, Any]]) -> str:
+    """Prompt asking the model to transform several rows in one call."""
+    return f"""
+        You are a data transformation engine. Apply the TRANSFORMATION RULES to every row in INPUT ROWS.
+
+        TRANSFORMATION RULES (keyed by target column):
+        {serialization.dumps(rules)}
+
+        INPUT ROWS:
+        {serialization.dumps(rows)}
+
+        Return ONLY a JSON array with exactly one object per input row, in the same order.
+        Each object must contain only the target columns: {serialization.dumps(list(rules))}
+        """
+
+
+def parse_batch_response(content: str, n_rows: int) -> List[Dict[str, Any]]:
+    """
+    Parse the JSON array returned for ``batch_prompt``.
+
+    Raises:
+        ValueError: If the response isn't an array with one entry per row
+    """
+    start_index = content.find('[')
+    end_index = content.rfind(']') + 1
+    if start_index == -1 or end_index <= start_index:
+        raise ValueError(f"No JSON array in model response: {content[:200]}")
+    results = serialization.loads(content[start_index:end_index])
+    if not isinstance(results, list) or len(results) != n_rows:
+        raise ValueError(f"Expected {n_rows} results, got {len(results) if isinstance(results, list) else results!r}")
+    return results
+
+
+def preview_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Rows of a preview frame as JSON-ready dicts, with nulls as None."""
+    return [_row_dict(row) for _, row in frame.iterrows()]
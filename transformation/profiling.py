@@ -0,0 +1,192 @@
+"""
+Input column profiling and per-rule execution strategies.
+
+How a model rule should be executed depends on the data it reads:
+
+* a rule over a column with a few hundred distinct values (a country, a status
+  code) only needs one model call per distinct value, whose answer is then
+  broadcast to every row with that value
+* a rule over a mostly unique column (a name, an address) has to see every row,
+  and short values can share one call in batches of rows
+* native rules never need the model
+
+``profile_columns`` computes what that decision needs in one fast pass right
+after the input is loaded: distinct counts (over 64-bit value hashes, so object
+columns aren't compared as Python strings), null fractions and average value
+lengths. ``plan_strategies`` turns the profiles into one strategy per rule, and
+``group_model_calls`` into the model calls that carry them out.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .executor import referenced_columns
+from .native import is_native
+
+logger = logging.getLogger(__name__)
+
+NATIVE = "native"
+PER_VALUE = "per_value"
+BATCH = "batch"
+
+# Rows whose text is measured for average lengths; evenly spaced over the input
+LENGTH_SAMPLE_ROWS = 100_000
+
+# Model rules are run per distinct value when there are at most this many
+# distinct values per row (e.g. 0.5 = at least two rows share each value on average)
+PER_VALUE_MAX_RATIO = 0.5
+
+# Rule types whose result depends on more than the source values and so can't
+# be shared between rows (A generates identifiers)
+ROW_DEPENDENT_TYPES = ("A",)
+
+# Approximate prompt budget for the input rows of one batched call
+BATCH_INPUT_CHARS = 6_000
+MAX_BATCH_ROWS = 50
+
+# Characters of JSON overhead per value in a prompt (key, quotes, separators)
+VALUE_OVERHEAD_CHARS = 8
+
+
+def profile_columns(df: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Profile input columns.
+
+    Args:
+        df: Input rows
+        columns: Columns to profile; defaults to all columns
+
+    Returns:
+        Profile per column with ``rows``, ``distinct`` (non-null distinct values),
+        ``null_fraction`` and ``avg_length`` (characters of the non-null values)
+    """
+    columns = list(df.columns if columns is None else columns)
+    step = max(1, len(df) // LENGTH_SAMPLE_ROWS)
+    profiles = {}
+    for col in columns:
+        values = df[col]
+        present = values.notna()
+        non_null = values[present]
+        if len(non_null):
+            hashes = pd.util.hash_pandas_object(non_null, index=False).to_numpy()
+            distinct = int(len(pd.unique(hashes)))
+            avg_length = float(non_null.iloc[::step].astype(str).str.len().mean())
+        else:
+            distinct, avg_length = 0, 0.0
+        profiles[col] = {
+            "rows": len(values),
+            "distinct": distinct,
+            "null_fraction": float(1 - present.mean()) if len(values) else 0.0,
+            "avg_length": avg_length,
+        }
+    return profiles
+
+
+def plan_strategies(plan: List[Dict[str, Any]], df: pd.DataFrame,
+                    profiles: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Choose the cheapest correct execution strategy for each compiled rule.
+
+    Args:
+        plan: Compiled rules
+        df: Input rows the plan will run on
+        profiles: Output of ``profile_columns``; computed for the referenced
+                  columns when not given
+
+    Returns:
+        One dict per rule, in plan order, with ``target_column``, ``type``,
+        ``strategy`` (``native``, ``per_value`` or ``batch``), ``source_columns``
+        (input column names as found in ``df``), ``distinct`` (distinct source
+        values, or rows for batch rules), ``batch_size`` and ``calls``
+        (model calls the strategy needs)
+    """
+    if profiles is None:
+        model_rules = [rule for rule in plan if not is_native(rule)]
+        # Rules without source columns are sent whole rows
+        whole_rows = any(not rule["source_columns"] for rule in model_rules)
+        profiles = profile_columns(df, None if whole_rows else referenced_columns(df, model_rules))
+    n_rows = len(df)
+
+    strategies = []
+    for rule in plan:
+        sources = referenced_columns(df, [rule])
+        entry = {
+            "target_column": rule["target_column"],
+            "type": rule["type"],
+            "source_columns": sources,
+            "batch_size": 1,
+        }
+        if is_native(rule):
+            entry.update(strategy=NATIVE, distinct=0, calls=0)
+            strategies.append(entry)
+            continue
+
+        shareable = bool(sources) and rule["type"] not in ROW_DEPENDENT_TYPES
+        distinct = _distinct_combinations(df, sources, profiles) if shareable else n_rows
+        if shareable and distinct <= n_rows * PER_VALUE_MAX_RATIO:
+            entry.update(strategy=PER_VALUE, distinct=distinct, calls=distinct)
+        else:
+            batch_size = _batch_size(sources or list(df.columns), profiles)
+            entry.update(strategy=BATCH, distinct=n_rows, batch_size=batch_size,
+                         calls=int(np.ceil(n_rows / batch_size)) if n_rows else 0)
+        strategies.append(entry)
+
+    for entry in strategies:
+        logger.info(f"Rule {entry['type']} -> {entry['target_column']}: {entry['strategy']} "
+                    f"({entry['calls']} model calls)")
+    return strategies
+
+
+def group_model_calls(plan: List[Dict[str, Any]], df: pd.DataFrame,
+                      profiles: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Model rules grouped into the calls that run them.
+
+    Per-value rules reading the same source columns share one call per
+    distinct combination of those values; all batch rules share batches of the
+    smallest batch size among them. The engine sends its model calls this way,
+    and the dry-run estimate counts them from the same groups.
+
+    Args:
+        plan: Compiled model rules
+        df: Input rows the plan will run on
+        profiles: Output of ``profile_columns``, as for ``plan_strategies``
+
+    Returns:
+        One dict per group, per-value groups first, with ``strategy``,
+        ``rules`` (positions in ``plan``), ``strategies`` (their entries from
+        ``plan_strategies``), ``batch_size`` and ``calls``
+    """
+    strategies = plan_strategies(plan, df, profiles)
+    per_value = {}
+    for position, entry in enumerate(strategies):
+        if entry["strategy"] == PER_VALUE:
+            per_value.setdefault(tuple(entry["source_columns"]), []).append(position)
+    groups = [{"strategy": PER_VALUE, "rules": members, "strategies": [strategies[i] for i in members],
+               "batch_size": 1, "calls": strategies[members[0]]["distinct"]}
+              for members in per_value.values()]
+
+    batched = [position for position, entry in enumerate(strategies) if entry["strategy"] == BATCH]
+    if batched:
+        batch_size = min(strategies[i]["batch_size"] for i in batched)
+        groups.append({"strategy": BATCH, "rules": batched, "strategies": [strategies[i] for i in batched],
+                       "batch_size": batch_size, "calls": int(np.ceil(len(df) / batch_size)) if len(df) else 0})
+    return groups
+
+
+def _distinct_combinations(df: pd.DataFrame, sources: List[str], profiles: Dict[str, Dict[str, Any]]) -> int:
+    """Distinct value combinations of the source columns, nulls included."""
+    if len(sources) == 1:
+        profile = profiles.get(sources[0])
+        if profile is not None:
+            return profile["distinct"] + (1 if profile["null_fraction"] else 0)
+    hashes = pd.util.hash_pandas_object(df[sources], index=False).to_numpy()
+    return int(len(pd.unique(hashes)))
+
+
+def _batch_size(columns: List[str], profiles: Dict[str, Dict[str, Any]]) -> int:
+    """Rows per model call so that the batch stays within the prompt budget."""
+    row_chars = sum(profiles.get(col, {}).get("avg_length", 0.0) + VALUE_OVERHEAD_CHARS for col in columns)
+    return int(max(1, min(MAX_BATCH_ROWS, BATCH_INPUT_CHARS // max(row_chars, 1))))
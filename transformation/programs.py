@@ -0,0 +1,349 @@
+"""
+Cached transformation programs for custom (X) rules.
+
+Many X rules are deterministic string edits ("mask the email after the @ with
+***", "rearrange the date") that the model used to perform by hand for every
+row. ``synthesize_program`` asks the model once to express the instruction as a
+program in a small expression language, checks the program against the
+model's own answers for a stratified sample of rows, and returns a native rule
+(type P) that runs the program vectorized over the whole column. A model call
+count that grew with the rows becomes a fixed handful per rule.
+
+Programs are JSON, never code. An expression is one of
+
+* a JSON string: a literal
+* ``{"col": "Email"}``: one of the rule's source columns, as text
+* ``{"fn": name, "args": [...]}``: one of the ``FUNCTIONS`` below
+
+Only those functions exist, their literal arguments are type-checked, and the
+size and depth of a program are bounded, so a program can't do anything but
+compute strings from the rule's source columns.
+
+``ProgramCache`` keeps the result per instruction hash, including instructions
+whose program failed the check, so they go straight to the per-row path next
+time; with a path it persists across runs.
+"""
+import logging
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from . import serialization
+from .dates import reformat_dates
+from .strings import OPERATIONS, apply_operation
+
+logger = logging.getLogger(__name__)
+
+PROGRAM_RULE_TYPE = "P"
+
+# Functions of the expression language: argument kinds and minimum argument
+# count; a kind ending in "*" may repeat. "expr" is an expression, "str" and
+# "int" are JSON literals. The operations of the ``strings`` catalog take the
+# text they work on as first argument.
+FUNCTIONS = {
+    **{name: (["expr", *operation.arguments], 1 + operation.required)
+       for name, operation in OPERATIONS.items() if name != "concat"},
+    "slice": (["expr", "int", "int"], 2),
+    "concat": (["expr*"], 1),
+    "if_empty": (["expr", "expr"], 2),
+    "date": (["expr", "str", "str"], 3),
+}
+
+# Older names of catalog operations
+ALIASES = {"slice": "substring"}
+
+# Bounds on a program's size
+MAX_NODES = 64
+MAX_DEPTH = 8
+MAX_LITERAL_LENGTH = 200
+
+# Sampled rows a program is checked against
+SAMPLE_ROWS = 12
+
+# Model calls ``synthesize_program`` makes for an instruction it hasn't seen:
+# one batch answering the sampled rows and one asking for the program
+SYNTHESIS_CALLS = 2
+
+# Returns the text of the model's reply to a prompt
+Complete = Callable[[str], str]
+
+# Called with rows and rules keyed by target column; returns one result dict per row
+ModelBatch = Callable[[List[Dict[str, Any]], Dict[str, Dict[str, Any]]], List[Dict[str, Any]]]
+
+
+class ProgramCache:
+    def __init__(self, path: Optional[str] = None):
+        """
+        Programs by instruction hash.
+
+        Args:
+            path: JSON file the programs are kept in; in memory only when omitted
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._programs = self._read()
+
+    @staticmethod
+    def key(rule: Dict[str, Any]) -> str:
+        """Hash of a compiled X rule's instruction and source columns."""
+        return serialization.fingerprint([rule["params"].get("instruction"), rule["source_columns"]])
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Returns ``(found, program)``; the program is None for instructions without one."""
+        with self._lock:
+            if key not in self._programs:
+                return False, None
+            return True, self._programs[key]
+
+    def put(self, key: str, program: Any) -> None:
+        with self._lock:
+            self._programs[key] = program
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path + ".tmp", "wb") as f:
+                    f.write(serialization.dumps_bytes(self._programs))
+                os.replace(self.path + ".tmp", self.path)
+
+    def _read(self) -> Dict[str, Any]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "rb") as f:
+                return serialization.loads(f.read())
+        except Exception as e:
+            logger.warning(f"Program cache {self.path} can't be read, starting empty: {e}")
+            return {}
+
+
+def is_candidate(rule: Dict[str, Any]) -> bool:
+    """Whether a compiled rule is an X rule a program could replace."""
+    return (rule["type"] == "X" and bool(rule["params"].get("instruction"))
+            and bool(rule["source_columns"]))
+
+
+def validate_program(program: Any, source_columns: List[str]) -> None:
+    """
+    Check that a program only uses the expression language.
+
+    Raises:
+        ValueError: Describing the first problem found
+    """
+    allowed = {col.strip().lower() for col in source_columns}
+    nodes = 0
+
+    def check(expr: Any, depth: int) -> None:
+        nonlocal nodes
+        nodes += 1
+        if nodes > MAX_NODES or depth > MAX_DEPTH:
+            raise ValueError(f"Program larger than {MAX_NODES} nodes or deeper than {MAX_DEPTH}")
+        if isinstance(expr, str):
+            _check_literal(expr)
+            return
+        if not isinstance(expr, dict):
+            raise ValueError(f"Not an expression: {expr!r}")
+        if set(expr) == {"col"}:
+            if not isinstance(expr["col"], str) or expr["col"].strip().lower() not in allowed:
+                raise ValueError(f"Column {expr['col']!r} is not a source column of the rule")
+            return
+        if set(expr) - {"fn", "args"} or expr.get("fn") not in FUNCTIONS:
+            raise ValueError(f"Unknown expression: {expr!r}")
+        args = expr.get("args", [])
+        kinds, minimum = FUNCTIONS[expr["fn"]]
+        if not isinstance(args, list) or len(args) < minimum or (
+                len(args) > len(kinds) and not kinds[-1].endswith("*")):
+            raise ValueError(f"Wrong number of arguments for {expr['fn']}: {args!r}")
+        for position, arg in enumerate(args):
+            kind = kinds[min(position, len(kinds) - 1)].rstrip("*")
+            if kind == "expr":
+                check(arg, depth + 1)
+            elif kind == "int" and (not isinstance(arg, int) or isinstance(arg, bool)):
+                raise ValueError(f"Argument {position} of {expr['fn']} must be an integer: {arg!r}")
+            elif kind == "str":
+                if not isinstance(arg, str):
+                    raise ValueError(f"Argument {position} of {expr['fn']} must be a string: {arg!r}")
+                _check_literal(arg)
+        if expr["fn"] == "regex_replace":
+            try:
+                re.compile(args[1])
+            except re.error as e:
+                raise ValueError(f"Invalid pattern {args[1]!r}: {e}")
+
+    check(program, 0)
+
+
+def run_program(program: Any, columns: Dict[str, pd.Series], index: pd.Index) -> pd.Series:
+    """
+    Evaluate a validated program.
+
+    Args:
+        program: Expression tree
+        columns: Source column values as text, by column name
+        index: Index of the result
+
+    Returns:
+        One string per row
+    """
+    by_name = {name.strip().lower(): values for name, values in columns.items()}
+
+    def evaluate(expr: Any) -> pd.Series:
+        if isinstance(expr, str):
+            return pd.Series(expr, index=index, dtype=object)
+        if "col" in expr:
+            return by_name[expr["col"].strip().lower()].astype(object).fillna("").astype(str)
+        fn, args = expr["fn"], expr.get("args", [])
+        if fn == "concat":
+            result = evaluate(args[0])
+            for arg in args[1:]:
+                result = result + evaluate(arg)
+            return result
+        if fn == "if_empty":
+            value = evaluate(args[0])
+            return value.where(value.str.strip() != "", evaluate(args[1]))
+
+        text = evaluate(args[0])
+        if fn in OPERATIONS or fn in ALIASES:
+            return apply_operation([text], ALIASES.get(fn, fn), tuple(args[1:]))
+        if fn == "date":
+            return reformat_dates(text, args[2], args[1] or None).fillna("")
+        raise ValueError(f"Unknown function {fn}")
+
+    return evaluate(program)
+
+
+def synthesis_prompt(rule: Dict[str, Any], examples: List[Dict[str, Any]]) -> str:
+    """Prompt asking the model to express an X rule as a program."""
+    functions = "\n".join(f"- {name}({', '.join(kinds)})" for name, (kinds, _) in FUNCTIONS.items())
+    return f"""
+You translate data transformation instructions into programs in a small JSON expression language.
+
+INSTRUCTION:
+{rule["params"]["instruction"]}
+
+SOURCE COLUMNS: {serialization.dumps(rule["source_columns"])}
+
+EXPRESSIONS:
+- a JSON string is a literal
+- {{"col": "<source column>"}} is the column's value as text ("" when empty)
+- {{"fn": "<function>", "args": [...]}} calls one of these functions; "expr" arguments
+  are expressions, "str" and "int" arguments are JSON literals, "*" may repeat:
+{functions}
+
+Notes: substring uses Python slice semantics; split takes the item at the index ("" if
+missing); before/after split at the first occurrence; mask keeps the given number of
+characters at the start and end and replaces the rest with the character; mask_after
+replaces everything after the separator; date converts between patterns built from
+YYYY, YY, MMMM, MMM, MM, DD, HH, MI and SS.
+
+EXAMPLES OF THE EXPECTED RESULT:
+{serialization.dumps(examples)}
+
+If the instruction can be expressed, return ONLY {{"program": <expression>}}.
+If it needs judgement, knowledge or data other than the source columns, return {{"program": null}}.
+"""
+
+
+def synthesize_program(df: pd.DataFrame, rule: Dict[str, Any], complete: Complete, model_batch: ModelBatch,
+                       cache: Optional["ProgramCache"] = None,
+                       sample_rows: int = SAMPLE_ROWS) -> Optional[Dict[str, Any]]:
+    """
+    Replace an X rule by a native program rule.
+
+    Args:
+        df: Input rows
+        rule: Compiled X rule (see ``is_candidate``)
+        complete: Returns the model's reply to a prompt
+        model_batch: Answers the rule for a batch of rows; these answers are
+                     what the program has to reproduce
+        cache: Programs found earlier
+        sample_rows: Rows the program is checked against
+
+    Returns:
+        A compiled rule of type P, or None if the rule has to stay with the model
+    """
+    # Imported here: native (which sampling depends on) dispatches P rules to this module
+    from .native import apply_rules
+    from .sampling import stratified_sample
+
+    key = ProgramCache.key(rule)
+    found, program = cache.get(key) if cache is not None else (False, None)
+    if found:
+        return program_rule(rule, program) if program is not None else None
+
+    columns = _source_columns(df, rule)
+    if len(columns) != len(rule["source_columns"]):
+        return None
+    sample = stratified_sample(df[columns], max_rows=sample_rows)
+    # Random rows rarely include empty sources; the program must handle them too
+    empty = df[columns].isna().all(axis=1) | (df[columns].astype(str).apply(lambda col: col.str.strip()) == "").all(axis=1)
+    if empty.any() and not empty[sample.index].any():
+        sample = pd.concat([sample, df[columns][empty].head(1)])
+    rows = [{col: (None if pd.isna(value) else value) for col, value in row.items()}
+            for _, row in sample.iterrows()]
+    target = rule["target_column"]
+    try:
+        answers = model_batch(rows, {target: rule})
+        expected = [answer.get(target) if isinstance(answer, dict) else None for answer in answers]
+        examples = [{"input": row, "output": value} for row, value in zip(rows, expected)]
+        reply = complete(synthesis_prompt(rule, examples))
+        start, end = reply.find("{"), reply.rfind("}") + 1
+        program = serialization.loads(reply[start:end]).get("program") if start != -1 else None
+    except Exception as e:
+        # Not cached: the call may succeed next time
+        logger.warning(f"Program synthesis for {target} failed: {e}")
+        return None
+
+    if program is not None:
+        try:
+            validate_program(program, rule["source_columns"])
+            actual = apply_rules(sample, [program_rule(rule, program)])[target]
+            mismatches = [(row, want, got) for row, want, got in zip(rows, expected, actual)
+                          if _normalize(want) != _normalize(got)]
+            if mismatches:
+                raise ValueError(f"{len(mismatches)} of {len(rows)} sampled rows differ, e.g. {mismatches[0]}")
+        except Exception as e:
+            logger.info(f"Program for {target} rejected: {e}")
+            program = None
+
+    if cache is not None:
+        cache.put(key, program)
+    if program is None:
+        logger.info(f"No program for {target}, it stays with the model")
+        return None
+    logger.info(f"Compiled {target} into a program: {serialization.dumps(program)}")
+    return program_rule(rule, program)
+
+
+def synthesis_calls(df: pd.DataFrame, rule: Dict[str, Any], cache: Optional["ProgramCache"] = None) -> int:
+    """Model calls ``synthesize_program`` would make for a rule, without making them."""
+    if cache is not None and cache.get(ProgramCache.key(rule))[0]:
+        return 0
+    if len(_source_columns(df, rule)) != len(rule["source_columns"]):
+        return 0
+    return SYNTHESIS_CALLS
+
+
+def program_rule(rule: Dict[str, Any], program: Any) -> Dict[str, Any]:
+    """Native rule running ``program`` in place of a compiled X rule."""
+    return {
+        "type": PROGRAM_RULE_TYPE,
+        "target_column": rule["target_column"],
+        "source_columns": list(rule["source_columns"]),
+        "params": {**rule["params"], "program": program},
+    }
+
+
+def _source_columns(df: pd.DataFrame, rule: Dict[str, Any]) -> List[str]:
+    lowered = {str(col).strip().lower(): col for col in df.columns}
+    return [lowered[col.strip().lower()] for col in rule["source_columns"] if col.strip().lower() in lowered]
+
+
+def _check_literal(value: str) -> None:
+    if len(value) > MAX_LITERAL_LENGTH:
+        raise ValueError(f"Literal longer than {MAX_LITERAL_LENGTH} characters")
+
+
+def _normalize(value: Any) -> str:
+    return "" if value is None or (isinstance(value, float) and pd.isna(value)) else str(value).strip()
@@ -0,0 +1,192 @@
+"""
+Progress reporting for running transformations.
+
+The execution code records what it does on a ``ProgressTracker`` (rows
+finished, model calls started and finished, cache hits and misses) and never
+talks to a UI directly. Front ends read from the tracker at their own pace:
+
+* listeners registered with ``add_listener`` are called at most once every
+  ``min_interval`` seconds (plus once at the end), which is how the Streamlit
+  apps update their progress bar without redrawing on every row
+* ``sse_events`` turns the tracker into a server-sent-events stream for Flask
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from . import serialization
+
+
+class ProgressTracker:
+    def __init__(self, total: Optional[int] = None, min_interval: float = 0.5):
+        """
+        Args:
+            total: Expected number of rows, if known
+            min_interval: Minimum seconds between listener notifications
+        """
+        self.total = total
+        self.min_interval = min_interval
+        self.rows_done = 0
+        self.rows_failed = 0
+        self.calls_in_flight = 0
+        self.calls_done = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.error = None
+        self._version = 0
+        self._last_notified = 0.0
+        self._listeners = []
+        self._condition = threading.Condition()
+
+    def set_total(self, total: int) -> None:
+        self._update(total=total)
+
+    def row_done(self, count: int = 1) -> None:
+        """Record that ``count`` more rows are finished."""
+        with self._condition:
+            self.rows_done += count
+        self._changed()
+
+    def row_failed(self, count: int = 1) -> None:
+        """Record that ``count`` rows got no usable result (they still count as done)."""
+        with self._condition:
+            self.rows_failed += count
+        self._changed()
+
+    def call_started(self) -> None:
+        with self._condition:
+            self.calls_in_flight += 1
+        self._changed()
+
+    def call_finished(self) -> None:
+        with self._condition:
+            self.calls_in_flight = max(0, self.calls_in_flight - 1)
+            self.calls_done += 1
+        self._changed()
+
+    def record_tokens(self, input_tokens: int, output_tokens: int) -> None:
+        """Record token usage reported for a model call."""
+        with self._condition:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+        self._changed()
+
+    def record_cache(self, hit: bool, count: int = 1) -> None:
+        """Record cache lookups that did (or did not) avoid a model call."""
+        with self._condition:
+            if hit:
+                self.cache_hits += count
+            else:
+                self.cache_misses += count
+        self._changed()
+
+    def finish(self, error: Optional[str] = None) -> None:
+        """Mark the run as finished; listeners and streams get a final event."""
+        with self._condition:
+            self.finished_at = time.time()
+            self.error = error
+        self._changed(force=True)
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """Estimated seconds remaining, from the row throughput observed so far."""
+        if self.finished or not self.total or not self.rows_done:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed / self.rows_done * max(0, self.total - self.rows_done)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current counters as a plain dict."""
+        with self._condition:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "rows_done": self.rows_done,
+                "rows_failed": self.rows_failed,
+                "total": self.total,
+                "progress": min(self.rows_done / self.total, 1.0) if self.total else None,
+                "calls_in_flight": self.calls_in_flight,
+                "calls_done": self.calls_done,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cache_hit_rate": self.cache_hits / lookups if lookups else None,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "elapsed_seconds": (self.finished_at or time.time()) - self.started_at,
+                "eta_seconds": self.eta_seconds,
+                "finished": self.finished,
+                "error": self.error,
+            }
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """
+        Call ``callback(snapshot)`` on updates, throttled to ``min_interval``.
+
+        Listeners run on the thread that records progress, so they must be quick.
+        """
+        self._listeners.append(callback)
+
+    def wait(self, version: int, timeout: Optional[float] = None) -> int:
+        """
+        Block until the tracker has changed past ``version`` or ``timeout`` expires.
+
+        Returns:
+            The current version, to pass to the next ``wait`` call
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version != version or self.finished, timeout)
+            return self._version
+
+    def _update(self, **values) -> None:
+        with self._condition:
+            for key, value in values.items():
+                setattr(self, key, value)
+        self._changed()
+
+    def _changed(self, force: bool = False) -> None:
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+        now = time.time()
+        if self._listeners and (force or now - self._last_notified >= self.min_interval):
+            self._last_notified = now
+            snapshot = self.snapshot()
+            for callback in self._listeners:
+                callback(snapshot)
+
+
+def sse_events(tracker: ProgressTracker, min_interval: float = 0.5,
+               heartbeat: float = 15.0) -> Iterator[str]:
+    """
+    Server-sent-events stream of tracker snapshots.
+
+    Emits a ``progress`` event at most every ``min_interval`` seconds while the
+    run changes, a comment line as keep-alive when it doesn't, and a final
+    ``done`` event when it finishes.
+
+    Yields:
+        SSE-formatted text chunks
+    """
+    version = -1
+    while True:
+        new_version = tracker.wait(version, timeout=heartbeat)
+        if tracker.finished:
+            yield _sse("done", tracker.snapshot())
+            return
+        if new_version == version:
+            yield ": keep-alive\n\n"
+            continue
+        version = new_version
+        yield _sse("progress", tracker.snapshot())
+        time.sleep(min_interval)
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {serialization.dumps(data)}\n\n"
@@ -0,0 +1,161 @@
+"""
+Rule compilation shared by every entry point.
+
+Rules reach the engine in two shapes:
+
+* a list of instructions, as built from the Mapping sheet in tr.py and
+  transformation-final.py (``{"type": "O", "source_column": ..., "target_column": ...}``)
+* a dict keyed by target column, as built by the rule forms in exp9.py, work3.py
+  and the Flask templates (``{target: {"type": "T", "rule_payload": {...}, "target_column": target}}``)
+
+``compile_rules`` flattens both into one ordered list of plain dicts so the rest
+of the engine only deals with a single layout.
+"""
+import logging
+from typing import Any, Dict, List, Union
+
+from .conditions import CONDITIONAL_RULE_TYPE, parse_conditional, validate_condition
+from .id_patterns import pattern_columns
+
+logger = logging.getLogger(__name__)
+
+# Keys under which the different rule forms nest their parameters
+PAYLOAD_KEYS = ("rule_payload", "type_payload", "rule")
+
+
+def compile_rules(rules: Union[List[Dict], Dict[str, Dict]]) -> List[Dict[str, Any]]:
+    """
+    Normalize rules from any of the supported shapes into a compiled plan.
+
+    Args:
+        rules: Either a list of mapping instructions or a dict keyed by target column
+
+    Returns:
+        Ordered list of compiled rules, each with ``type``, ``target_column``,
+        ``source_columns`` and ``params`` keys
+    """
+    plan = []
+    for rule in flatten_rules(rules):
+        compiled = compile_rule(rule)
+        if compiled:
+            plan.append(compiled)
+    return plan
+
+
+def flatten_rules(rules: Union[List[Dict], Dict[str, Dict]]) -> List[Dict[str, Any]]:
+    """
+    Uncompiled rules as a list, with ``target_column`` filled in for the dict shape.
+    """
+    if not isinstance(rules, dict):
+        return list(rules or [])
+    raw_rules = []
+    for target_col, rule in rules.items():
+        rule = dict(rule)
+        rule.setdefault("target_column", target_col)
+        raw_rules.append(rule)
+    return raw_rules
+
+
+def compile_rule(rule: Dict[str, Any]) -> Dict[str, Any]:
+    """Compile a single rule dict into the normalized layout."""
+    rule_type = str(rule.get("type", "")).upper().strip()
+    target_col = rule.get("target_column")
+    if not rule_type or not target_col:
+        logger.warning(f"Skipping rule without type or target column: {rule}")
+        return None
+
+    # Parameters may be nested under a payload key or sit at the top level
+    params = {}
+    for key in PAYLOAD_KEYS:
+        if isinstance(rule.get(key), dict):
+            params.update(rule[key])
+    for key, value in rule.items():
+        if key not in PAYLOAD_KEYS and key not in ("type", "target_column", "description"):
+            params.setdefault(key, value)
+
+    # Older scripts spell some parameters differently
+    if "Default_Value" in params:
+        params.setdefault("default_value", params.pop("Default_Value"))
+    for key in ("auto_generated_rule", "auto_generate_rule"):
+        if key in params:
+            params.setdefault("instruction", params.pop(key))
+
+    if rule_type == CONDITIONAL_RULE_TYPE:
+        return _compile_conditional(str(target_col), params)
+
+    return {
+        "type": rule_type,
+        "target_column": str(target_col),
+        "source_columns": _source_columns(params),
+        "params": params,
+    }
+
+
+def _compile_conditional(target_col: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compile a W rule: parse its condition and compile both branches for the
+    same target, passing the rule's mapping on to T branches.
+    """
+    condition = params.get("condition")
+    try:
+        parsed = parse_conditional(condition) if isinstance(condition, str) else dict(condition or {})
+        validate_condition(parsed.get("when"))
+        if not isinstance(parsed.get("then"), dict):
+            raise ValueError("missing 'then' rule")
+    except ValueError as e:
+        logger.warning(f"Skipping conditional rule for {target_col}: {e}")
+        return None
+
+    branches = {}
+    for key in ("then", "else"):
+        branch = dict(parsed.get(key) or {"type": "D", "default_value": ""})
+        if params.get("mapping") is not None:
+            branch.setdefault("mapping", params["mapping"])
+        branches[key] = compile_rule({**branch, "target_column": target_col})
+        if branches[key] is None:
+            return None
+
+    sources = [parsed["when"]["column"]]
+    for branch in branches.values():
+        sources.extend(col for col in branch["source_columns"] if col not in sources)
+    return {
+        "type": CONDITIONAL_RULE_TYPE,
+        "target_column": target_col,
+        "source_columns": [str(col) for col in sources],
+        "params": {**params, "when": parsed["when"], **branches},
+    }
+
+
+def _source_columns(params: Dict[str, Any]) -> List[str]:
+    """Collect the input columns a rule reads from."""
+    sources = []
+    if params.get("source_column"):
+        sources.append(params["source_column"])
+    for key in ("source_column_1", "source_column_2", "source_column1", "source_column2"):
+        if params.get(key):
+            sources.append(params[key])
+    for col in params.get("columns") or []:
+        sources.append(col)
+    if params.get("id_pattern"):
+        try:
+            sources.extend(col for col in pattern_columns(params["id_pattern"]) if col not in sources)
+        except ValueError:
+            pass
+    return [str(col) for col in sources]
+
+
+def target_schema(plan: List[Dict[str, Any]]) -> List[str]:
+    """
+    Ordered list of output columns produced by a compiled plan.
+
+    Args:
+        plan: Compiled rules from ``compile_rules``
+
+    Returns:
+        Target column names in rule order, without duplicates
+    """
+    schema = []
+    for rule in plan:
+        if rule["target_column"] not in schema:
+            schema.append(rule["target_column"])
+    return schema
@@ -0,0 +1,169 @@
+"""
+JSON serialization for prompts and model responses.
+
+Every prompt embeds rules and row data as JSON, and every response is parsed
+back from JSON, once per row. This module gives all entry points one compact,
+canonical encoding (sorted keys, no indentation, NaN and NumPy/pandas scalars
+mapped to plain JSON) and uses orjson for it when that package is installed,
+falling back to the standard library otherwise. With either backend identical
+inputs produce identical text, which keeps prompts short. The two backends
+can still differ in float notation (orjson writes ``1e16``, the standard
+library ``1e+16``), so keys that are persisted or shared between processes
+come from ``fingerprint``, which always uses the standard library encoding.
+
+The backend can be forced with the ``TRANSFORM_JSON_BACKEND`` environment
+variable (``orjson`` or ``json``) or ``use_backend``.
+"""
+import datetime
+import hashlib
+import json
+import math
+import os
+from typing import Any, Union
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+BACKENDS = ("orjson", "json")
+
+_backend = None
+
+
+def use_backend(name: str) -> None:
+    """
+    Select the JSON backend used by ``dumps``/``loads``.
+
+    Args:
+        name: ``"orjson"`` or ``"json"``
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend '{name}', expected one of {BACKENDS}")
+    if name == "orjson" and not ORJSON_AVAILABLE:
+        raise ValueError("JSON backend 'orjson' requested but orjson is not installed")
+    _backend = name
+
+
+def backend() -> str:
+    """Name of the backend currently in use."""
+    if _backend is None:
+        use_backend(os.environ.get("TRANSFORM_JSON_BACKEND") or ("orjson" if ORJSON_AVAILABLE else "json"))
+    return _backend
+
+
+def dumps(obj: Any) -> str:
+    """
+    Serialize to compact canonical JSON text.
+
+    Args:
+        obj: Rules, row dicts or any nesting of JSON-compatible values,
+             NumPy/pandas scalars and datetimes
+
+    Returns:
+        JSON string with sorted keys and no insignificant whitespace
+    """
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Same as ``dumps`` but returns UTF-8 bytes, e.g. for hashing."""
+    if backend() == "orjson":
+        return orjson.dumps(
+            obj,
+            default=_default,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+
+    return _stdlib_dumps(obj).encode("utf-8")
+
+
+def fingerprint(obj: Any) -> str:
+    """
+    SHA-256 hex digest of the canonical encoding, the same whichever backend
+    is installed; use it for cache keys that are persisted or shared.
+    """
+    return hashlib.sha256(_stdlib_dumps(obj).encode("utf-8")).hexdigest()
+
+
+def _stdlib_dumps(obj: Any) -> str:
+    try:
+        return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+                          allow_nan=False, default=_default)
+    except (ValueError, TypeError):
+        # NaN/inf or keys of mixed types (e.g. a Transform sheet map with int
+        # and str criteria) somewhere in the payload; only then pay for a full walk
+        return json.dumps(_normalize(obj), sort_keys=True, separators=(",", ":"),
+                          ensure_ascii=False, default=_default)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    Parse JSON text or bytes.
+
+    Raises:
+        json.JSONDecodeError: If the input is not valid JSON (orjson's error is a subclass)
+    """
+    if backend() == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _default(obj: Any) -> Any:
+    """Convert values neither backend handles natively."""
+    # NumPy arrays (stdlib backend)
+    if getattr(obj, "ndim", 0) and hasattr(obj, "tolist"):
+        return _replace_nan(obj.tolist())
+    # pandas.NA / NaT and similar missing-value markers
+    if str(obj) in ("<NA>", "NaT", "nan"):
+        return None
+    # NumPy scalars (stdlib backend) and pandas extension scalars expose .item()
+    if hasattr(obj, "item") and not isinstance(obj, (list, dict, str, bytes)):
+        try:
+            # float32 as its shortest repr (0.1, not 0.10000000149011612), as orjson writes it
+            value = float(str(obj)) if getattr(obj, "dtype", None) in ("float16", "float32") else obj.item()
+        except (TypeError, ValueError):
+            value = None
+        if not isinstance(value, float) or math.isfinite(value):
+            return value
+        return None
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return sorted(obj, key=str) if isinstance(obj, (set, frozenset)) else list(obj)
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _replace_nan(obj: Any) -> Any:
+    """Recursively replace float NaN/inf with None."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _replace_nan(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_replace_nan(value) for value in obj]
+    return obj
+
+
+def _normalize(obj: Any) -> Any:
+    """Recursively replace float NaN/inf with None and turn dict keys into strings, as orjson does."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {_key(key): _normalize(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_normalize(value) for value in obj]
+    return obj
+
+
+def _key(key: Any) -> str:
+    """A dict key as a string: 1 -> "1", True -> "true", None -> "null"."""
+    if isinstance(key, str):
+        return key
+    if not isinstance(key, (bool, int, float, type(None))):
+        key = _default(key)
+    return key if isinstance(key, str) else json.dumps(_replace_nan(key))
@@ -0,0 +1,92 @@
+"""
+Caching helpers for the Streamlit apps.
+
+Streamlit reruns the whole script on every widget interaction. Without caching
+each rerun re-parsed the uploaded CSV, recompiled every rule and, on Transform,
+built a new model client. These helpers keep that work across reruns and only
+redo the part whose input actually changed:
+
+* the parsed upload is keyed by the uploaded file, and the bytes are parsed at
+  most once per distinct content through a process-wide ``DatasetStore``
+* each rule is compiled once per distinct rule definition, so editing one rule
+  only recompiles that rule
+* finished output columns are kept per rule definition and upload, so a
+  transform after editing one rule only recomputes that rule's column
+* programs synthesized for custom rules are kept per instruction
+
+The model client is cached by the scripts themselves with ``st.cache_resource``,
+keyed by its configuration. Only import this module from Streamlit scripts.
+"""
+from typing import Any, Dict, List, Union
+
+import pandas as pd
+import streamlit as st
+
+from . import serialization
+from .column_cache import ColumnCache
+from .datasets import DatasetStore
+from .preview import PreviewCache
+from .programs import ProgramCache
+from .rules import compile_rule, flatten_rules
+
+
+@st.cache_resource(show_spinner=False)
+def dataset_store() -> DatasetStore:
+    """Process-wide store of parsed uploads."""
+    return DatasetStore()
+
+
+def load_uploaded_csv(uploaded_file: Any, **read_csv_kwargs: Any) -> pd.DataFrame:
+    """
+    Parsed DataFrame for a ``st.file_uploader`` result.
+
+    The dataset key is remembered per upload in ``st.session_state``, so reruns
+    neither re-read nor re-hash the file. The returned frame is shared; copy it
+    before mutating.
+    """
+    return dataset_store().get(uploaded_dataset_key(uploaded_file, **read_csv_kwargs))
+
+
+def uploaded_dataset_key(uploaded_file: Any, **read_csv_kwargs: Any) -> str:
+    """``DatasetStore`` key of a ``st.file_uploader`` result, parsing it on first use."""
+    keys = st.session_state.setdefault("_dataset_keys", {})
+    upload_id = (getattr(uploaded_file, "file_id", None) or uploaded_file.name,
+                 repr(sorted(read_csv_kwargs.items())))
+    if upload_id not in keys:
+        keys[upload_id] = dataset_store().put_bytes(uploaded_file.getvalue(), **read_csv_kwargs)
+    return keys[upload_id]
+
+
+@st.cache_data(show_spinner=False, max_entries=1024)
+def _compile_rule(rule_json: str) -> Dict[str, Any]:
+    return compile_rule(serialization.loads(rule_json))
+
+
+def compile_rules_cached(rules: Union[List[Dict], Dict[str, Dict]]) -> List[Dict[str, Any]]:
+    """
+    ``rules.compile_rules`` with each rule memoized by its canonical JSON form.
+    """
+    plan = []
+    for rule in flatten_rules(rules):
+        compiled = _compile_rule(serialization.dumps(rule))
+        if compiled:
+            plan.append(compiled)
+    return plan
+
+
+@st.cache_resource(show_spinner=False)
+def column_cache() -> ColumnCache:
+    """Process-wide cache of transformed output columns."""
+    return ColumnCache()
+
+
+@st.cache_resource(show_spinner=False)
+def program_cache() -> ProgramCache:
+    """Process-wide cache of programs synthesized for custom rules."""
+    return ProgramCache()
+
+
+@st.cache_resource(show_spinner=False)
+def preview_cache() -> PreviewCache:
+    """Process-wide cache of model results shown in rule previews."""
+    return PreviewCache()
@@ -0,0 +1,190 @@
+"""
+Catalog of native string operations (rule type S).
+
+Many custom X and C instructions come down to a substring, padding, a case
+change, a regex replacement, masking, splitting or joining with a separator,
+yet each was sent to the model once per row. An S rule names one operation of
+``OPERATIONS`` with its arguments, written the way it is typed into the
+Mapping sheet (``Parameter#2``) or a rule form::
+
+    {"type": "S", "source_column": "Email", "target_column": "EMAIL_MASKED",
+     "operation": 'mask_after("@", "***")'}
+
+``parse_operation`` reads the text with ``ast.literal_eval`` (arguments are
+literals, never code) and checks it against the catalog; ``apply_operation``
+runs it as one whole-column pandas string kernel, on Arrow-backed strings when
+pyarrow is installed. Regular expressions are compiled once per pattern.
+
+Operations read the rule's first source column, except ``concat`` which joins
+all of them.
+"""
+import ast
+import importlib.util
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+STRING_RULE_TYPE = "S"
+
+# Arrow string kernels are used when pyarrow is installed
+TEXT_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") is not None else "string"
+
+
+class Operation(NamedTuple):
+    function: Callable[..., pd.Series]
+    # Argument kinds ("int" or "str"); arguments past ``required`` are optional
+    arguments: Tuple[str, ...]
+    required: int
+    description: str
+
+
+@lru_cache(maxsize=256)
+def compiled_regex(pattern: str) -> "re.Pattern":
+    """Compiled regular expression, cached per pattern."""
+    return re.compile(pattern)
+
+
+def _substring(text: pd.Series, start: int, stop: int = None) -> pd.Series:
+    return text.str.slice(start, stop)
+
+
+def _mask(text: pd.Series, keep_start: int, keep_end: int = 0, char: str = "*") -> pd.Series:
+    lengths = text.str.len()
+    hidden = (lengths - keep_start - keep_end).clip(lower=0).fillna(0).astype(int)
+    masked = (text.str.slice(0, keep_start)
+              + pd.Series(char[:1] or "*", index=text.index, dtype=TEXT_DTYPE).str.repeat(hidden.tolist())
+              + (text.str.slice(-keep_end) if keep_end else ""))
+    return masked.where(lengths > keep_start + keep_end, text)
+
+
+def _pad(text: pd.Series, width: int, fill: str = " ", side: str = "left") -> pd.Series:
+    # Empty values stay empty rather than becoming e.g. "00000000"
+    return text.str.pad(width, side=side, fillchar=fill[:1] or " ").where(text != "", text)
+
+
+def _regex_extract(text: pd.Series, pattern: str) -> pd.Series:
+    regex = compiled_regex(pattern) if compiled_regex(pattern).groups else compiled_regex(f"({pattern})")
+    return text.str.extract(regex, expand=False).fillna("")
+
+
+def _mask_after(text: pd.Series, separator: str, replacement: str = "***") -> pd.Series:
+    head, found, _ = (text.str.partition(separator)[i] for i in range(3))
+    return (head + found + replacement).where(found != "", text)
+
+
+OPERATIONS: Dict[str, Operation] = {
+    "upper": Operation(lambda text: text.str.upper(), (), 0, "Upper case"),
+    "lower": Operation(lambda text: text.str.lower(), (), 0, "Lower case"),
+    "title": Operation(lambda text: text.str.title(), (), 0, "Capitalize each word"),
+    "strip": Operation(lambda text: text.str.strip(), (), 0, "Remove surrounding whitespace"),
+    "substring": Operation(_substring, ("int", "int"), 1,
+                           "Characters from start up to (not including) stop; negative counts from the end"),
+    "left": Operation(lambda text, n: text.str.slice(0, n), ("int",), 1, "First n characters"),
+    "right": Operation(lambda text, n: text.str.slice(-n) if n else text.str.slice(0, 0), ("int",), 1,
+                       "Last n characters"),
+    "pad_left": Operation(lambda text, width, fill=" ": _pad(text, width, fill, "left"),
+                          ("int", "str"), 1, "Pad non-empty values on the left to width, e.g. with zeros"),
+    "pad_right": Operation(lambda text, width, fill=" ": _pad(text, width, fill, "right"),
+                           ("int", "str"), 1, "Pad non-empty values on the right to width"),
+    "replace": Operation(lambda text, old, new: text.str.replace(old, new, regex=False), ("str", "str"), 2,
+                         "Replace every occurrence of a text"),
+    "regex_replace": Operation(lambda text, pattern, repl: text.str.replace(compiled_regex(pattern), repl, regex=True),
+                               ("str", "str"), 2, "Replace every match of a regular expression"),
+    "regex_extract": Operation(_regex_extract, ("str",), 1,
+                               "First group (or whole match) of a regular expression, empty if none"),
+    "split": Operation(lambda text, separator, index: text.str.split(separator, regex=False).str[index].fillna(""),
+                       ("str", "int"), 2, "Item at index after splitting on a separator"),
+    "before": Operation(lambda text, separator: text.str.partition(separator)[0], ("str",), 1,
+                        "Text before the first separator"),
+    "after": Operation(lambda text, separator: text.str.partition(separator)[2], ("str",), 1,
+                       "Text after the first separator"),
+    "mask": Operation(_mask, ("int", "int", "str"), 1,
+                      "Keep the first and last characters and mask the rest, e.g. mask(0, 4)"),
+    "mask_after": Operation(_mask_after, ("str", "str"), 1,
+                            'Replace everything after a separator, e.g. mask_after("@", "***")'),
+    "concat": Operation(None, ("str",), 0, "Join all source columns with a separator, skipping empty values"),
+}
+
+
+def catalog() -> List[Dict[str, str]]:
+    """Operations for rule forms: name, signature and description."""
+    return [{"name": name,
+             "signature": f"{name}({', '.join(operation.arguments)})",
+             "description": operation.description}
+            for name, operation in OPERATIONS.items()]
+
+
+@lru_cache(maxsize=1024)
+def parse_operation(text: str) -> Tuple[str, Tuple[Any, ...]]:
+    """
+    Parse an operation such as ``pad_left(10, "0")``; parentheses are optional
+    without arguments.
+
+    Returns:
+        Tuple of (operation name, arguments)
+
+    Raises:
+        ValueError: If the operation is unknown or its arguments don't fit
+    """
+    match = re.fullmatch(r"\s*(\w+)\s*(?:\((.*)\))?\s*", str(text), flags=re.S)
+    if not match:
+        raise ValueError(f"Not an operation: {text!r}")
+    name, arguments = match.group(1).lower(), match.group(2)
+    try:
+        args = ast.literal_eval(f"({arguments},)") if arguments and arguments.strip() else ()
+    except (ValueError, SyntaxError):
+        raise ValueError(f"Arguments of {name} must be numbers or quoted strings: {arguments!r}")
+    validate_operation(name, args)
+    return name, tuple(args)
+
+
+def validate_operation(name: str, args: Tuple[Any, ...]) -> None:
+    """
+    Check an operation name and its arguments against the catalog.
+
+    Raises:
+        ValueError: Describing the problem
+    """
+    if name not in OPERATIONS:
+        raise ValueError(f"Unknown string operation {name!r}; available: {', '.join(OPERATIONS)}")
+    operation = OPERATIONS[name]
+    if not operation.required <= len(args) <= len(operation.arguments):
+        raise ValueError(f"{name} takes {operation.required} to {len(operation.arguments)} arguments, got {len(args)}")
+    for position, (kind, arg) in enumerate(zip(operation.arguments, args)):
+        if kind == "int" and (not isinstance(arg, int) or isinstance(arg, bool)):
+            raise ValueError(f"Argument {position + 1} of {name} must be an integer: {arg!r}")
+        if kind == "str" and not isinstance(arg, str):
+            raise ValueError(f"Argument {position + 1} of {name} must be a quoted string: {arg!r}")
+    if name in ("regex_replace", "regex_extract"):
+        try:
+            compiled_regex(args[0])
+        except re.error as e:
+            raise ValueError(f"Invalid pattern {args[0]!r} for {name}: {e}")
+
+
+def apply_operation(columns: List[pd.Series], name: str, args: Tuple[Any, ...] = ()) -> pd.Series:
+    """
+    Run a validated operation.
+
+    Args:
+        columns: Source columns as text, nulls as empty strings
+        name: Operation name from ``OPERATIONS``
+        args: Its arguments
+
+    Returns:
+        Result values as Python strings
+    """
+    texts = [column.astype(TEXT_DTYPE) for column in columns]
+    if name == "concat":
+        separator = args[0] if args else " "
+        result = texts[0]
+        for text in texts[1:]:
+            result = (result + separator + text).where(text != "", result).where(result != "", text)
+    else:
+        result = OPERATIONS[name].function(texts[0], *args)
+    return result.astype(object).where(result.notna(), "")
@@ -0,0 +1,299 @@
+"""
+Directory-watching ingestion service.
+
+    python -m transformation.watch CIFINPUT --workbook CIFINPUT/TRANS_ADRPART01.xlsx --jobs 2
+
+Daily inputs (``NF_CLIENT_<ddmmyyyy>.csv``) are picked up as they land in the
+input directory instead of someone editing a path and starting a run by hand.
+The service polls the directory and, for each matching file:
+
+1. waits until its size and modification time stop changing, so files still
+   being copied are not read half-written
+2. fingerprints its content (SHA-256) and skips it when that content was
+   already processed with the current version of every workbook, so renamed
+   or re-delivered copies are not transformed twice; fingerprints are kept
+   per size and modification time, so old files aren't re-read on every poll
+3. runs it through the workbooks on a thread pool, several files at a time
+
+One ``DataTransformationEngine`` (and with it the model client), one
+``DatasetStore`` and the parsed workbooks live for the whole service, so there
+is no cold start per file; a workbook is only re-read when it changes on disk.
+Processed fingerprints are kept in ``<state-dir>/processed.json`` and a
+manifest is written per file, as with the command-line runner.
+"""
+import argparse
+import fnmatch
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import ids, serialization
+from .cli import OUTPUT_FORMATS, build_manifest, new_run_id, process_file, write_manifest
+from .datasets import DatasetStore, file_key
+from .engine import DataTransformationEngine
+from .programs import ProgramCache
+from .watermark import DATE_COLUMN, WatermarkStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATTERN = "NF_CLIENT_*.csv"
+POLL_SECONDS = 30.0
+STATE_FILE = "processed.json"
+
+
+class IngestionService:
+    def __init__(self, input_dir: str, workbooks: Sequence[str], output_dir: str = "Output",
+                 pattern: str = DEFAULT_PATTERN, state_dir: Optional[str] = None, jobs: int = 2,
+                 workers: Optional[int] = None, output_format: str = "csv", delimiter: str = "|",
+                 use_model: bool = True, poll_seconds: float = POLL_SECONDS, delta: bool = False,
+                 incremental: bool = False, date_column: str = DATE_COLUMN, date_format: Optional[str] = None):
+        """
+        Args:
+            input_dir: Directory watched for new input files
+            workbooks: Rules workbooks every input is run through
+            output_dir: Directory for results and manifests
+            pattern: Glob pattern of input file names
+            state_dir: Processed fingerprints, parsed inputs and ID counters (default: <output_dir>/.ingest)
+            jobs: Input files processed concurrently
+            workers: Worker processes for native rules per file
+            output_format: One of ``cli.OUTPUT_FORMATS``
+            delimiter: Input field delimiter
+            use_model: False to run only the native rules
+            poll_seconds: Seconds between directory scans
+            delta: Only transform rows that changed since the previous file of the same source
+            incremental: Only load rows whose ``date_column`` is past the last
+                         successful load of the same source and workbook
+            date_column: Effective date column used with ``incremental``
+            date_format: Format of its dates; detected per file when not given
+        """
+        self.input_dir = input_dir
+        self.workbooks = list(dict.fromkeys(workbooks))
+        self.output_dir = output_dir
+        self.pattern = pattern
+        self.state_dir = state_dir or os.path.join(output_dir, ".ingest")
+        self.output_format = output_format
+        self.delimiter = delimiter
+        self.use_model = use_model
+        self.poll_seconds = poll_seconds
+        self.delta_dir = os.path.join(self.state_dir, "delta") if delta else None
+        self.watermarks = WatermarkStore(os.path.join(self.state_dir, "watermarks.json")) if incremental else None
+        self.date_column = date_column
+        self.date_format = date_format
+        # Generated IDs continue across files and restarts of the service
+        ids.use_state(os.path.join(self.state_dir, "ids.json"))
+        self.engine = DataTransformationEngine(max_workers=workers,
+                                               program_cache=ProgramCache(os.path.join(self.state_dir, "programs.json")))
+        self.store = DatasetStore(root=os.path.join(self.state_dir, "datasets"))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix="ingest")
+        self._rules = {}
+        self._seen = {}
+        # Content fingerprints by (path, size, mtime), so settled files are hashed once
+        self._file_keys = {}
+        self._running = {}
+        self._failed = set()
+        self._state_lock = threading.Lock()
+        self._processed = self._load_state()
+        self._stop = threading.Event()
+
+    def rules(self) -> Dict[str, Tuple[str, List[Dict]]]:
+        """
+        Mapping instructions per workbook, re-read only when the workbook changed.
+
+        Returns:
+            ``{workbook: (rules fingerprint, mapping instructions)}`` for the
+            workbooks that could be loaded
+        """
+        loaded = {}
+        for workbook in self.workbooks:
+            try:
+                mtime = os.stat(workbook).st_mtime_ns
+                cached = self._rules.get(workbook)
+                if cached is None or cached[0] != mtime:
+                    instructions = self.engine.load_transformation_rules(workbook)[0]
+                    fingerprint = serialization.fingerprint(instructions)
+                    self._rules[workbook] = cached = (mtime, fingerprint, instructions)
+                loaded[workbook] = cached[1:]
+            except Exception as e:
+                logger.error(f"Workbook {workbook} can't be loaded, skipping it: {e}")
+        return loaded
+
+    def scan(self) -> List[str]:
+        """Matching input files whose size and modification time are unchanged since the last scan."""
+        try:
+            names = sorted(name for name in os.listdir(self.input_dir) if fnmatch.fnmatch(name, self.pattern))
+        except FileNotFoundError:
+            logger.warning(f"Input directory {self.input_dir} does not exist")
+            return []
+
+        ready = []
+        seen = {}
+        for name in names:
+            path = os.path.join(self.input_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            seen[path] = (stat.st_size, stat.st_mtime_ns)
+            if self._seen.get(path) == seen[path] and path not in self._running:
+                ready.append(path)
+        self._seen = seen
+        return ready
+
+    def poll(self) -> int:
+        """
+        Scan once and start every new, settled file.
+
+        Returns:
+            Number of files started
+        """
+        rules = self.rules()
+        if not rules:
+            return 0
+        started = 0
+        for path in self.scan():
+            fingerprint = self._file_key(path)
+            if fingerprint in list(self._running.values()):
+                continue
+            done = set(self._processed.get(fingerprint, {}).get("rules", []))
+            # Failed files are retried only once the file or the workbook changes
+            pending = {workbook: entry for workbook, entry in rules.items()
+                       if entry[0] not in done and (fingerprint, entry[0]) not in self._failed}
+            if not pending:
+                continue
+            logger.info(f"New input {path} ({fingerprint[:12]}) for {len(pending)} workbook(s)")
+            future = self._pool.submit(self._process, path, fingerprint, pending)
+            self._running[path] = fingerprint
+            future.add_done_callback(lambda _, path=path: self._running.pop(path, None))
+            started += 1
+        return started
+
+    def _file_key(self, path: str) -> str:
+        """Content fingerprint of a settled file, re-hashed only when its size or mtime changes."""
+        signature = (os.path.abspath(path), *self._seen[path])
+        fingerprint = self._file_keys.get(signature)
+        if fingerprint is None:
+            fingerprint = file_key(path)
+            # Only the current version of each file is kept
+            self._file_keys = {key: value for key, value in self._file_keys.items() if key[0] != signature[0]}
+            self._file_keys[signature] = fingerprint
+        return fingerprint
+
+    def run_forever(self) -> None:
+        """Poll until ``stop`` is called, then wait for the files in progress."""
+        logger.info(f"Watching {self.input_dir} for {self.pattern} every {self.poll_seconds:g}s")
+        try:
+            while not self._stop.is_set():
+                self.poll()
+                self._stop.wait(self.poll_seconds)
+        finally:
+            self.close()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def close(self) -> None:
+        """Wait for the files in progress and release the worker threads."""
+        self._pool.shutdown(wait=True)
+        logger.info("Ingestion service stopped")
+
+    def _process(self, path: str, fingerprint: str, rules: Dict[str, Tuple[str, List[Dict]]]) -> None:
+        started_at = time.time()
+        run_id = new_run_id(started_at)
+        entries = process_file(self.engine, path, {workbook: entry[1] for workbook, entry in rules.items()},
+                               self.output_dir, self.output_format, delimiter=self.delimiter,
+                               use_model=self.use_model, store=self.store, delta_dir=self.delta_dir,
+                               watermarks=self.watermarks, date_column=self.date_column,
+                               date_format=self.date_format)
+        succeeded = [rules[entry["workbook"]][0] for entry in entries if entry["status"] == "ok"]
+        self._failed.update((fingerprint, rules[entry["workbook"]][0])
+                            for entry in entries if entry["status"] != "ok")
+        if succeeded:
+            self._mark_processed(fingerprint, path, succeeded)
+
+        arguments = {"input_dir": self.input_dir, "pattern": self.pattern, "fingerprint": fingerprint,
+                     "output_format": self.output_format, "workbooks": list(rules)}
+        manifest = build_manifest(run_id, started_at, "azure" if self.use_model else "native", arguments, entries)
+        write_manifest(manifest, os.path.join(self.output_dir, "manifests", f"run-{run_id}.json"))
+
+    def _mark_processed(self, fingerprint: str, path: str, rule_fingerprints: List[str]) -> None:
+        with self._state_lock:
+            record = self._processed.setdefault(fingerprint, {"rules": []})
+            record["path"] = path
+            record["processed_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            record["rules"] = sorted(set(record["rules"]) | set(rule_fingerprints))
+            os.makedirs(self.state_dir, exist_ok=True)
+            state_path = os.path.join(self.state_dir, STATE_FILE)
+            with open(state_path + ".tmp", "wb") as f:
+                f.write(serialization.dumps_bytes(self._processed))
+            os.replace(state_path + ".tmp", state_path)
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        state_path = os.path.join(self.state_dir, STATE_FILE)
+        if not os.path.exists(state_path):
+            return {}
+        with open(state_path, "rb") as f:
+            return serialization.loads(f.read())
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m transformation.watch",
+                                     description="Transform new input files as they arrive in a directory.")
+    parser.add_argument("input_dir", help="Directory to watch")
+    parser.add_argument("-w", "--workbook", action="append", required=True,
+                        help="Rules workbook (Mapping and Transform sheets); repeat for several")
+    parser.add_argument("-o", "--output-dir", default="Output", help="Directory for results (default: Output)")
+    parser.add_argument("-p", "--pattern", default=DEFAULT_PATTERN, help=f"Input file names (default: {DEFAULT_PATTERN})")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="csv", help="Output format")
+    parser.add_argument("-j", "--jobs", type=int, default=2, help="Input files processed concurrently")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for native rules per file (default: CPU count)")
+    parser.add_argument("--state-dir", default=None,
+                        help="Processed fingerprints and parsed inputs (default: <output-dir>/.ingest)")
+    parser.add_argument("--engine", choices=("azure", "native"), default="azure",
+                        help="azure: call the model for rules that need it; native: skip those rules")
+    parser.add_argument("--delimiter", default="|", help="Input field delimiter (default: |)")
+    parser.add_argument("--delta", action="store_true",
+                        help="Only transform rows that changed since the previous file of the same source")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only load rows whose EffectiveDate is past the last successful load")
+    parser.add_argument("--date-column", default=DATE_COLUMN,
+                        help=f"Effective date column for --incremental (default: {DATE_COLUMN})")
+    parser.add_argument("--date-format", default=None,
+                        help="Format of the effective dates, e.g. DD/MM/YYYY (default: detected per file)")
+    parser.add_argument("--interval", type=float, default=POLL_SECONDS, help="Seconds between scans")
+    parser.add_argument("--once", action="store_true",
+                        help="Process the files present now and exit instead of watching")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    service = IngestionService(args.input_dir, args.workbook, output_dir=args.output_dir, pattern=args.pattern,
+                               state_dir=args.state_dir, jobs=args.jobs, workers=args.workers,
+                               output_format=args.format, delimiter=args.delimiter,
+                               use_model=args.engine != "native", poll_seconds=args.interval, delta=args.delta,
+                               incremental=args.incremental, date_column=args.date_column,
+                               date_format=args.date_format)
+    if args.once:
+        # Files present now are treated as settled
+        service.scan()
+        service.poll()
+        service.close()
+        return 0
+
+    signal.signal(signal.SIGTERM, lambda *_: service.stop())
+    try:
+        service.run_forever()
+    except KeyboardInterrupt:
+        service.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
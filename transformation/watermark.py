@@ -0,0 +1,172 @@
+"""
+EffectiveDate watermarks for incremental loads.
+
+NF_CLIENT rows carry an ``EffectiveDate`` and only records effective since the
+last successful load need to be staged again. A ``WatermarkStore`` keeps the
+latest effective date loaded per (source table, workbook) in one JSON file:
+
+* ``Watermark.filter`` drops rows at or before the watermark with one
+  vectorized date comparison, before any rule runs
+* ``Watermark.loaded_until`` picks the date to advance to: the newest date of
+  a load, held back below the oldest date of any row that failed, so failed
+  rows are loaded again next time
+* ``Watermark.advance`` moves the watermark once the output has been saved,
+  under a lock and with an atomic file replace, and never moves it backwards
+
+Dates are parsed with one explicit format for the whole column, given by the
+caller or detected from a sample (see ``dates.detect_format``), so ambiguous
+day/month values aren't guessed row by row. Rows whose date is missing or
+can't be parsed are always kept, since there is no way to tell whether they
+were loaded before.
+"""
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import serialization
+from .dates import detect_format, to_strftime
+
+logger = logging.getLogger(__name__)
+
+DATE_COLUMN = "EffectiveDate"
+
+_store_locks = {}
+_store_locks_guard = threading.Lock()
+
+
+class WatermarkStore:
+    def __init__(self, path: str):
+        """
+        Args:
+            path: JSON file holding the watermarks
+        """
+        self.path = path
+        with _store_locks_guard:
+            self._lock = _store_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+    def get(self, source: str, workbook: str) -> Optional[pd.Timestamp]:
+        """Latest effective date loaded for a source and workbook, or None before the first load."""
+        value = self._read().get(_key(source, workbook))
+        return pd.Timestamp(value) if value else None
+
+    def set(self, source: str, workbook: str, value: pd.Timestamp) -> bool:
+        """
+        Advance a watermark; a value at or before the stored one is ignored.
+
+        Returns:
+            True if the watermark moved
+        """
+        with self._lock:
+            watermarks = self._read()
+            key = _key(source, workbook)
+            current = watermarks.get(key)
+            if current and pd.Timestamp(current) >= value:
+                return False
+            watermarks[key] = value.isoformat()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".tmp", "wb") as f:
+                f.write(serialization.dumps_bytes(watermarks))
+            os.replace(self.path + ".tmp", self.path)
+        logger.info(f"Watermark {key} advanced to {value.isoformat()}")
+        return True
+
+    def watermark(self, source: str, workbook: str, column: str = DATE_COLUMN,
+                  date_format: Optional[str] = None) -> "Watermark":
+        return Watermark(self, source, workbook, column, date_format)
+
+    def _read(self) -> Dict[str, str]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            return serialization.loads(f.read())
+
+
+class Watermark:
+    def __init__(self, store: WatermarkStore, source: str, workbook: str, column: str = DATE_COLUMN,
+                 date_format: Optional[str] = None):
+        """
+        Watermark of one source table and workbook.
+
+        Args:
+            store: Where the watermark is kept
+            source: Source table, e.g. ``NF_CLIENT`` (see ``delta.source_name``)
+            workbook: Rules workbook name
+            column: Effective date column, matched case-insensitively
+            date_format: Format of the dates, as a ``dates`` pattern (e.g. ``DD/MM/YYYY``)
+                         or ``strftime`` format; detected from the column when not given
+        """
+        self.store = store
+        self.source = source
+        self.workbook = workbook
+        self.column = column
+        self.date_format = date_format
+
+    def filter(self, input_df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[pd.Series]]:
+        """
+        Rows effective after the watermark.
+
+        Returns:
+            Tuple of (remaining rows, their effective dates, to pass to
+            ``loaded_until`` once they are loaded); the dates are None when
+            the input has no date column or its format can't be determined
+        """
+        column = next((col for col in input_df.columns
+                       if str(col).strip().lower() == self.column.lower()), None)
+        if column is None:
+            logger.warning(f"No {self.column} column in input, loading every row")
+            return input_df, None
+
+        date_format = self.date_format or detect_format(input_df[column], column)
+        if not date_format:
+            logger.warning(f"No date format found for {self.column}, loading every row")
+            return input_df, None
+        dates = pd.to_datetime(input_df[column], format=to_strftime(date_format), errors="coerce")
+        unparsed = int(dates.isna().sum() - input_df[column].isna().sum())
+        if unparsed:
+            logger.warning(f"{unparsed} {self.column} values could not be parsed; those rows are kept")
+
+        current = self.store.get(self.source, self.workbook)
+        if current is not None:
+            keep = (dates > current) | dates.isna()
+            input_df = input_df[keep.to_numpy()].reset_index(drop=True)
+            dates = dates[keep]
+            logger.info(f"Watermark {_key(self.source, self.workbook)} at {current.isoformat()}: "
+                        f"{len(input_df)} rows to load")
+        return input_df, dates.reset_index(drop=True)
+
+    def loaded_until(self, dates: Optional[pd.Series], succeeded: np.ndarray) -> Optional[pd.Timestamp]:
+        """
+        Date the watermark can advance to after a load.
+
+        Args:
+            dates: Effective dates as returned by ``filter``
+            succeeded: Mask of the rows whose output was saved
+
+        Returns:
+            The newest date of a saved row that is older than every failed
+            row's date, or None if there is none
+        """
+        if dates is None:
+            return None
+        failed = dates[~succeeded].dropna()
+        loaded = dates[succeeded]
+        if len(failed):
+            loaded = loaded[loaded < failed.min()]
+            logger.warning(f"{len(failed)} rows failed; watermark {_key(self.source, self.workbook)} "
+                           f"held before {failed.min().isoformat()}")
+        newest = loaded.max()
+        return None if pd.isna(newest) else newest
+
+    def advance(self, value: Optional[pd.Timestamp]) -> bool:
+        """Move the watermark to ``value`` after a successful load."""
+        if value is None:
+            return False
+        return self.store.set(self.source, self.workbook, value)
+
+
+def _key(source: str, workbook: str) -> str:
+    return f"{source}::{workbook}"
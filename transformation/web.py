@@ -0,0 +1,141 @@
+"""
+Flask routes and helpers shared by the web apps.
+
+Jobs
+----
+
+``jobs_blueprint`` exposes a ``JobManager`` over HTTP::
+
+    GET /jobs                  all known jobs
+    GET /jobs/<job_id>         status, progress and ETA of one job
+    GET /jobs/<job_id>/events  server-sent-events progress stream
+    GET /jobs/<job_id>/result  download the output file; for jobs that write it
+                               incrementally the download starts while they run
+
+Datasets
+--------
+``datasets_blueprint`` adds ``POST /upload`` (form field ``csv_file``), which
+stores the upload in a ``DatasetStore`` and binds it to the caller's session.
+``session_dataset`` returns the current session's dataset. Sessions need
+``app.secret_key`` to be set.
+"""
+import os
+import uuid
+from typing import Any, Optional
+
+import pandas as pd
+from flask import Blueprint, Response, abort, jsonify, request, send_file, session, stream_with_context
+
+from .datasets import DatasetStore
+
+from .jobs import RUNNING, SUCCEEDED, JobManager
+from .output import follow_file
+from .progress import sse_events
+
+
+def jobs_blueprint(manager: JobManager) -> Blueprint:
+    """
+    Build the job routes for a Flask app.
+
+    Args:
+        manager: Job manager whose jobs the routes expose
+
+    Returns:
+        Blueprint to register with ``app.register_blueprint``
+    """
+    blueprint = Blueprint("jobs", __name__)
+
+    @blueprint.route("/jobs")
+    def list_jobs():
+        return jsonify([job.to_dict() for job in manager.jobs()])
+
+    @blueprint.route("/jobs/<job_id>")
+    def job_status(job_id):
+        job = manager.get(job_id)
+        if job is None:
+            abort(404, description=f"Unknown job {job_id}")
+        return jsonify(job.to_dict())
+
+    @blueprint.route("/jobs/<job_id>/events")
+    def job_events(job_id):
+        job = manager.get(job_id)
+        if job is None:
+            abort(404, description=f"Unknown job {job_id}")
+        return Response(
+            stream_with_context(sse_events(job.tracker)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @blueprint.route("/jobs/<job_id>/result")
+    def job_result(job_id):
+        job = manager.get(job_id)
+        if job is None:
+            abort(404, description=f"Unknown job {job_id}")
+        if job.status == RUNNING and job.output_path and os.path.exists(job.output_path):
+            # Stream rows already written and keep following the file until the job ends
+            finished = lambda: job.status != RUNNING
+            return Response(
+                stream_with_context(follow_file(job.output_path, finished)),
+                mimetype="text/csv",
+                headers={"Content-Disposition": f"attachment; filename={os.path.basename(job.output_path)}"},
+            )
+        if job.status != SUCCEEDED:
+            return jsonify(job.to_dict()), 409
+        if not job.result or not os.path.exists(job.result):
+            abort(410, description="Result file is no longer available")
+        return send_file(os.path.abspath(job.result), as_attachment=True)
+
+    return blueprint
+
+
+def session_id() -> str:
+    """Identifier of the caller's session, created on first use."""
+    if "sid" not in session:
+        session["sid"] = uuid.uuid4().hex
+    return session["sid"]
+
+
+def session_dataset(store: DatasetStore, default_path: Optional[str] = None,
+                    **read_csv_kwargs: Any) -> Optional[pd.DataFrame]:
+    """
+    Dataset of the caller's session.
+
+    Args:
+        store: Dataset store holding the uploads
+        default_path: CSV used for sessions that haven't uploaded anything
+        read_csv_kwargs: Parse options for ``default_path``
+
+    Returns:
+        Shared DataFrame (copy before mutating), or None if there is neither an upload nor a default
+    """
+    sid = session_id()
+    df = store.for_session(sid)
+    if df is None and default_path:
+        store.put_path(default_path, session_id=sid, **read_csv_kwargs)
+        df = store.for_session(sid)
+    return df
+
+
+def datasets_blueprint(store: DatasetStore) -> Blueprint:
+    """
+    Build the upload route for a Flask app.
+
+    Args:
+        store: Dataset store uploads are saved to
+
+    Returns:
+        Blueprint to register with ``app.register_blueprint``
+    """
+    blueprint = Blueprint("datasets", __name__)
+
+    @blueprint.route("/upload", methods=["POST"])
+    def upload():
+        file = request.files.get("csv_file")
+        if file is None or not file.filename:
+            abort(400, description="No file uploaded in field 'csv_file'")
+        key = store.put_bytes(file.read(), session_id=session_id())
+        df = store.get(key)
+        return jsonify({"dataset_key": key, "columns": list(df.columns), "rows": len(df)})
+
+    return blueprint
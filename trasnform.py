@@ -1,8 +1,9 @@
 import os
+from functools import lru_cache
 import json
 import pandas as pd
-from langchain_openai import AzureChatOpenAI
-import gradio as gr
+
+from transformation import serialization
 
 os.environ["AZURE_OPENAI_API_KEY"] = "70e7"
 os.environ["AZURE_OPENAI_ENDPOINT"] = "https://codedocumentation.openai.azure.com/"
@@ -10,11 +11,15 @@ os.environ["AZURE_OPENAI_API_VERSION"] = "2024-02-15-preview"
 os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = "gpt-4o"
 
 
-model = AzureChatOpenAI(
-    openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-    azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
-    temperature=0.0
-)
+@lru_cache(maxsize=None)
+def get_model():
+    """Azure OpenAI client, created on first use instead of on import."""
+    from langchain_openai import AzureChatOpenAI
+    return AzureChatOpenAI(
+        openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+        temperature=0.0
+    )
 
 
 def load_input_data(input_file_path):
@@ -69,7 +74,7 @@ def transform_row_with_ai(input_row, transformation_dict):
 
             ----------------------
             TRANSFORMATION RULES:
-            {json.dumps(transformation_dict, indent=2)}
+            {serialization.dumps(transformation_dict)}
             ----------------------
 
             RULE TYPES:
@@ -82,12 +87,12 @@ def transform_row_with_ai(input_row, transformation_dict):
             2. If value is missing or not found in a mapping, leave the value as blank "".
 
             INPUT ROW:
-            {json.dumps(input_row, indent=2)}
+            {serialization.dumps(input_row)}
 
             Return only the transformed row as a valid JSON dictionary with final target column names.
         """
 
-    response = model.invoke(prompt)
+    response = get_model().invoke(prompt)
     content = response.content.strip()
     start_index = content.find('{')
     end_index = content.rfind('}') + 1
@@ -97,7 +102,7 @@ def transform_row_with_ai(input_row, transformation_dict):
         return {}
 
     try:
-        return json.loads(content[start_index:end_index])
+        return serialization.loads(content[start_index:end_index])
     except json.JSONDecodeError:
         print(f"Failed to decode AI response: {content}")
         return {}
@@ -138,16 +143,23 @@ def transform_excel(input_csv, mapping_excel):
 
 # transform_excel('DATA/NAM 4.csv', "DATA/SOURCE_TARGET_MAPPING.xlsx", "output_exp3.csv")
 
-with gr.Blocks() as demo:
-    gr.Markdown("## CSV Column Mapper using Azure OpenAI")
-    file_input = gr.File(label="Upload Source CSV")
-    excel_input = gr.File(label="Upload Excel with Columns")
-    output_file = gr.File(label="Download Mapped CSV")
-    submit_button = gr.Button("Map Columns")
+def build_demo():
+    """Gradio UI around ``transform_excel``; gradio is only imported here."""
+    import gradio as gr
+
+    with gr.Blocks() as demo:
+        gr.Markdown("## CSV Column Mapper using Azure OpenAI")
+        file_input = gr.File(label="Upload Source CSV")
+        excel_input = gr.File(label="Upload Excel with Columns")
+        output_file = gr.File(label="Download Mapped CSV")
+        submit_button = gr.Button("Map Columns")
+
+        submit_button.click(fn=transform_excel, inputs=[file_input, excel_input], outputs=[output_file])
+    return demo
 
-    submit_button.click(fn=transform_excel, inputs=[file_input, excel_input], outputs=[output_file])
 
-demo.launch(share=True)
+if __name__ == "__main__":
+    build_demo().launch(share=True)
 
 '''
 OUTPUT:
@@ -1,10 +1,11 @@
 import pandas as pd
 from flask import Flask, render_template, url_for, request
 import os
+from functools import lru_cache
 import json
 import pandas as pd
-from langchain_openai import AzureChatOpenAI
-import gradio as gr
+
+from transformation import serialization
 
 os.environ["AZURE_OPENAI_API_KEY"] = "706b4214873e7"
 os.environ["AZURE_OPENAI_ENDPOINT"] = "https://codedocumentation.openai.azure.com/"
@@ -12,11 +13,15 @@ os.environ["AZURE_OPENAI_API_VERSION"] = "2024-02-15-preview"
 os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = "gpt-4o"
 
 
-model = AzureChatOpenAI(
-    openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-    azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
-    temperature=0.0
-)
+@lru_cache(maxsize=None)
+def get_model():
+    """Azure OpenAI client, created on first use instead of on import."""
+    from langchain_openai import AzureChatOpenAI
+    return AzureChatOpenAI(
+        openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+        temperature=0.0
+    )
 
 app = Flask(__name__)
 
@@ -24,7 +29,10 @@ app = Flask(__name__)
 def transform_to_df(file):
     return pd.read_csv(file)
 
-csv_df = transform_to_df('sampledata.csv')
+@lru_cache(maxsize=None)
+def sample_columns():
+    """Columns offered in the rule forms, read on first request instead of on import."""
+    return transform_to_df('sampledata.csv').columns
 
 
 def transformation_dict(form_data):
@@ -145,7 +153,7 @@ def transform_row_with_ai(input_row, transformation_dict):
 
             ----------------------
             TRANSFORMATION RULES:
-            {json.dumps(transformation_dict, indent=2)}
+            {serialization.dumps(transformation_dict)}
             ----------------------
 
             RULE TYPES:
@@ -158,12 +166,12 @@ def transform_row_with_ai(input_row, transformation_dict):
             2. If value is missing or not found in a mapping, leave the value as blank "".
 
             INPUT ROW:
-            {json.dumps(input_row, indent=2)}
+            {serialization.dumps(input_row)}
 
             Return only the transformed row as a valid JSON dictionary with final target column names.
         """
 
-    response = model.invoke(prompt)
+    response = get_model().invoke(prompt)
     content = response.content.strip()
     start_index = content.find('{')
     end_index = content.rfind('}') + 1
@@ -173,7 +181,7 @@ def transform_row_with_ai(input_row, transformation_dict):
         return {}
 
     try:
-        return json.loads(content[start_index:end_index])
+        return serialization.loads(content[start_index:end_index])
     except json.JSONDecodeError:
         print(f"Failed to decode AI response: {content}")
         return {}
@@ -211,18 +219,18 @@ def home():
 
 @app.route('/Tforms')
 def Tforms():
-    return render_template('Tform.html', source_cls=csv_df.columns)
+    return render_template('Tform.html', source_cls=sample_columns())
 
 
 
 @app.route('/Oforms')
 def Oforms(): 
-    return render_template('Oform.html', source_cls=csv_df.columns)
+    return render_template('Oform.html', source_cls=sample_columns())
 
 
 @app.route('/Xforms')
 def Xforms(): 
-    return render_template('Xform.html', source_cls=csv_df.columns)
+    return render_template('Xform.html', source_cls=sample_columns())
 
 
 @app.route('/processing', methods=['GET', 'POST'])
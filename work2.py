@@ -1,10 +1,13 @@
 import pandas as pd
 from flask import Flask, render_template, url_for, request
 import os
+from functools import lru_cache
 import json
 import pandas as pd
-from langchain_openai import AzureChatOpenAI
-import gradio as gr
+
+from transformation import serialization
+from transformation.datasets import DatasetStore
+from transformation.web import datasets_blueprint, session_dataset
 
 os.environ["AZURE_OPENAI_API_KEY"] = "70683718b85747ea89724db4214873e7"
 os.environ["AZURE_OPENAI_ENDPOINT"] = "https://codedocumentation.openai.azure.com/"
@@ -12,19 +15,29 @@ os.environ["AZURE_OPENAI_API_VERSION"] = "2024-02-15-preview"
 os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = "gpt-4o"
 
 
-model = AzureChatOpenAI(
-    openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-    azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
-    temperature=0.0
-)
+@lru_cache(maxsize=None)
+def get_model():
+    """Azure OpenAI client, created on first use instead of on import."""
+    from langchain_openai import AzureChatOpenAI
+    return AzureChatOpenAI(
+        openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+        temperature=0.0
+    )
 
 app = Flask(__name__)
 
 
-def transform_to_df(file):
-    return pd.read_csv(file)
+# Uploads are parsed once per distinct file and kept per session; sessions
+# without an upload fall back to the bundled sample file
+app.secret_key = os.environ.get("FLASK_SECRET_KEY") or os.urandom(24)
+dataset_store = DatasetStore()
+app.register_blueprint(datasets_blueprint(dataset_store))
+
 
-csv_df = transform_to_df('sampledata.csv')
+def current_df():
+    """Dataset of the current session (shared, don't mutate)."""
+    return session_dataset(dataset_store, 'sampledata.csv')
 
 def transformation_dict(form_data):
     for key,value in form_data.items():
@@ -82,7 +95,7 @@ def transform_row_with_ai(input_row, transformation_dict):
 
             ----------------------
             TRANSFORMATION typeS:
-            {json.dumps(transformation_dict, indent=2)}
+            {serialization.dumps(transformation_dict)}
             ----------------------
 
             type TYPES:
@@ -95,12 +108,12 @@ def transform_row_with_ai(input_row, transformation_dict):
             2. If value is missing or not found in a mapping, leave the value as blank "".
 
             INPUT ROW:
-            {json.dumps(input_row, indent=2)}
+            {serialization.dumps(input_row)}
 
             Return only the transformed row as a valid JSON dictionary with final target column names.
         """
 
-    response = model.invoke(prompt)
+    response = get_model().invoke(prompt)
     content = response.content.strip()
     start_index = content.find('{')
     end_index = content.rfind('}') + 1
@@ -110,7 +123,7 @@ def transform_row_with_ai(input_row, transformation_dict):
         return {}
 
     try:
-        return json.loads(content[start_index:end_index])
+        return serialization.loads(content[start_index:end_index])
     except json.JSONDecodeError:
         print(f"Failed to decode AI response: {content}")
         return {}
@@ -119,7 +132,7 @@ def transform_row_with_ai(input_row, transformation_dict):
 
 
 def go_to_func(transformation_dict):
-    input_df = transform_to_df('sampledata.csv')
+    input_df = current_df()
 
 
     result_rows = []
@@ -157,7 +170,7 @@ def home():
 
 @app.route('/forms')
 def forms():
-    return render_template('form.html', source_cls=csv_df.columns)
+    return render_template('form.html', source_cls=current_df().columns)
 
 
 if __name__ == "__main__":
@@ -1,33 +1,54 @@
 import pandas as pd
-from flask import Flask, render_template, url_for, request
+from flask import Flask, render_template, url_for, request, jsonify
 import os
+from functools import lru_cache
 import json
 import pandas as pd
-from langchain_openai import AzureChatOpenAI
 # import gradio as gr # Gradio is imported but not used in the Flask app part
 import numpy as np # For handling NaN
 
+from transformation import serialization
+from transformation.jobs import JobManager
+from transformation.output import CsvChunkWriter, OutputBuilder
+from transformation.datasets import DatasetStore
+from transformation.web import datasets_blueprint, jobs_blueprint, session_dataset
+
 os.environ["AZURE_OPENAI_API_KEY"] = "xxxxx" # Replace with your actual key
 os.environ["AZURE_OPENAI_ENDPOINT"] = "xx" # Replace with your actual endpoint
 os.environ["AZURE_OPENAI_API_VERSION"] = "xxx" # Replace with your actual version
 os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"] = "gpt-4o" # Replace with your deployment name
 
 
-model = AzureChatOpenAI(
-    openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-    azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
-    temperature=0.0
-)
+@lru_cache(maxsize=None)
+def get_model():
+    """Azure OpenAI client, created on first use instead of on import."""
+    from langchain_openai import AzureChatOpenAI
+    return AzureChatOpenAI(
+        openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+        azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+        temperature=0.0
+    )
 
 app = Flask(__name__)
 
+# Transformations run in the background; the request only queues them
+job_manager = JobManager(max_workers=2)
+app.register_blueprint(jobs_blueprint(job_manager))
+
+# Rows per block appended to the output file while a transformation runs
+OUTPUT_CHUNK_ROWS = 100
+
 
-def transform_to_df(file_path): # Changed 'file' to 'file_path' for clarity
-    return pd.read_csv(file_path)
+# Uploads are parsed once per distinct file and kept per session; sessions
+# without an upload fall back to the bundled sample file
+app.secret_key = os.environ.get("FLASK_SECRET_KEY") or os.urandom(24)
+dataset_store = DatasetStore()
+app.register_blueprint(datasets_blueprint(dataset_store))
 
-# Load the CSV once globally or pass it around; avoid reloading in multiple functions if it's static
-# For this example, keeping it as is, but consider optimizing if 'NAM 4.csv' doesn't change per request
-csv_df = transform_to_df('NAM 4.csv')
+
+def current_df():
+    """Dataset of the current session (shared, don't mutate)."""
+    return session_dataset(dataset_store, 'NAM 4.csv')
 
 def transformation_dict_debug(form_data): # Renamed to avoid conflict if it was for debugging
     print("\n--- Form Data Received ---")
@@ -62,8 +83,7 @@ def display_data(form_data):
     print("--- Generated Transformation Rule ---")
     print(json.dumps(result_dict, indent=2))
     print("-----------------------------------\n")
-    print('Calling go_to_func...')
-    go_to_func(result_dict, csv_df.copy()) # Pass the dataframe to avoid reloading
+    return result_dict
 
 
 def transform_row_with_ai(input_row_dict_sanitized, transformation_rules_dict):
@@ -75,7 +95,7 @@ def transform_row_with_ai(input_row_dict_sanitized, transformation_rules_dict):
         You are a data transformation engine. Your task is to process an INPUT ROW based on TRANSFORMATION RULES and return a complete JSON dictionary.
 
         TRANSFORMATION RULES:
-        {json.dumps(transformation_rules_dict, indent=2)}
+        {serialization.dumps(transformation_rules_dict)}
 
         RULE TYPES:
         - 'T' (Transform): Uses a mapping to change values from a `source_column` to a `target_column`.
@@ -97,7 +117,7 @@ def transform_row_with_ai(input_row_dict_sanitized, transformation_rules_dict):
         4.  Return only the valid JSON dictionary as your response.
 
         INPUT ROW (provided as a JSON object, where 'null' represents missing/NaN values):
-        {json.dumps(input_row_dict_sanitized, indent=2)}
+        {serialization.dumps(input_row_dict_sanitized)}
 
         Example for 'T' type if INPUT ROW is {{"id": 10, "gender_code": "M", "age": 30}} and TRANSFORMATION RULES are {{ "gender_full": {{ "type": "T", "rule_payload": {{ "source_column": "gender_code", "mapping": {{"M": "Male", "F": "Female"}} }}, "target_column": "gender_full" }} }}:
         The expected output JSON would be: {{"id": 10, "age": 30, "gender_full": "Male"}} (Original "gender_code" is removed as it's different from "gender_full" and was processed).
@@ -109,7 +129,7 @@ def transform_row_with_ai(input_row_dict_sanitized, transformation_rules_dict):
     """
 
     try:
-        response = model.invoke(prompt)
+        response = get_model().invoke(prompt)
         content = response.content.strip()
         
         # The AI response might sometimes include markdown ```json ... ```
@@ -127,7 +147,7 @@ def transform_row_with_ai(input_row_dict_sanitized, transformation_rules_dict):
             return {"error": "AI response not a valid JSON object", "raw_response": content}
 
 
-        return json.loads(content[start_index:end_index])
+        return serialization.loads(content[start_index:end_index])
     except json.JSONDecodeError as e:
         print(f"Failed to decode AI response: {content}. Error: {e}")
         return {"error": "JSONDecodeError", "raw_response": content}
@@ -136,11 +156,47 @@ def transform_row_with_ai(input_row_dict_sanitized, transformation_rules_dict):
         return {"error": str(e), "raw_response": ""}
 
 
-def go_to_func(transformation_rules_dict, input_df): # Pass df to avoid reloading
-    result_rows = []
+def output_schema(transformation_rules_dict, input_columns):
+    """
+    Output column order for rules that keep the untouched input columns.
+
+    Original columns come first, each renamed source replaced in place by its
+    target; target columns that don't replace an input column follow.
+    """
+    # Map of source_column -> target_column for columns that were renamed
+    renamed_source_to_target_map = {}
+    for target_col, rule_details in transformation_rules_dict.items():
+        source_col = rule_details.get("rule_payload", {}).get("source_column")
+        if source_col and source_col != target_col:
+            renamed_source_to_target_map[source_col] = target_col
+
+    schema = [renamed_source_to_target_map.get(col_name, col_name) for col_name in input_columns]
+    schema += list(transformation_rules_dict.keys())
+    return list(dict.fromkeys(schema))
+
+
+def go_to_func(transformation_rules_dict, input_df, job=None): # Pass df to avoid reloading
     print(f"\nStarting transformations for {len(input_df)} rows...")
+    if job is not None:
+        job.set_total(len(input_df))
+
+    # The schema is known before any row is sent, so results are written straight
+    # into their columns and nothing needs re-ordering afterwards
+    output = OutputBuilder(output_schema(transformation_rules_dict, input_df.columns), len(input_df))
 
-    for index, row in input_df.iterrows():
+    output_folder = "Output"
+    # Background jobs can overlap, so each one gets its own output file
+    output_name = f"mapped_output_file_{job.id}.csv" if job is not None else "mapped_output_file.csv"
+    output_file = os.path.join(output_folder, output_name)
+
+    # Finished blocks of rows are appended as they complete, so a download can
+    # start before the whole file has been transformed
+    writer = CsvChunkWriter(output_file, output.schema)
+    if job is not None:
+        job.output_path = output_file
+    written = 0
+
+    for position, (index, row) in enumerate(input_df.iterrows()):
         original_row_dict = row.to_dict()
         
         # Handle NaN/NA for JSON serialization, converting to None (which becomes null in JSON)
@@ -151,7 +207,11 @@ def go_to_func(transformation_rules_dict, input_df): # Pass df to avoid reloadin
         # print(f"Original row data (Python dict):\n{original_row_dict}") # For debugging internal representation
         # print(f"Input to AI (JSON compatible):\n{json.dumps(input_row_for_ai, indent=2)}") # For debugging AI input
 
+        if job is not None:
+            job.tracker.call_started()
         transformed_row_from_ai = transform_row_with_ai(input_row_for_ai, transformation_rules_dict)
+        if job is not None:
+            job.tracker.call_finished()
         
         # print(f"AI output (raw content might be logged in transform_row_with_ai on error)")
         print(f"AI output (parsed JSON):\n{json.dumps(transformed_row_from_ai, indent=2)}")
@@ -159,54 +219,32 @@ def go_to_func(transformation_rules_dict, input_df): # Pass df to avoid reloadin
         if not isinstance(transformed_row_from_ai, dict) or not transformed_row_from_ai or "error" in transformed_row_from_ai:
             print(f"Warning: AI returned invalid, empty, or error data for row {index + 1}. Original input: {input_row_for_ai}")
             print(f"AI response details: {transformed_row_from_ai.get('raw_response', 'N/A') if isinstance(transformed_row_from_ai, dict) else 'Not a dict'}")
-            # Fallback: append the original row (sanitized version) to maintain data integrity in output
-            result_rows.append(input_row_for_ai) 
-            continue
-        
-        result_rows.append(transformed_row_from_ai)
+            # Fallback: keep the original (sanitized) values to maintain data integrity in output;
+            # target columns for this row stay null
+            output.set_row(position, input_row_for_ai)
+        else:
+            output.set_row(position, transformed_row_from_ai)
 
-    if not result_rows:
-        print("No rows were processed or AI returned empty/error for all. Output will be empty.")
-        output_df = pd.DataFrame()
-    else:
-        output_df = pd.DataFrame(result_rows)
+        if job is not None:
+            job.advance()
 
-    # Sensible column ordering for the output CSV
-    if not output_df.empty:
-        final_ordered_columns = []
-        original_input_cols = list(input_df.columns) # Columns from the source CSV
-        
-        # Map of source_column -> target_column for columns that were renamed
-        renamed_source_to_target_map = {}
-        for target_col, rule_details in transformation_rules_dict.items():
-            source_col = rule_details.get("rule_payload", {}).get("source_column")
-            if source_col and source_col != target_col:
-                renamed_source_to_target_map[source_col] = target_col
-
-        # Start with original columns, replacing them with their target names if they were renamed
-        for col_name in original_input_cols:
-            if col_name in renamed_source_to_target_map: # This column was a source for a rename
-                target_name = renamed_source_to_target_map[col_name]
-                if target_name in output_df.columns and target_name not in final_ordered_columns:
-                    final_ordered_columns.append(target_name)
-            elif col_name in output_df.columns and col_name not in final_ordered_columns: # Original column, not renamed, and present in output
-                final_ordered_columns.append(col_name)
-        
-        # Add any other columns present in the output_df that weren't covered
-        # (e.g., new target columns that weren't renames of existing ones)
-        for col_name in output_df.columns:
-            if col_name not in final_ordered_columns:
-                final_ordered_columns.append(col_name)
-        
-        # Ensure all columns in the ordering list actually exist in the DataFrame
-        existing_final_columns = [col for col in final_ordered_columns if col in output_df.columns]
-        output_df = output_df[existing_final_columns]
+        if position + 1 - written >= OUTPUT_CHUNK_ROWS:
+            writer.write(output.frame_slice(written, position + 1))
+            written = position + 1
 
-    output_folder = "Output"
-    os.makedirs(output_folder, exist_ok=True)
-    output_file = os.path.join(output_folder, "mapped_output_file.csv")
-    output_df.to_csv(output_file, index=False)
+    writer.write(output.frame_slice(written, len(input_df)))
+    writer.close()
+
+    if not output.filled_count:
+        print("No rows were processed or AI returned empty/error for all. Output will be empty.")
     print(f"\nTransformation complete. Output saved to: {output_file}")
+    return output_file
+
+
+def wants_json():
+    """Whether the client asked for JSON (fetch/XHR) rather than a page (a browser form post)."""
+    return (request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+            or request.accept_mimetypes.best == 'application/json')
 
 
 @app.route('/', methods=['GET', 'POST'])
@@ -214,14 +252,25 @@ def home():
     if request.method == 'POST':
         form_data = request.form
         transformation_dict_debug(form_data) # Use the renamed debug function
-        display_data(form_data) # This will call go_to_func
-        return 'Transformation process initiated and likely completed. Check console and Output folder.'
+        rules = display_data(form_data)
+        input_df = current_df()
+        print('Queueing go_to_func...')
+        job = job_manager.submit(go_to_func, rules, input_df, name="transform", total=len(input_df))
+        queued = {
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": url_for("jobs.job_status", job_id=job.id),
+            "result_url": url_for("jobs.job_result", job_id=job.id),
+        }
+        if wants_json():
+            return jsonify(queued), 202
+        # Plain form posts get a page, with links to follow the job
+        return render_template('processing.html', **queued), 202
     return 'Flask app is running. POST to this endpoint to trigger transformation or GET /forms for the form.'
 
 @app.route('/forms')
 def forms():
-    # Ensure csv_df is available here; it's loaded globally in this script
-    return render_template('form.html', source_cls=csv_df.columns)
+    return render_template('form.html', source_cls=current_df().columns)
 
 
 if __name__ == "__main__":